@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+
+from Checkpoint import save_checkpoint, load_checkpoint
+
+# parâmetros que definem uma população aquecida; mudar o formato das entradas exige mudar VERSION
+KEY_PARAMS = ('n_agents', 'n_rules', 'burn_in_steps', 'ga_frquency', 'genetic_param', 'numeric', 'price_setting',
+              'vectorized', 'initial_price', 'initial_dividend', 'dividend_mean', 'revision_speed',
+              'dividend_error_var', 'seed', 'engine_dtype')
+VERSION = 2
+
+
+class AgentCache:
+    """
+    Cache de populações já aquecidas (agentes depois de burn_in_steps passos de aprendizado), endereçado pelo
+    conteúdo: cada entrada é um checkpoint (ver Checkpoint) gravado em directory/<sha256 dos parâmetros>.npz.
+    Simulações de uma varredura com a mesma configuração de aquecimento, inclusive em processos diferentes, usam a
+    mesma entrada.
+
+    O tamanho é limitado por número de entradas e/ou bytes; ao passar do limite as entradas usadas há mais tempo
+    são removidas (LRU pela data de modificação, atualizada a cada uso).
+    """
+
+    def __init__(self, directory='StoredAgents/cache', max_entries=32, max_bytes=None):
+        """
+        :param max_entries: número máximo de entradas; None não limita
+        :param max_bytes: tamanho máximo somado das entradas; None não limita
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(params):
+        """
+        :param params: dicionário com todas as chaves de KEY_PARAMS (outras chaves são ignoradas)
+        :return: sha256 em hexadecimal dos parâmetros
+        """
+        missing = set(KEY_PARAMS) - set(params)
+        if missing:
+            raise ValueError('Parâmetros de aquecimento ausentes: {}'.format(', '.join(sorted(missing))))
+        content = dict({k: params[k] for k in KEY_PARAMS}, version=VERSION)
+        return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, params):
+        """
+        :return: checkpoint da população (ver Checkpoint.load_checkpoint) ou None se não estiver no cache
+        """
+        filepath = self.path(self.key(params))
+        try:
+            checkpoint = load_checkpoint(filepath)
+            os.utime(filepath)
+        except FileNotFoundError:
+            return None
+        return checkpoint
+
+    def put(self, params, simulation, step):
+        """
+        Grava o estado de simulation como a entrada de params e aplica o limite de tamanho. A gravação é feita em um
+        arquivo temporário renomeado ao final, então leitores em outros processos nunca veem uma entrada incompleta.
+
+        :param simulation: objeto 'Simulation' com a população aquecida
+        :param step: último passo executado no aquecimento
+        :return: caminho da entrada
+        """
+        filepath = self.path(self.key(params))
+        temporary = '{}.{}.tmp.npz'.format(filepath[:-len('.npz')], os.getpid())
+        save_checkpoint(temporary, simulation, step)
+        os.replace(temporary, filepath)
+        self.evict(keep=filepath)
+        return filepath
+
+    def entries(self):
+        """
+        :return: lista de (caminho, bytes, data de uso) das entradas, da usada há mais tempo para a mais recente
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz') or name.endswith('.tmp.npz'):
+                continue
+            filepath = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(filepath)
+            except FileNotFoundError:
+                continue
+            entries.append((filepath, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, keep=None):
+        """
+        Remove as entradas usadas há mais tempo até respeitar max_entries e max_bytes
+
+        :param keep: entrada que não é removida (a que acabou de ser gravada)
+        :return: lista das entradas removidas
+        """
+        entries = [entry for entry in self.entries() if entry[0] != keep]
+        kept = 1 if keep is not None else 0
+        total = sum(size for _, size, _ in entries) + (os.path.getsize(keep) if keep is not None else 0)
+        removed = []
+        for filepath, size, _ in entries:
+            over_entries = self.max_entries is not None and len(entries) - len(removed) + kept > self.max_entries
+            over_bytes = self.max_bytes is not None and total > self.max_bytes
+            if not (over_entries or over_bytes):
+                break
+            try:
+                os.remove(filepath)
+            except FileNotFoundError:
+                pass
+            removed.append(filepath)
+            total -= size
+        return removed
+
+    def clear(self):
+        for filepath, _, _ in self.entries():
+            os.remove(filepath)
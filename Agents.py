@@ -1,11 +1,92 @@
-import random
 import statistics
-import math
+import time
 from decimal import Decimal
 from operator import attrgetter
 import heapq
+import weakref
 
-import pandas as pd
+import numpy as np
+
+from Market import pack_bits
+
+HISTORY_COLUMNS = ('step', 'cash', 'stocks', 'wealth', 'bits_used', 'alpha', 'beta', 'accuracy')
+
+
+def default_rng(rng):
+    """
+    :return: o próprio rng ou, se for None, um numpy.random.Generator novo
+    """
+    return np.random.default_rng() if rng is None else rng
+
+
+class Condition:
+    """
+    Condição de uma regra (máscaras care e value, ver Rule._pack) compartilhada por todas as regras com a mesma
+    condição. Guarda o resultado do último estado de mercado testado, então cada condição distinta é comparada com o
+    estado uma única vez por passo, por mais regras que a usem.
+    """
+    __slots__ = ('care', 'value', '_state', '_active', '__weakref__')
+
+    def __init__(self, care, value):
+        self.care = care
+        self.value = value
+        self._state = None
+        self._active = False
+
+    def matches(self, market_state):
+        """
+        :param market_state: inteiro de 64 bits
+        :return: BOOL
+        """
+        if market_state != self._state:
+            self._state = market_state
+            self._active = (market_state ^ self.value) & self.care == 0
+        return self._active
+
+
+class ConditionPool:
+    """
+    Conjunto das condições em uso, indexado pelas máscaras. Guarda só referências fracas: uma condição sai do conjunto
+    quando nenhuma regra a usa mais.
+    """
+
+    def __init__(self):
+        self._conditions = weakref.WeakValueDictionary()
+        self.lookups = 0
+        self.hits = 0
+
+    def __len__(self):
+        return len(self._conditions)
+
+    def intern(self, care, value):
+        """
+        :return: objeto 'Condition' com as máscaras informadas, criado só se ainda não existir
+        """
+        key = (care, value)
+        self.lookups += 1
+        condition = self._conditions.get(key)
+        if condition is None:
+            condition = Condition(care, value)
+            self._conditions[key] = condition
+        else:
+            self.hits += 1
+        return condition
+
+    def stats(self, rules=None):
+        """
+        :param rules: regras a considerar, ex. todas as regras de uma população; None só descreve o conjunto
+        :return: dict com o número de condições no conjunto, buscas e acertos de intern e, com rules, o total de regras,
+        as condições distintas entre elas e a razão condições / regras
+        """
+        stats = dict(pool_size=len(self), lookups=self.lookups, hits=self.hits)
+        if rules is not None:
+            rules = list(rules)
+            unique = len({id(rule.condition) for rule in rules})
+            stats.update(rules=len(rules), unique_conditions=unique, unique_ratio=unique / len(rules) if rules else 0.)
+        return stats
+
+
+CONDITION_POOL = ConditionPool()
 
 
 class Investor:
@@ -14,29 +95,63 @@ class Investor:
     Referência capítulo 6 de "Agent-Based Modeling The Santa Fe Institute Artificial Stock Market Model Revisited"
     """
 
-    def __init__(self, rules, stock_qty=1, cash=20000, risk_free=0.05):
+    def __init__(self, rules, stock_qty=1, cash=20000, risk_free=0.05, numeric=Decimal):
         """
         :param rules: lista de 100 objetos 'Rule', regras de decisão iniciais
+        :param numeric: tipo numérico usado nas contas (Decimal ou float)
         """
-        self.stock_qty = Decimal(stock_qty)
-        self.risk_aversion_coef = Decimal(0.5)
+        self.num = numeric
+        self.stock_qty = numeric(stock_qty)
+        self.risk_aversion_coef = numeric(0.5)
         self.trading_rules = rules
-        self.median_accuracy = Decimal(4)
-        self.cash = Decimal(cash)
-        self.risk_free = Decimal(risk_free)
-        self.investor_history = pd.DataFrame(data=None, columns={'step', 'cash', 'stocks', 'wealth', 'bits_used',
-                                                                 'alpha', 'beta', 'accuracy'})
+        self.median_accuracy = numeric(4)
+        self.cash = numeric(cash)
+        self.risk_free = numeric(risk_free)
+        self.invalidate_rule_cache()
+        self._history_rows = []
+
+    def __setstate__(self, state):
+        # agentes salvos antes do modo numérico usam sempre Decimal
+        state.setdefault('num', Decimal)
+        # agentes antigos guardam o histórico em um DataFrame
+        history = state.pop('investor_history', None)
+        if '_history_rows' not in state:
+            state['_history_rows'] = [] if history is None or len(history) == 0 else [
+                tuple(row.get(k) for k in HISTORY_COLUMNS) for row in history.to_dict('records')]
+        self.__dict__.update(state)
+        self.invalidate_rule_cache()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ('_cache_state', '_active_rules', '_selected_rule', '_conditions', '_fitness', '_stale_fitness'):
+            state.pop(key, None)
+        return state
+
+    def set_numeric(self, numeric):
+        """
+        Converte carteira e regras para o tipo numérico informado (Decimal ou float)
+        """
+        self.num = numeric
+        self.stock_qty = numeric(self.stock_qty)
+        self.risk_aversion_coef = numeric(self.risk_aversion_coef)
+        self.median_accuracy = numeric(self.median_accuracy)
+        self.cash = numeric(self.cash)
+        self.risk_free = numeric(self.risk_free)
+        for rule in self.trading_rules:
+            rule.set_numeric(numeric)
+        self.invalidate_rule_cache()
 
     def stock_demand(self, current_price, market_state, dividend):
         rule = self.select_rule(market_state)
-        if (self.risk_aversion_coef * Decimal(rule.accuracy)) != 0:
-            opt_qty = (rule.forecast(Decimal(current_price) + Decimal(dividend)) - Decimal(current_price) * (
+        current_price = self.num(current_price)
+        if (self.risk_aversion_coef * rule.accuracy) != 0:
+            opt_qty = (rule.forecast(current_price + self.num(dividend)) - current_price * (
                     1 + self.risk_free)) / (
-                              self.risk_aversion_coef * Decimal(rule.accuracy))
+                              self.risk_aversion_coef * rule.accuracy)
         else:
             opt_qty = 1
-        if opt_qty * Decimal(current_price) > self.cash:
-            opt_qty = self.cash / Decimal(current_price) + self.stock_qty
+        if opt_qty * current_price > self.cash:
+            opt_qty = self.cash / current_price + self.stock_qty
         if opt_qty <= -self.stock_qty:
             opt_qty = 0
 
@@ -58,7 +173,7 @@ class Investor:
         """
         rule = self.select_rule(market_state)
         a = rule.get_coefs()[0]
-        demand_derivative = (a - 1 - self.risk_free) / (self.risk_aversion_coef * Decimal(rule.accuracy))
+        demand_derivative = (a - 1 - self.risk_free) / (self.risk_aversion_coef * rule.accuracy)
         return demand_derivative
 
     def sort_rules_by_fitness(self):
@@ -67,6 +182,75 @@ class Investor:
         Resultado self.trading_rules com regras da melhor para a pior
         """
         self.trading_rules = sorted(self.trading_rules, key=lambda rule: rule.fitness)
+        self.invalidate_rule_cache()
+
+    def rule_fitness(self):
+        """
+        Fitness de cada regra em um array guardado entre as chamadas. As regras com accuracy atualizada ou trocadas
+        desde a última chamada só são marcadas, e o fitness delas é recalculado aqui: só é usado na ordenação do
+        algoritmo genético, então os agentes que não rodam o algoritmo no passo não calculam fitness
+
+        :return: array com o fitness de self.trading_rules, que não deve ser alterado
+        """
+        if self._fitness is None:
+            self._fitness = np.array([float(rule.fitness) for rule in self.trading_rules])
+        else:
+            for n in self._stale_fitness:
+                self._fitness[n] = float(self.trading_rules[n].fitness)
+        self._stale_fitness = set()
+        return self._fitness
+
+    def _mark_fitness(self, indices):
+        """
+        Marca o fitness das regras indices para ser recalculado na próxima chamada de rule_fitness
+        """
+        if self._fitness is not None:
+            self._stale_fitness.update(indices)
+
+    def rank_rules(self, start, stop):
+        """
+        Regras cuja posição na ordenação crescente por fitness está entre start e stop, por seleção parcial
+        (np.argpartition) em vez de ordenar todas as regras
+
+        :return: índices das regras em self.trading_rules, sem ordem entre si
+        """
+        return np.argpartition(self.rule_fitness(), [start, stop - 1])[start:stop]
+
+    def invalidate_rule_cache(self, changed=None):
+        """
+        Descarta as regras ativas e a regra escolhida guardadas para o estado de mercado atual. Deve ser chamado sempre
+        que as regras forem trocadas, reordenadas ou tiverem a condição alterada
+
+        :param changed: índices das regras trocadas, cujo fitness é recalculado na próxima ordenação; None descarta o
+        fitness de todas as regras
+        """
+        self._cache_state = None
+        self._active_rules = None
+        self._selected_rule = None
+        self._conditions = None
+        if changed is None:
+            self._fitness = None
+            self._stale_fitness = set()
+        else:
+            self._mark_fitness(changed)
+
+    def active_rules(self, market_state):
+        """
+        Regras ativas no estado de mercado, calculadas uma vez por estado e reaproveitadas por todas as chamadas do
+        mesmo passo (tentativas do especialista, derivada da demanda e atualização da accuracy)
+
+        :param market_state: inteiro de 64 bits ou lista de 64 elementos BOOL
+        :return: índices das regras ativas em self.trading_rules
+        """
+        if not isinstance(market_state, int):
+            market_state = pack_bits(market_state)
+        if market_state != self._cache_state:
+            if self._conditions is None:
+                self._conditions = [rule.condition for rule in self.trading_rules]
+            self._cache_state = market_state
+            self._active_rules = [n for n, c in enumerate(self._conditions) if (market_state ^ c.value) & c.care == 0]
+            self._selected_rule = None
+        return self._active_rules
 
     def select_rule(self, market_state):
         """
@@ -74,32 +258,52 @@ class Investor:
 
         :return: regra escolhida
         """
+        active_rules = self.active_rules(market_state)
+        if self._selected_rule is not None:
+            return self._selected_rule
         done = False
-        max_index = len(self.trading_rules)
-        index = 0
-        active_rules =[]
-        while index < max_index and done is False:
-            if self.trading_rules[index].is_active(market_state):
-                active_rules.append(self.trading_rules[index])
-                #rule = self.trading_rules[index]
-                #done = True
-            index += 1
         try:
-            rule = max(active_rules, key=lambda x: x.accuracy)
+            rule = max([self.trading_rules[n] for n in active_rules], key=lambda x: x.accuracy)
             done = True
         except ValueError:
             pass
         if done is False:
-            rule = Rule([2 for _ in range(64)])
-            weigths = [Decimal(1 / r.accuracy) for r in self.trading_rules]
-            a = sum([weigths[i] * Decimal(self.trading_rules[i]._alpha) for i in range(len(weigths))]) / Decimal(
-                sum(weigths))
-            b = sum([weigths[i] * Decimal(self.trading_rules[i]._beta) for i in range(len(weigths))]) / Decimal(
-                sum(weigths))
+            rule = Rule([2 for _ in range(64)], numeric=self.num)
+            weigths = [1 / r.accuracy for r in self.trading_rules]
+            a = sum([weigths[i] * self.trading_rules[i]._alpha for i in range(len(weigths))]) / sum(weigths)
+            b = sum([weigths[i] * self.trading_rules[i]._beta for i in range(len(weigths))]) / sum(weigths)
             rule.set_coefs(a, b)
 
+        self._selected_rule = rule
         return rule
 
+    def update_rules_accuracy(self, market_state, pt, pt_1, dt, dt_1, teta):
+        """
+        Atualiza a accuracy das regras ativas no estado de mercado (ver Rule.update_fitness_accuracy)
+        """
+        active_rules = self.active_rules(market_state)
+        for n in active_rules:
+            self.trading_rules[n].update_fitness_accuracy(pt, pt_1, dt, dt_1, teta)
+        self._mark_fitness(active_rules)
+        # a regra escolhida depende da accuracy
+        self._selected_rule = None
+
+    def replace_rules(self, indices, rules):
+        """
+        Troca as regras nas posições indices pelas novas regras (usado pelo algoritmo genético do PopulationEngine)
+        """
+        for n, rule in zip(indices, rules):
+            self.trading_rules[n] = rule
+        self.invalidate_rule_cache(indices)
+
+    def set_rule_accuracy(self, index, accuracy):
+        """
+        Define a accuracy da regra index (usado pela atualização em lote do PopulationEngine)
+        """
+        self.trading_rules[index].accuracy = self.num(accuracy)
+        self._mark_fitness((index,))
+        self._selected_rule = None
+
     def update_median_accuracy(self):
         """
         Atualiza a mediana da precisão desse agente
@@ -109,61 +313,81 @@ class Investor:
 
     def update_portifolio(self, qnty, price,dividend):
         #self.cash += Decimal(dividend) * self.stock_qty
-        self.stock_qty += Decimal(qnty)
-        self.cash -= Decimal(qnty) * Decimal(price)
+        qnty = self.num(qnty)
+        self.stock_qty += qnty
+        self.cash -= qnty * self.num(price)
 
-    def genetic_algo(self, genetic_param):
+    def genetic_algo(self, genetic_param, mutation_rng=None, crossover_rng=None, index_list=None):
         """
-        Roda o algoritmo genético para este indivíduo. Deve ser rodado depois de sort_rules
+        Roda o algoritmo genético para este indivíduo. Substitui as regras nas posições 44 a 63 da ordenação por
+        fitness, encontradas por seleção parcial sem reordenar self.trading_rules
 
+        :param mutation_rng: numpy.random.Generator da escolha entre mutação e cruzamento e da mutação
+        :param crossover_rng: numpy.random.Generator do cruzamento
+        :param index_list: regras a substituir, se já calculadas com rank_rules(44, 64)
         Resultado: Nova rule_set
         """
-        index_list = [i for i in range(44, 64)]
+        mutation_rng = default_rng(mutation_rng)
+        crossover_rng = default_rng(crossover_rng)
+        if index_list is None:
+            index_list = self.rank_rules(44, 64)
+        index_list = np.asarray(index_list).tolist()
         #rule_list = heapq.nsmallest(20, self.trading_rules, key=lambda x: -x.accuracy)
-        for i in index_list:
-            rand = random.uniform(0, 1)
-            if rand < genetic_param:
-                self.trading_rules[i].mutate_rule(accuracy=self.median_accuracy)
+        rands = mutation_rng.random(len(index_list))
+        parents = crossover_rng.integers(0, len(self.trading_rules), (len(index_list), 2)).tolist()
+        for n, i in enumerate(index_list):
+            if rands[n] < genetic_param:
+                self.trading_rules[i].mutate_rule(accuracy=self.median_accuracy, rng=mutation_rng)
             else:
-                rule1, rule2 = random.choice(self.trading_rules), random.choice(self.trading_rules)
-                self.trading_rules[i] = self.crossover(rule1, rule2)
+                rule1, rule2 = self.trading_rules[parents[n][0]], self.trading_rules[parents[n][1]]
+                self.trading_rules[i] = self.crossover(rule1, rule2, crossover_rng)
+        self.invalidate_rule_cache(index_list)
 
     def write_to_df(self, step, cash, stocks, wealth, bits_used,alpha, beta, accuracy):
-        df = dict(step=step, cash=cash, stocks=stocks, wealth=wealth, bits_used=bits_used,
-                  alpha=alpha, beta=beta, accuracy=accuracy)
-        # df = pd.DataFrame(df)
-        self.investor_history = self.investor_history.append(df, ignore_index=True)
+        """
+        Guarda uma linha do histórico do agente; o DataFrame só é montado quando investor_history é lido. Para
+        registrar todos os agentes a cada passo use Telemetry.TelemetryRecorder
+        """
+        self._history_rows.append((step, cash, stocks, wealth, bits_used, alpha, beta, accuracy))
+
+    @property
+    def investor_history(self):
+        """
+        :return: pandas.DataFrame com as linhas gravadas por write_to_df
+        """
+        import pandas as pd
+        return pd.DataFrame(self._history_rows, columns=list(HISTORY_COLUMNS))
 
     @staticmethod
-    def crossover(rule1, rule2):
+    def crossover(rule1, rule2, rng=None):
         """
-        Geração "genética" de regras a partir de 2 outras regras
+        Geração "genética" de regras a partir de 2 outras regras. Cada bit da condição vem de uma das duas regras,
+        sorteada com uma máscara aleatória de 64 bits
 
         :param rule1: Regra antiga
         :param rule2: regra antiga 2
+        :param rng: numpy.random.Generator
         :return: Nova regra
         """
-        nova_watchlist = [2 for _ in range(64)]
-        for i in range(64):
-            if rule1.watch_list[i] == rule2.watch_list[i]:
-                nova_watchlist[i] = rule1.watch_list[i]
-            else:
-                nova_watchlist[i] = random.choice([rule1.watch_list[i], rule2.watch_list[i]])
-        rand = random.choice([0, 1, 2])
+        rng = default_rng(rng)
+        take_first = int(rng.integers(0, 2 ** 64, dtype=np.uint64))
+        care = (rule1.care_mask & take_first) | (rule2.care_mask & ~take_first)
+        value = (rule1.value_mask & take_first) | (rule2.value_mask & ~take_first)
+        rand, first, first_a, first_b = rng.integers(0, 3), rng.random() < .5, rng.random() < .5, rng.random() < .5
         if rand == 1:
-            r_rand = random.choice([rule1, rule2])
+            r_rand = rule1 if first else rule2
             a, b = r_rand.get_coefs()
         elif rand == 2:
             a1, b1 = rule1.get_coefs()
             a2, b2 = rule2.get_coefs()
-            a = random.choice([a1, a2])
-            b = random.choice([b1, b2])
+            a = a1 if first_a else a2
+            b = b1 if first_b else b2
         else:
             a1, b1 = rule1.get_coefs()
             a2, b2 = rule2.get_coefs()
             a = (a1 / rule1.accuracy + a2 / rule2.accuracy) / (1 / rule1.accuracy + 1 / rule2.accuracy)
             b = (b1 / rule1.accuracy + b2 / rule2.accuracy) / (1 / rule1.accuracy + 1 / rule2.accuracy)
-        nova_regra = Rule(nova_watchlist, a, b)
+        nova_regra = Rule.from_masks(care, value, a, b, numeric=rule1.num)
         nova_regra.accuracy = (rule1.accuracy + rule2.accuracy) / 2
         return nova_regra
 
@@ -173,62 +397,157 @@ class Rule:
     Regra de decisão baseada na estrutura de informações sobre o mercado
     """
 
-    def __init__(self, watch_list, alpha=0, beta=0):
+    def __init__(self, watch_list, alpha=0, beta=0, numeric=Decimal):
         """
         :param watch_list: lista de 64 posições com: 0,se esperar a posição ser 0, 1 se esperar 1 e 2 se for indiferente
+        :param numeric: tipo numérico dos coeficientes e da accuracy (Decimal ou float)
         """
-        self._alpha = alpha
-        self._beta = beta
-        self._maxError = 10
+        self._init_fields(alpha, beta, numeric)
         self.watch_list = watch_list
-        self.specificity = 64 - watch_list.count(2)
-        self.accuracy = 4
-        self.bit_cost = 0.005
-        self.unused_steps = 0
+        self.specificity = 64 - self.watch_list.count(2)
         #self.fitness = 100 - (self.accuracy[-1] + self.bit_cost * self.specificity)
 
+    def _init_fields(self, alpha, beta, numeric):
+        """
+        Atributos comuns a __init__ e from_masks, exceto a condição
+        """
+        self.num = numeric
+        self._alpha = numeric(alpha)
+        self._beta = numeric(beta)
+        self._maxError = 10
+        self.accuracy = numeric(4)
+        self.bit_cost = numeric(0.005)
+        self.unused_steps = 0
+
+    @classmethod
+    def from_masks(cls, care_mask, value_mask, alpha=0, beta=0, numeric=Decimal):
+        """
+        Cria a regra direto da representação compacta; a watch_list só é montada se for usada
+
+        :param care_mask: bits das posições que não são indiferentes
+        :param value_mask: bits das posições que esperam 1
+        """
+        # sem passar por __init__, que montaria e internaria uma condição vazia antes desta
+        rule = cls.__new__(cls)
+        rule._init_fields(alpha, beta, numeric)
+        rule._watch_list = None
+        care_mask = int(care_mask)
+        rule.condition = CONDITION_POOL.intern(care_mask, int(value_mask) & care_mask)
+        rule.specificity = bin(care_mask).count('1')
+        return rule
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        condition = state.pop('condition')
+        state['care_mask'], state['value_mask'] = condition.care, condition.value
+        return state
+
+    def __setstate__(self, state):
+        # objetos salvos antes das máscaras só possuem a watch_list
+        if 'watch_list' in state:
+            state['_watch_list'] = tuple(state.pop('watch_list'))
+        # versões antigas guardavam a lista de accuracies de cada passo
+        if type(state.get('accuracy')) is list and state['accuracy'][-1] is not None:
+            state['accuracy'] = state['accuracy'][-1]
+        care_mask, value_mask = state.pop('care_mask', None), state.pop('value_mask', None)
+        self.__dict__.update(state)
+        if self._watch_list is not None:
+            self._pack()
+        else:
+            self.condition = CONDITION_POOL.intern(care_mask, value_mask)
+        if 'num' not in state:
+            # regras salvas antes do modo numérico misturam float e Decimal
+            self.set_numeric(Decimal)
+
+    def set_numeric(self, numeric):
+        """
+        Converte coeficientes, accuracy e custo do bit para o tipo numérico informado (Decimal ou float)
+        """
+        self.num = numeric
+        self._alpha = numeric(self._alpha)
+        self._beta = numeric(self._beta)
+        self.accuracy = numeric(self.accuracy)
+        self.bit_cost = numeric(self.bit_cost)
+
+    @property
+    def watch_list(self):
+        """
+        :return: tupla com as 64 posições da condição; para mudar a condição atribua uma nova watch_list, o que
+        atualiza as máscaras
+        """
+        if self._watch_list is None:
+            self._watch_list = tuple((self.value_mask >> n) & 1 if (self.care_mask >> n) & 1 else 2
+                                     for n in range(64))
+        return self._watch_list
+
+    @watch_list.setter
+    def watch_list(self, watch_list):
+        self._watch_list = tuple(watch_list)
+        self._pack()
+
+    def _pack(self):
+        """
+        Atualiza a representação compacta da watch_list: care_mask tem o bit n ligado se a posição n não for
+        indiferente (2) e value_mask tem o bit n ligado se a posição n esperar 1. As máscaras ficam em um objeto
+        'Condition' de CONDITION_POOL, compartilhado com as outras regras de mesma condição
+        """
+        self.condition = CONDITION_POOL.intern(pack_bits(i != 2 for i in self._watch_list),
+                                               pack_bits(i == 1 for i in self._watch_list))
+
+    @property
+    def care_mask(self):
+        return self.condition.care
+
+    @property
+    def value_mask(self):
+        return self.condition.value
+
     @property
     def fitness(self):
-        return 100 - (Decimal(self.accuracy) + Decimal(self.bit_cost) * self.specificity)
+        return 100 - (self.accuracy + self.bit_cost * self.specificity)
 
     def get_coefs(self):
-        return Decimal(self._alpha), Decimal(self._beta)
+        return self._alpha, self._beta
 
-    def get_new_coeficients(self):
-        a = random.uniform(0.7, 1.2)
-        b = random.uniform(-10, 19)
-        self._alpha = Decimal(a)
-        self._beta = Decimal(b)
+    def get_new_coeficients(self, rng=None):
+        rng = default_rng(rng)
+        a = rng.uniform(0.7, 1.2)
+        b = rng.uniform(-10, 19)
+        self._alpha = self.num(a)
+        self._beta = self.num(b)
 
-    def mutate_rule(self, reproduce=False,accuracy=4):
-        self.accuracy = accuracy
-        if not reproduce:
-            random.seed(0)
-        rand = random.uniform(0, 1)
+    def mutate_rule(self, accuracy=4, rng=None):
+        """
+        Muda os coeficientes (20% de chance de sortear novos, 20% de variar até 5%) e troca cada bit da condição com
+        3% de chance: 0 e 1 viram o oposto com probabilidade 1/3, senão viram 2; 2 vira 0, 1 ou 2
+
+        :param accuracy: nova accuracy da regra
+        :param rng: numpy.random.Generator
+        """
+        rng = default_rng(rng)
+        self.accuracy = self.num(accuracy)
+        rand = rng.random()
         if rand <= 0.2:
-            self.get_new_coeficients()
+            self.get_new_coeficients(rng)
         elif rand <= 0.4:
-            self._alpha = Decimal(random.uniform(self._alpha * 0.95, self._alpha * 1.05))
-            self._beta = Decimal(random.uniform(self._beta * 0.95, self._beta * 1.05))
+            alpha, beta = float(self._alpha), float(self._beta)
+            self._alpha = self.num(alpha * rng.uniform(0.95, 1.05))
+            self._beta = self.num(beta * rng.uniform(0.95, 1.05))
         else:
             pass
-        for i in self.watch_list:
-            rand2 = random.uniform(0, 1)
-            if rand2 <= 0.03:
-                if self.watch_list[i] == 0:
-                    rand3 = random.uniform(0, 1)
-                    if rand3 <= 1 / 3:
-                        self.watch_list[i] = 1
-                    else:
-                        self.watch_list[i] = 2
-                elif self.watch_list[i] == 1:
-                    rand3 = random.uniform(0, 1)
-                    if rand3 <= 1 / 3:
-                        self.watch_list[i] = 0
-                    else:
-                        self.watch_list[i] = 2
+        flips = np.flatnonzero(rng.random(64) <= 0.03).tolist()
+        if flips:
+            choices = rng.integers(0, 3, len(flips)).tolist()
+            watch_list = list(self.watch_list)
+            for i, choice in zip(flips, choices):
+                if watch_list[i] == 2:
+                    watch_list[i] = choice
+                elif choice == 0:
+                    watch_list[i] = 1 - watch_list[i]
                 else:
-                    self.watch_list[i] = random.choice([0, 1, 2])
+                    watch_list[i] = 2
+            self.watch_list = watch_list
+            self.specificity = 64 - watch_list.count(2)
 
     def generalize_rule(self):
         """
@@ -238,22 +557,22 @@ class Rule:
         pass
 
     def forecast(self, p_d):
-        return Decimal(self._alpha) * Decimal(p_d) + Decimal(self._beta)
+        """
+        :param p_d: soma de preço e dividendo, já no tipo numérico da regra
+        """
+        return self._alpha * p_d + self._beta
 
     def is_active(self, market_state):
         """
         verifica se a regra está ativa
 
-        :param market_state: Binary 64 list representando as 64 informações
+        :param market_state: inteiro de 64 bits (MarketInfo.state_word) ou Binary 64 list representando as 64
+        informações
         :return: boolean
         """
-        response = True
-        for n, i in enumerate(market_state):
-            if self.watch_list[n] == i:
-                pass
-            elif self.watch_list[n] != 2:
-                response *= False
-        return response
+        if not isinstance(market_state, int):
+            market_state = pack_bits(market_state)
+        return self.condition.matches(market_state)
 
     def update_fitness_accuracy(self, pt, pt_1, dt, dt_1, teta, bit_cost=0.005):
         """
@@ -266,70 +585,90 @@ class Rule:
         :param teta: velocidade da aprendizagem (parâmetro do modelo)
         :param bit_cost: parâmetro do custo de observar alguma informação
         """
-        error = (Decimal(pt) + Decimal(dt) - self.forecast(Decimal(pt_1) + Decimal(dt_1))) ** 2
+        num = self.num
+        error = (num(pt) + num(dt) - self.forecast(num(pt_1) + num(dt_1))) ** 2
         if error > 100:
-            error = Decimal(100)
-        accuracy = (1 - Decimal(teta ** -1)) * Decimal(self.accuracy) + Decimal(teta ** -1) * error
+            error = num(100)
+        accuracy = (1 - num(teta ** -1)) * self.accuracy + num(teta ** -1) * error
         # fitness = 100 - (Decimal(accuracy) + Decimal(bit_cost) * self.specificity)
         self.accuracy = accuracy
 
     def set_coefs(self, a, b):
-        self._alpha = a
-        self._beta = b
+        self._alpha = self.num(a)
+        self._beta = self.num(b)
 
 
 class Specialist:
 
-    def __init__(self, max_trials, max_price, min_price, num_shares, min_excess, eta):
+    def __init__(self, max_trials, max_price, min_price, num_shares, min_excess, eta, numeric=Decimal, rng=None):
+        """
+        :param rng: numpy.random.Generator usado para distribuir o excesso de demanda entre os agentes
+        """
+        self.num = numeric
+        self.rng = default_rng(rng)
         self.max_trials = max_trials
-        self.max_price = max_price
-        self.min_price = min_price
-        self.num_shares = num_shares
+        self.max_price = numeric(max_price)
+        self.min_price = numeric(min_price)
+        self.num_shares = numeric(num_shares)
         self.min_excess = min_excess
-        self.eta = Decimal(eta)
+        self.eta = numeric(eta)
+        self.stats = {}
+        self.last_trials = 0
+
+    def _record(self, method, start, is_rationed, trials=1):
+        stats = self.stats.setdefault(method, dict(steps=0, rationed=0, time=0., trials=0))
+        stats['steps'] += 1
+        stats['rationed'] += bool(is_rationed)
+        stats['time'] += time.perf_counter() - start
+        stats['trials'] += trials
+        self.last_trials = trials
+
+    def report(self):
+        """
+        Resumo de cada método de formação de preço usado: número de passos, fração de passos com racionamento e tempo
+        médio por passo em milissegundos
+
+        :return: dict método -> dict(steps, rationed_rate, ms_per_step, trials_per_step)
+        """
+        return {method: dict(steps=s['steps'], rationed_rate=s['rationed'] / s['steps'],
+                             ms_per_step=1000 * s['time'] / s['steps'], trials_per_step=s['trials'] / s['steps'])
+                for method, s in self.stats.items()}
 
-    def calculate_demands(self, last_price, last_dividend, investors, market_state, zero_excess=False):
+    def calculate_demands(self, last_price, last_dividend, investors, market_state, zero_excess=False, engine=None):
         """
         Método que tenta achar o preço que ajusta oferta e demanda. Deve ser chamado um número N de vezes
 
         :param zero_excess:
         :param market_state:
         :param last_dividend: último dividendo para ser usado na previsão dos preços
-        :param investors: lista dos agente
+        :param investors: lista dos agente (não usada com engine)
         :param last_price: preço de período anterior
+        :param engine: PopulationEngine já carregado com os agentes; se informado as demandas são calculadas de forma
+        vetorizada
         :return: demandas finais e BOOL de racionamento
         """
-
+        start = time.perf_counter()
         done = False
         trial_count = 0
-        trialprice = Decimal(last_price)
+        num = self.num
+        trialprice = num(last_price)
         investor_demands = []
-        num_agents = len(investors)
         slope_total = 0
         is_rationed = False
+        if engine is not None:
+            # o estado do mercado não muda entre as tentativas, então a regra escolhida também não
+            selection = engine.select(market_state)
+            engine_slope = num(float(engine.demand_derivatives(selection).sum()))
 
-        """def normalize_demands(demands, p_trial):
-            for idx in range(num_agents):
-                # restringe oferta à quantidade que o agente possui
-                if demands[idx] < -investors[idx].stock_qty:
-                    demands[idx] = -investors[idx].stock_qty
-                # restringe demanda ao dinheiro que o agente possui
-                elif demands[idx] * p_trial > investors[idx].cash:
-                    demands[idx] = math.floor(investors[idx].cash / p_trial)
-
-            normalization_numer = abs(sum([x for x in demands if x < 0]))
-            normalization_denom = sum([x for x in demands if x > 0])
-            for idx in range(len(demands)):
-                if demands[idx] > 0:
-                    demands[idx] = demands[idx] * normalization_numer / normalization_denom
-            return demands
-        """
         # ---------- início do processo -----------------------------------------------------------------
 
         while trial_count <= self.max_trials - 1 and not done:
-            for i in investors:
-                investor_demands.append(i.stock_demand(trialprice, market_state, last_dividend))
-            # investor_demands = [i.stock_demand(trialprice + last_dividend)) for i in investors]
+            if engine is None:
+                for i in investors:
+                    investor_demands.append(i.stock_demand(trialprice, market_state, last_dividend))
+            else:
+                investor_demands = [num(x) for x in
+                                    engine.demands(float(trialprice), float(last_dividend), selection).tolist()]
             if abs(sum(investor_demands)) <= self.min_excess:
                 done = True
             if slope_total != 0 and not done:
@@ -337,12 +676,15 @@ class Specialist:
             else:
                 trialprice *= 1 + self.eta * sum(investor_demands)
 
-            slope_total = sum([investors[i].demand_derivative(market_state) for i in range(num_agents)])
+            if engine is None:
+                slope_total = sum([investor.demand_derivative(market_state) for investor in investors])
+            else:
+                slope_total = engine_slope
             unrestricted_price = trialprice
             if trialprice > self.max_price:
-                trialprice = Decimal(self.max_price)
+                trialprice = self.max_price
             if trialprice < self.min_price:
-                trialprice = Decimal(self.min_price)
+                trialprice = self.min_price
 
             trial_count += 1
             if trial_count < self.max_trials and done is False:
@@ -350,51 +692,32 @@ class Specialist:
         if trial_count == self.max_trials and done is False:
             is_rationed = True
 
-        if not is_rationed:#abs(sum(investor_demands)) < self.min_excess:
-            normalized_demands = investor_demands
-        else:
-            offers = abs(sum([i for i in investor_demands if i < 0]))
-            sum_bids = sum([i for i in investor_demands if i > 0])
-            if sum_bids > 0:
-                weights = [max(i / sum_bids, 0) for i in investor_demands]
-            else:
-                weights = [0 for i in investor_demands]
-            normalized_demands = []
-            for i in range(len(investor_demands)):
-                if investor_demands[i] <= 0:
-                    normalized_demands.append(investor_demands[i])
-                else:
-                    normalized_demands.append(weights[i] * offers)
-        if zero_excess:
-            normalized_demands = list(map(lambda x: x.quantize(Decimal("1.00")), normalized_demands))
-            excess = sum(normalized_demands)
-            if excess > Decimal(0):
-                count = int(excess.quantize(Decimal('1.00')) * 100)
-                for i in range(count):
-                    ind = random.choice(range(len(normalized_demands)))
-                    normalized_demands[ind] -= Decimal(0.01)
-            elif excess < 0:
-                count = int(-excess.quantize(Decimal('1.00')) * 100)
-                for i in range(count):
-                    ind = random.choice(range(len(normalized_demands)))
-                    normalized_demands[ind] += Decimal(0.01)
+        normalized_demands = self.normalize_demands(investor_demands, is_rationed, zero_excess)
+        self._record('auction', start, is_rationed, trial_count)
         return trialprice, normalized_demands, is_rationed, unrestricted_price
 
-    def find_price(self, dividend, investors, market_state, zero_excess=False):
-        num = []
-        den = []
+    def find_price(self, dividend, investors, market_state, zero_excess=False, engine=None):
+        start = time.perf_counter()
         is_rationed = False
-        for investor in investors:
-            best_rule = investor.select_rule(market_state)
-            a, b = best_rule.get_coefs()
-            try:
-                sigma = best_rule.accuracy
-            except TypeError:
+        if engine is None:
+            dividend = self.num(dividend)
+            num = []
+            den = []
+            for investor in investors:
+                best_rule = investor.select_rule(market_state)
+                a, b = best_rule.get_coefs()
                 sigma = best_rule.accuracy
-            num.append(Decimal(Decimal(b + a * Decimal(dividend)) / Decimal(sigma)))
-            den.append((Decimal(a) - Decimal(1) - investor.risk_free) / sigma)
-        price = (investors[0].risk_aversion_coef * self.num_shares - sum(num)) / sum(den)
-        demands = [i.stock_demand(price, market_state, dividend) for i in investors]
+                num.append((b + a * dividend) / sigma)
+                den.append((a - 1 - investor.risk_free) / sigma)
+            price = (investors[0].risk_aversion_coef * self.num_shares - sum(num)) / sum(den)
+            demands = [i.stock_demand(price, market_state, dividend) for i in investors]
+        else:
+            selection = engine.select(market_state)
+            _, _, a, b, sigma = selection
+            num = (b + a * float(dividend)) / sigma
+            den = (a - 1 - engine.risk_free) / sigma
+            price = self.num(float((engine.risk_aversion[0] * float(self.num_shares) - num.sum()) / den.sum()))
+            demands = [self.num(x) for x in engine.demands(float(price), float(dividend), selection).tolist()]
         unrestricted_price = price
         if price <= self.min_price:
             is_rationed = True
@@ -402,7 +725,142 @@ class Specialist:
         elif price >= self.max_price:
             is_rationed = True
             price = self.max_price
-        if not is_rationed:#sum(demands) < self.min_excess:
+        normalized_demands = self.normalize_demands(demands, is_rationed, zero_excess)
+        self._record('clearing', start, is_rationed)
+        return price, normalized_demands, is_rationed, unrestricted_price
+
+    @staticmethod
+    def _demand_pieces(p, c0, c1, cash, stock_qty):
+        """
+        Trecho da função de demanda de cada agente no preço p, escrito como A + B * p + C / p
+
+        :param c0: termo constante da demanda ótima sem restrições
+        :param c1: inclinação da demanda ótima sem restrições
+        :return: arrays A, B e C
+        """
+        opt_qty = c0 + c1 * p
+        cash_bound = opt_qty * p > cash
+        opt_qty = np.where(cash_bound, cash / p + stock_qty, opt_qty)
+        short_bound = opt_qty <= -stock_qty
+        a = np.where(short_bound, -stock_qty, np.where(cash_bound, 0., c0 - stock_qty))
+        b = np.where(short_bound | cash_bound, 0., c1)
+        c = np.where(short_bound | ~cash_bound, 0., cash)
+        return a, b, c
+
+    def exact_price(self, last_price, dividend, investors, market_state, zero_excess=False, engine=None):
+        """
+        Acha o preço que zera o excesso de demanda respeitando as restrições de caixa e de venda a descoberto de
+        Investor.stock_demand. Entre os pontos em que alguma restrição começa a valer, a demanda de cada agente tem a
+        forma A + B * p + C / p; os pontos de todos os agentes são ordenados e o excesso agregado é resolvido
+        exatamente em cada intervalo, em O(n log n). Havendo mais de uma raiz, fica a mais próxima do último preço.
+
+        Como a demanda de um agente salta nos pontos de quebra, o excesso pode trocar de sinal em um salto sem ter
+        raiz contínua; nesse caso o preço é o ponto de quebra com troca de sinal mais próximo do último preço e o
+        excesso que sobra é racionado. Se o excesso não trocar de sinal entre min_price e max_price (ex. demandas
+        crescentes no preço, com alpha > 1 + risk_free), o preço é o de menor excesso em módulo no intervalo, também
+        com racionamento.
+
+        :return: preço, demandas, BOOL de racionamento e preço de equilíbrio sem as restrições de caixa e de venda
+        """
+        start = time.perf_counter()
+        lo, hi, d = float(self.min_price), float(self.max_price), float(dividend)
+        if engine is None:
+            coefs = []
+            for inv in investors:
+                rule = inv.select_rule(market_state)
+                coefs.append([rule._alpha, rule._beta, rule.accuracy, inv.cash, inv.stock_qty, inv.risk_free,
+                              inv.risk_aversion_coef])
+            a, b, sigma, cash, stock_qty, risk_free, risk_aversion = np.array(coefs, dtype=float).T
+        else:
+            selection = engine.select(market_state)
+            _, _, a, b, sigma = selection
+            cash, stock_qty, risk_free, risk_aversion = engine.cash, engine.stock_qty, engine.risk_free, \
+                engine.risk_aversion
+        denominator = risk_aversion * sigma
+        safe = np.where(denominator != 0, denominator, 1.)
+        c0 = np.where(denominator != 0, (a * d + b) / safe, 1.)
+        c1 = np.where(denominator != 0, (a - 1 - risk_free) / safe, 0.)
+
+        # pontos de quebra de cada agente: início da restrição de caixa (c1 p^2 + c0 p = cash), início da restrição
+        # de venda (c0 + c1 p = -stock_qty) e, com caixa negativo, cash / p + stock_qty = -stock_qty
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            root = np.sqrt(c0 ** 2 + 4 * c1 * cash)
+            breaks = np.stack([(-c0 + root) / (2 * c1), (-c0 - root) / (2 * c1),
+                               np.where(c1 == 0, cash / c0, np.nan),
+                               (-stock_qty - c0) / c1,
+                               -cash / (2 * stock_qty)], axis=1)
+        breaks = np.where((breaks > lo) & (breaks < hi), breaks, hi)
+        breaks.sort(axis=1)
+        edges = np.concatenate([np.full((len(c0), 1), lo), breaks, np.full((len(c0), 1), hi)], axis=1)
+        middle = (edges[:, :-1] + edges[:, 1:]) / 2
+        # (3, agentes, trechos)
+        pieces = np.stack(self._demand_pieces(middle, c0[:, None], c1[:, None], cash[:, None], stock_qty[:, None]))
+
+        # soma dos trechos: começa com o primeiro trecho de cada agente e soma as mudanças em cada ponto de quebra
+        points = edges[:, 1:-1].ravel()
+        changes = (pieces[:, :, 1:] - pieces[:, :, :-1]).reshape(3, -1)
+        order = np.argsort(points, kind='stable')
+        points = points[order]
+        totals = pieces[:, :, 0].sum(axis=1)[:, None] + np.concatenate(
+            [np.zeros((3, 1)), np.cumsum(changes[:, order], axis=1)], axis=1)
+        left = np.concatenate([[lo], points])
+        right = np.concatenate([points, [hi]])
+
+        # raízes de A + B p + C / p = 0, isto é, B p^2 + A p + C = 0, em cada intervalo
+        big_a, big_b, big_c = totals
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            disc = np.sqrt(big_a ** 2 - 4 * big_b * big_c)
+            q = -(big_a + np.copysign(disc, big_a)) / 2
+            roots = np.stack([np.where(big_b != 0, q / big_b, -big_c / big_a), big_c / q])
+        tolerance = 1e-12 * hi
+        valid = (roots >= left - tolerance) & (roots <= right + tolerance) & (roots > 0)
+        candidates = roots[valid]
+        if len(candidates):
+            is_rationed = False
+            price = candidates[np.argmin(np.abs(candidates - float(last_price)))]
+        else:
+            is_rationed = True
+            # excesso logo antes (trecho da esquerda) e logo depois (trecho da direita) de cada ponto de quebra
+            before = totals[0, :-1] + totals[1, :-1] * points + totals[2, :-1] / points
+            after = totals[0, 1:] + totals[1, 1:] * points + totals[2, 1:] / points
+            jumps = points[(np.sign(before) != np.sign(after)) & (points > lo) & (points < hi)]
+            if len(jumps):
+                price = jumps[np.argmin(np.abs(jumps - float(last_price)))]
+            else:
+                # o excesso tem o mesmo sinal em todo o intervalo: fica o preço de menor excesso em módulo, entre as
+                # pontas de cada trecho (um pouco para dentro, já que no ponto de quebra vale o trecho vizinho) e os
+                # pontos em que B - C / p^2 = 0
+                inset = np.minimum(1e-9 * hi, (right - left) / 2)
+                with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+                    stationary = np.sqrt(big_c / big_b)
+                stationary = np.where((stationary > left) & (stationary < right), stationary, left + inset)
+                prices = np.concatenate([left + inset, right - inset, stationary])
+                coefs = np.tile(totals, 3)
+                excess = np.abs(coefs[0] + coefs[1] * prices + coefs[2] / prices)
+                best = np.flatnonzero(excess <= excess.min() * (1 + 1e-12))
+                price = prices[best[np.argmin(np.abs(prices[best] - float(last_price)))]]
+        price = self.num(float(price))
+        # preço da fórmula de find_price: soma das demandas sem restrições c0 + c1 p - stock_qty igual a zero
+        slope = c1.sum()
+        unrestricted_price = self.num(float((stock_qty.sum() - c0.sum()) / slope)) if slope != 0 else price
+        if engine is None:
+            demands = [inv.stock_demand(price, market_state, dividend) for inv in investors]
+        else:
+            demands = [self.num(x) for x in engine.demands(float(price), d, selection).tolist()]
+        normalized_demands = self.normalize_demands(demands, is_rationed, zero_excess)
+        self._record('exact', start, is_rationed)
+        return price, normalized_demands, is_rationed, unrestricted_price
+
+    def normalize_demands(self, demands, is_rationed, zero_excess=False):
+        """
+        Raciona as demandas quando o mercado não se ajustou: as compras são reduzidas proporcionalmente às ofertas
+
+        :param demands: demandas dos agentes
+        :param is_rationed: BOOL de racionamento
+        :param zero_excess: se True arredonda as demandas e distribui o excesso aleatoriamente
+        :return: demandas normalizadas
+        """
+        if not is_rationed:
             normalized_demands = demands
         else:
             offers = abs(sum([i for i in demands if i < 0]))
@@ -418,17 +876,15 @@ class Specialist:
                 else:
                     normalized_demands.append(weights[i] * offers)
         if zero_excess:
-            normalized_demands = list(map(lambda x: x.quantize(Decimal("1.00")), normalized_demands))
+            normalized_demands = list(map(lambda x: round(x, 2), normalized_demands))
             excess = sum(normalized_demands)
-            if excess > Decimal(0):
-                count = int(excess.quantize(Decimal('1.00')) * 100)
-                for i in range(count):
-                    ind = random.choice(range(len(normalized_demands)))
-                    normalized_demands[ind] -= Decimal(0.01)
-            elif excess < 0:
-                count = int(-excess.quantize(Decimal('1.00')) * 100)
-                for i in range(count):
-                    ind = random.choice(range(len(normalized_demands)))
-                    normalized_demands[ind] += Decimal(0.01)
-
-        return price, normalized_demands, is_rationed, unrestricted_price
+            if excess != 0:
+                # o excesso é desfeito em passos de 0.01 distribuídos entre agentes sorteados
+                count = int(round(abs(excess) * 100))
+                step = self.num(0.01) if excess > 0 else -self.num(0.01)
+                hits = np.bincount(self.rng.integers(0, len(normalized_demands), count),
+                                   minlength=len(normalized_demands)).tolist()
+                for ind, hit in enumerate(hits):
+                    if hit:
+                        normalized_demands[ind] -= hit * step
+        return normalized_demands
@@ -0,0 +1,186 @@
+"""
+Mede os trechos mais executados da simulação para populações de tamanhos crescentes e grava os resultados em JSON,
+para comparar versões do código.
+
+Exemplos:
+    python Benchmark.py --output output/bench.json
+    python Benchmark.py --n-agents 25 100 400 --n-rules 100 200 --baseline output/bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import numpy as np
+
+from Output import open_sink
+from Simulation import Simulation
+
+BENCHMARKS = ('is_active', 'select_rule', 'update_info_state', 'calculate_demands', 'find_price', 'genetic_algo',
+              'step')
+
+
+def measure(func, repeat=5, number=1):
+    """
+    :return: lista com o tempo, em segundos, de uma chamada de func em cada uma de repeat medições de number chamadas
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return times
+
+
+def best_time(func, repeat=5, number=1):
+    """
+    :return: menor tempo, em segundos, de uma chamada de func entre repeat medições de number chamadas
+    """
+    return min(measure(func, repeat, number))
+
+
+def make_simulation(n_agents, n_rules, directory, numeric='float', seed=0, warmup_steps=20, price_setting='clearing'):
+    """
+    Cria uma simulação com agentes novos e roda warmup_steps passos, para que histórico, estado do mercado e
+    accuracy das regras não sejam os iniciais
+
+    :param directory: diretório do arquivo de saída, removido por quem o criou
+    :return: (simulação, sink aberto em directory)
+    """
+    simulation = Simulation(n_agents, warmup_steps, numeric=numeric, seed=seed,
+                            csv_filepath=os.path.join(directory, 'price.csv'))
+    simulation.initialiaze_agents(n_rules)
+    sink = open_sink(simulation.csv_filepath)
+    for step in range(warmup_steps):
+        simulation.run_step(step, sink, price_setting)
+    return simulation, sink
+
+
+def run_case(n_agents, n_rules, numeric='float', repeat=5, benchmarks=BENCHMARKS):
+    """
+    O passo completo (step) muda o estado da simulação a cada chamada e roda o algoritmo genético a cada ga_frquency
+    passos, então é medido em pelo menos ga_frquency passos seguidos; além do menor tempo são informados a média
+    (step_mean) e a mediana (step_median)
+
+    :return: dicionário benchmark -> segundos por chamada
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        return _run_case(directory, n_agents, n_rules, numeric, repeat, benchmarks)
+
+
+def _run_case(directory, n_agents, n_rules, numeric, repeat, benchmarks):
+    simulation, sink = make_simulation(n_agents, n_rules, directory, numeric)
+    investors, market, specialist = simulation.investors, simulation.market, simulation.specialist
+    states = np.random.default_rng(0).integers(0, 2 ** 63, 64).tolist()
+    price, dividend = simulation.num(market.price_history[-1]), simulation.stock.current_dividend
+    step = [simulation.n_steps]
+    results = {}
+
+    def is_active():
+        for state in states:
+            for rule in investors[0].trading_rules:
+                rule.is_active(state)
+
+    def select_rule():
+        for state in states:
+            for agent in investors:
+                agent.invalidate_rule_cache()
+                agent.select_rule(state)
+
+    def genetic_algo():
+        for agent in investors:
+            agent.genetic_algo(simulation.genetic_param, simulation.rngs['mutation'], simulation.rngs['crossover'])
+
+    def run_step():
+        simulation.run_step(step[0], sink)
+        step[0] += 1
+
+    cases = dict(
+        # por regra e por estado
+        is_active=(is_active, len(states) * n_rules),
+        # por agente e por estado
+        select_rule=(select_rule, len(states) * n_agents),
+        update_info_state=(lambda: market.update_info_state(100), 1),
+        calculate_demands=(lambda: specialist.calculate_demands(price, dividend, investors, market.state_word), 1),
+        find_price=(lambda: specialist.find_price(dividend, investors, market.state_word), 1),
+        genetic_algo=(genetic_algo, n_agents),
+        step=(run_step, 1),
+    )
+    for name in benchmarks:
+        func, calls = cases[name]
+        if name == 'step':
+            times = measure(func, max(repeat, simulation.ga_frquency))
+            results.update(step=min(times), step_mean=float(np.mean(times)), step_median=float(np.median(times)))
+        else:
+            results[name] = best_time(func, repeat) / calls
+    sink.close()
+    return results
+
+
+def run_benchmarks(n_agents=(25, 100, 400), n_rules=(100, 200), numeric='float', repeat=5, benchmarks=BENCHMARKS):
+    """
+    Roda os benchmarks para todas as combinações de número de agentes e de regras por agente
+
+    :return: dicionário com o ambiente e uma lista de resultados (benchmark, n_agents, n_rules, seconds)
+    """
+    results = []
+    for agents in n_agents:
+        for rules in n_rules:
+            timings = run_case(agents, rules, numeric, repeat, benchmarks)
+            for name, seconds in timings.items():
+                results.append(dict(benchmark=name, n_agents=agents, n_rules=rules, numeric=numeric,
+                                    seconds=seconds))
+                print("{:<18} agents={:<5} rules={:<5} {:.3e} s".format(name, agents, rules, seconds))
+    return dict(python=platform.python_version(), numpy=np.__version__, machine=platform.machine(),
+                created=time.strftime('%Y-%m-%d %H:%M:%S'), results=results)
+
+
+def compare(current, baseline, tolerance=0.1):
+    """
+    Compara dois resultados de run_benchmarks
+
+    :param tolerance: variação relativa a partir da qual um caso é marcado como regressão ou melhora
+    :return: lista de dicionários com os tempos, a razão atual / baseline e o status de cada caso em comum
+    """
+    key = lambda r: (r['benchmark'], r['n_agents'], r['n_rules'], r['numeric'])
+    old = {key(r): r['seconds'] for r in baseline['results']}
+    comparison = []
+    for result in current['results']:
+        if key(result) not in old:
+            continue
+        ratio = result['seconds'] / old[key(result)]
+        status = 'regression' if ratio > 1 + tolerance else 'improvement' if ratio < 1 - tolerance else 'same'
+        comparison.append(dict(result, baseline=old[key(result)], ratio=ratio, status=status))
+    return comparison
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks da simulação')
+    parser.add_argument('--n-agents', type=int, nargs='+', default=[25, 100, 400])
+    parser.add_argument('--n-rules', type=int, nargs='+', default=[100, 200])
+    parser.add_argument('--numeric', choices=['decimal', 'float'], default='float')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--benchmarks', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--output', default='output/benchmark.json')
+    parser.add_argument('--baseline', help='JSON de uma execução anterior para comparação')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+    current = run_benchmarks(args.n_agents, args.n_rules, args.numeric, args.repeat, args.benchmarks)
+    if args.baseline:
+        with open(args.baseline) as f:
+            current['comparison'] = compare(current, json.load(f), args.tolerance)
+        for row in current['comparison']:
+            print("{:<18} agents={:<5} rules={:<5} {:>6.2f}x {}".format(
+                row['benchmark'], row['n_agents'], row['n_rules'], row['ratio'], row['status']))
+    if os.path.dirname(args.output):
+        os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+    return current
+
+
+if __name__ == '__main__':
+    main()
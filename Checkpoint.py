@@ -0,0 +1,160 @@
+import json
+import os
+from decimal import Decimal
+
+import numpy as np
+
+from Agents import Investor, Rule
+from Market import NUMERIC_TYPES
+from Population import PopulationEngine, popcount
+
+
+def encode_values(values, numeric):
+    """
+    Valores Decimal são guardados como texto para não perder precisão; float vira um array float64
+    """
+    if numeric is Decimal:
+        return np.array([str(v) for v in values])
+    return np.array([float(v) for v in values])
+
+
+def decode_values(array, numeric):
+    """
+    :return: lista com os valores do array no tipo numérico da simulação
+    """
+    if numeric is Decimal:
+        return [Decimal(str(v)) for v in array.tolist()]
+    return array.astype(float).tolist()
+
+
+def save_checkpoint(filepath, simulation, step):
+    """
+    Grava o estado da simulação depois do passo 'step' em um .npz: regras de todos os agentes como arrays
+    (agentes x regras) de máscaras, alpha, beta, accuracy e fitness; carteiras; histórico e estado do mercado;
+    dividendo atual e o estado de todos os geradores aleatórios. Nada é gravado com pickle. Se os agentes só existem
+    no PopulationEngine (ver Simulation.engine_only) a população é lida direto dos arrays, sem criar os objetos.
+
+    :param simulation: objeto 'Simulation' em execução
+    :return: filepath
+    """
+    num = simulation.num
+    if simulation.engine_only:
+        arrays = engine_arrays(simulation)
+    else:
+        arrays = investor_arrays(simulation.investors, num)
+    arrays.update(
+        step=np.array(step),
+        numeric=np.array(next(k for k, v in NUMERIC_TYPES.items() if v is num)),
+        price_history=encode_values(simulation.market.price_history.tolist(), num),
+        dividend_history=encode_values(simulation.market.dividend_history.tolist(), num),
+        current_state=np.array(simulation.market.current_state, dtype=bool),
+        stock=encode_values([simulation.stock.current_price, simulation.stock.current_dividend], num),
+        specialist=encode_values([simulation.specialist.max_price, simulation.specialist.num_shares], num),
+        rngs=np.array(json.dumps({k: rng.bit_generator.state for k, rng in simulation.rngs.items()})),
+    )
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    np.savez(filepath, **arrays)
+    return filepath
+
+
+def investor_arrays(investors, num):
+    """
+    :return: dicionário com as regras e carteiras dos objetos 'Investor' no formato do checkpoint
+    """
+    rules = [rule for agent in investors for rule in agent.trading_rules]
+    shape = (len(investors), len(investors[0].trading_rules))
+    return dict(
+        care=np.array([rule.care_mask for rule in rules], dtype=np.uint64).reshape(shape),
+        value=np.array([rule.value_mask for rule in rules], dtype=np.uint64).reshape(shape),
+        alpha=encode_values([rule._alpha for rule in rules], num).reshape(shape),
+        beta=encode_values([rule._beta for rule in rules], num).reshape(shape),
+        accuracy=encode_values([rule.accuracy for rule in rules], num).reshape(shape),
+        fitness=np.array([float(rule.fitness) for rule in rules]).reshape(shape),
+        cash=encode_values([agent.cash for agent in investors], num),
+        stock_qty=encode_values([agent.stock_qty for agent in investors], num),
+        median_accuracy=encode_values([agent.median_accuracy for agent in investors], num),
+        risk_free=encode_values([agent.risk_free for agent in investors], num),
+        risk_aversion=encode_values([agent.risk_aversion_coef for agent in investors], num),
+    )
+
+
+def engine_arrays(simulation):
+    """
+    :return: dicionário com as regras do PopulationEngine e as carteiras da simulação vetorizada no formato do
+    checkpoint. Os valores float do engine são gravados como os objetos 'Rule' criados a partir deles os teriam.
+    """
+    num, engine = simulation.num, simulation.engine
+
+    def values(array):
+        return encode_values([num(x) for x in np.ravel(array).tolist()], num).reshape(np.shape(array))
+
+    median_accuracy = simulation.median_accuracy
+    if median_accuracy is None:
+        median_accuracy = np.full(engine.n_agents, 4.)
+    return dict(
+        care=np.array(engine.care),
+        value=np.array(engine.value & engine.care),
+        alpha=values(engine.alpha),
+        beta=values(engine.beta),
+        accuracy=values(engine.accuracy),
+        fitness=np.asarray(engine.fitness(), dtype=float),
+        cash=encode_values(simulation.cash.tolist(), num),
+        stock_qty=encode_values(simulation.stock_qty.tolist(), num),
+        median_accuracy=values(median_accuracy),
+        risk_free=values(engine.risk_free),
+        risk_aversion=values(engine.risk_aversion),
+    )
+
+
+def load_checkpoint(filepath):
+    """
+    :return: dicionário com os arrays gravados por save_checkpoint
+    """
+    with np.load(filepath) as data:
+        return {k: data[k] for k in data.files}
+
+
+def investors_from_checkpoint(checkpoint, numeric):
+    """
+    Reconstrói os objetos 'Investor' com as regras e carteiras do checkpoint
+
+    :param checkpoint: resultado de load_checkpoint
+    :return: lista de objetos 'Investor'
+    """
+    care, value = checkpoint['care'].tolist(), checkpoint['value'].tolist()
+    n_rules = len(care[0])
+    alpha, beta, accuracy = (decode_values(checkpoint[k].ravel(), numeric) for k in ('alpha', 'beta', 'accuracy'))
+    portfolio = {k: decode_values(checkpoint[k], numeric)
+                 for k in ('cash', 'stock_qty', 'median_accuracy', 'risk_free', 'risk_aversion')}
+    investors = []
+    for i in range(len(care)):
+        rules = []
+        for j in range(n_rules):
+            rule = Rule.from_masks(care[i][j], value[i][j], alpha[i * n_rules + j], beta[i * n_rules + j], numeric)
+            rule.accuracy = accuracy[i * n_rules + j]
+            rules.append(rule)
+        agent = Investor(rules, portfolio['stock_qty'][i], portfolio['cash'][i], portfolio['risk_free'][i], numeric)
+        agent.median_accuracy = portfolio['median_accuracy'][i]
+        agent.risk_aversion_coef = portfolio['risk_aversion'][i]
+        investors.append(agent)
+    return investors
+
+
+def engine_from_checkpoint(checkpoint, dtype=np.float64, filepath=None):
+    """
+    Carrega as regras e carteiras do checkpoint direto em um PopulationEngine, sem objetos 'Investor' e 'Rule'
+
+    :param checkpoint: resultado de load_checkpoint
+    :param dtype, filepath: como em PopulationEngine
+    :return: PopulationEngine
+    """
+    engine = PopulationEngine(*checkpoint['care'].shape, dtype=dtype, filepath=filepath)
+    engine.care[...], engine.value[...] = checkpoint['care'], checkpoint['value']
+    engine.specificity[...] = popcount(engine.care)
+    for name in ('alpha', 'beta', 'accuracy', 'cash', 'stock_qty', 'risk_free', 'risk_aversion'):
+        # Decimal gravado como texto vira float como nos objetos: o valor decimal arredondado uma vez
+        getattr(engine, name)[...] = checkpoint[name].astype(float)
+    engine.invalidate_conditions()
+    return engine
@@ -0,0 +1,102 @@
+import itertools
+import os
+import shutil
+import time
+import csv
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Simulation import Simulation
+
+SIMULATION_PARAMS = ('n_agents', 'n_steps', 'initial_price', 'initial_dividend', 'ga_frquency', 'genetic_param',
+                     'numeric', 'seed', 'output_format', 'flush_every', 'telemetry_interval',
+                     'instrument', 'dividend_source', 'engine_dtype')
+RUN_PARAMS = ('price_setting', 'new_agents', 'vectorized', 'burn_in_steps', 'agent_cache')
+
+
+def parameter_grid(grid):
+    """
+    Expande um dicionário parâmetro -> lista de valores em todas as combinações
+
+    :param grid: ex. {'n_agents': [20, 100], 'price_setting': ['auction', 'exact'], 'seed': [0, 1, 2]}
+    :return: lista de dicionários, um por simulação
+    """
+    keys = list(grid)
+    values = [v if isinstance(v, (list, tuple, range)) else [v] for v in grid.values()]
+    return [dict(zip(keys, combination)) for combination in itertools.product(*values)]
+
+
+def common_dividends(filepath, n_steps, seed):
+    """
+    Grava o caminho de dividendos que uma simulação com dividend_source='bulk' e essa semente usaria, para ser
+    compartilhado (dividend_source=filepath) por simulações que devem ver os mesmos dividendos
+
+    :return: filepath
+    """
+    stock = Simulation(1, n_steps, numeric='float', seed=seed).stock
+    return stock.bulk_dividends().save(filepath, n_steps)
+
+
+def run_single(params, run_dir, agents_source='StoredAgents/Investors.pickle'):
+    """
+    Roda uma simulação com arquivos próprios em run_dir (price.csv ou price.npz e Investors.pickle). Pode ser
+    chamada em outro processo.
+
+    :param params: parâmetros de Simulation e de MainSimulation, mais 'seed'
+    :param run_dir: diretório exclusivo da simulação
+    :param agents_source: agentes iniciais, copiados para run_dir quando new_agents é False
+    :return: dicionário com os parâmetros e o resumo da simulação
+    """
+    os.makedirs(run_dir, exist_ok=True)
+    agents_filepath = os.path.join(run_dir, 'Investors.pickle')
+    if not params.get('new_agents', False) and not params.get('burn_in_steps'):
+        shutil.copyfile(agents_source, agents_filepath)
+    output_filepath = os.path.join(run_dir, 'price.{}'.format(params.get('output_format', 'csv')))
+    simulation = Simulation(csv_filepath=output_filepath, agents_filepath=agents_filepath,
+                            **{k: v for k, v in params.items() if k in SIMULATION_PARAMS})
+    start = time.perf_counter()
+    prices = simulation.MainSimulation(**{k: v for k, v in params.items() if k in RUN_PARAMS})
+    elapsed = time.perf_counter() - start
+    prices = np.array(prices, dtype=float)
+    summary = dict(params, run_dir=run_dir, final_price=prices[-1], mean_price=prices.mean(),
+                   std_price=prices.std(), seconds=elapsed)
+    for method, report in simulation.specialist.report().items():
+        summary['rationed_rate'] = report['rationed_rate']
+        summary['ms_per_step'] = report['ms_per_step']
+    return summary
+
+
+def run_ensemble(grid, output_dir='output/ensemble', n_workers=None,
+                 agents_source='StoredAgents/Investors.pickle', common_dividends_seed=None):
+    """
+    Roda todas as combinações de parâmetros em um pool de processos. Cada simulação escreve em
+    output_dir/run_<n>/, então as simulações não disputam o CSV nem o arquivo de agentes. O resumo de todas as
+    simulações também é gravado em output_dir/summary.csv.
+
+    :param grid: dicionário parâmetro -> lista de valores (ver parameter_grid) ou lista de dicionários
+    :param n_workers: número de processos, padrão os.cpu_count()
+    :param common_dividends_seed: se informado, todas as simulações usam o mesmo caminho de dividendos, gerado uma
+    vez com essa semente em output_dir/dividends.npy (números aleatórios comuns, para comparações com menos
+    variância)
+    :return: lista de resumos, na ordem das combinações
+    """
+    runs = parameter_grid(grid) if isinstance(grid, dict) else list(grid)
+    run_dirs = [os.path.join(output_dir, 'run_{}'.format(n)) for n in range(len(runs))]
+    if common_dividends_seed is not None:
+        os.makedirs(output_dir, exist_ok=True)
+        filepath = common_dividends(os.path.join(output_dir, 'dividends.npy'),
+                                    max(params['n_steps'] for params in runs), common_dividends_seed)
+        runs = [dict(params, dividend_source=filepath) for params in runs]
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(run_single, params, run_dir, agents_source)
+                   for params, run_dir in zip(runs, run_dirs)]
+        results = [future.result() for future in futures]
+    fields = []
+    for result in results:
+        fields += [k for k in result if k not in fields]
+    with open(os.path.join(output_dir, 'summary.csv'), mode='w', newline='') as summary_file:
+        writer = csv.DictWriter(summary_file, fieldnames=fields, delimiter=';')
+        writer.writeheader()
+        writer.writerows(results)
+    return results
@@ -0,0 +1,94 @@
+import logging
+import time
+
+PHASES = ('dividend', 'price', 'portfolio', 'fitness', 'sorting', 'ga', 'output', 'state')
+COUNTERS = ('steps', 'specialist_trials', 'rationed', 'active_rules', 'fallback_rules', 'agent_steps',
+            'ga_invocations')
+
+logger = logging.getLogger(__name__)
+
+
+class NullInstrumentation:
+    """
+    Instrumentação desligada: os métodos não fazem nada, então o custo é o de uma chamada vazia por fase
+    """
+    enabled = False
+
+    def start(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def count(self, counter, value=1):
+        pass
+
+    def end_step(self, step):
+        pass
+
+    def report(self):
+        return {}
+
+
+class Instrumentation(NullInstrumentation):
+    """
+    Tempo acumulado de cada fase do passo e contadores da simulação. Simulation.run_step chama start no começo do
+    passo e lap(fase) ao fim de cada fase, que soma o tempo desde a marca anterior.
+
+    Fases: dividend, price (formação do preço), portfolio, fitness (accuracy e mediana), sorting (ordenação por
+    fitness para o algoritmo genético), ga, output (saída e telemetria) e state (histórico e estado do mercado).
+    Contadores: tentativas do especialista, passos com racionamento, regras ativas e agentes sem regra ativa (que usam
+    a regra média de Investor.select_rule) somados sobre agentes e passos, e execuções do algoritmo genético por
+    agente.
+    """
+    enabled = True
+
+    def __init__(self, report_every=None, log=logger):
+        """
+        :param report_every: a cada report_every passos o tempo por fase desde o último envio é enviado ao log
+        :param log: logging.Logger que recebe os envios periódicos
+        """
+        self.report_every = report_every
+        self.log = log
+        self.phases = dict.fromkeys(PHASES, 0.)
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._mark = None
+        self._last_report = (dict(self.phases), 0)
+
+    def start(self):
+        self._mark = time.perf_counter()
+
+    def lap(self, phase):
+        now = time.perf_counter()
+        self.phases[phase] += now - self._mark
+        self._mark = now
+
+    def count(self, counter, value=1):
+        self.counters[counter] += value
+
+    def end_step(self, step):
+        self.counters['steps'] += 1
+        if self.report_every and self.counters['steps'] % self.report_every == 0:
+            phases, steps = self._last_report
+            n = self.counters['steps'] - steps
+            self.log.info('step %d: %s', step, ', '.join(
+                '{} {:.3f} ms'.format(k, 1000 * (self.phases[k] - phases[k]) / n) for k in PHASES))
+            self._last_report = (dict(self.phases), self.counters['steps'])
+
+    def report(self):
+        """
+        :return: dict com o tempo total e por passo de cada fase (ms), os contadores e as médias por passo e por
+        agente
+        """
+        steps = max(self.counters['steps'], 1)
+        agent_steps = max(self.counters['agent_steps'], 1)
+        total = sum(self.phases.values())
+        return dict(
+            phases={k: dict(total_ms=1000 * v, ms_per_step=1000 * v / steps, share=v / total if total else 0.)
+                    for k, v in self.phases.items()},
+            counters=dict(self.counters),
+            trials_per_step=self.counters['specialist_trials'] / steps,
+            rationed_rate=self.counters['rationed'] / steps,
+            active_rules_per_agent=self.counters['active_rules'] / agent_steps,
+            fallback_rate=self.counters['fallback_rules'] / agent_steps,
+        )
@@ -0,0 +1,142 @@
+"""
+Métricas da simulação em andamento publicadas em memória compartilhada, para que outro processo local acompanhe
+execuções longas (gráfico, alerta) sem ler o arquivo de saída.
+
+Exemplo, em outro terminal enquanto a simulação roda com live_metrics='sfi_live':
+    python LiveMetrics.py sfi_live
+"""
+import argparse
+import time
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+FIELDS = ('step', 'price', 'dividend', 'rationed_rate', 'mean_accuracy', 'steps_per_second')
+HEADER = 2
+
+
+class LiveMetricsWriter:
+    """
+    Buffer circular em memória compartilhada com as últimas capacity amostras de FIELDS. O bloco começa com dois
+    int64 (amostras já escritas e capacidade) seguidos de capacity linhas float64. A escrita é uma cópia de seis
+    floats para a linha count % capacity seguida do incremento do contador: a simulação nunca espera o leitor nem
+    serializa nada, e o leitor descarta as linhas que podem ter sido sobrescritas durante a leitura.
+    """
+
+    def __init__(self, name, capacity=1024, replace=False):
+        """
+        :param name: nome do bloco de memória compartilhada
+        :param capacity: amostras guardadas no buffer
+        :param replace: se True remove um bloco de mesmo nome já existente (ex. deixado por uma execução
+        interrompida); senão um bloco existente, que pode ser de uma simulação em andamento, gera FileExistsError
+        """
+        size = 8 * (HEADER + capacity * len(FIELDS))
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            if not replace:
+                raise FileExistsError('Já existe um bloco de memória compartilhada {!r}; use outro nome ou '
+                                      'replace=True'.format(name))
+            shared_memory.SharedMemory(name).unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.header = np.ndarray(HEADER, dtype=np.int64, buffer=self.shm.buf)
+        self.rows = np.ndarray((capacity, len(FIELDS)), dtype=np.float64, buffer=self.shm.buf, offset=8 * HEADER)
+        self.header[:] = (0, capacity)
+        self.capacity = capacity
+        self.steps = 0
+        self.rationed = 0
+        self._start = time.perf_counter()
+
+    def publish(self, step, price, dividend, is_rationed, mean_accuracy):
+        """
+        Registra um passo. A taxa de racionamento e os passos por segundo são acumulados desde a criação do writer.
+        """
+        self.steps += 1
+        self.rationed += bool(is_rationed)
+        elapsed = time.perf_counter() - self._start
+        count = int(self.header[0])
+        self.rows[count % self.capacity] = (step, float(price), float(dividend), self.rationed / self.steps,
+                                            float(mean_accuracy), self.steps / elapsed if elapsed else 0.)
+        self.header[0] = count + 1
+
+    def close(self):
+        """
+        Libera e remove o bloco; leitores ainda conectados mantêm o mapeamento até se desconectarem
+        """
+        del self.header, self.rows
+        self.shm.close()
+        self.shm.unlink()
+
+
+class LiveMetricsReader:
+    """
+    Leitor de um buffer criado por LiveMetricsWriter em outro processo
+    """
+
+    def __init__(self, name):
+        self.shm = shared_memory.SharedMemory(name)
+        # o leitor não é dono do bloco: sem isso o resource_tracker o removeria quando o leitor terminasse
+        resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.header = np.ndarray(HEADER, dtype=np.int64, buffer=self.shm.buf)
+        self.capacity = int(self.header[1])
+        self.rows = np.ndarray((self.capacity, len(FIELDS)), dtype=np.float64, buffer=self.shm.buf,
+                               offset=8 * HEADER)
+        self.seen = 0
+
+    @property
+    def count(self):
+        """
+        :return: amostras escritas desde o início da simulação
+        """
+        return int(self.header[0])
+
+    def read(self, n=None):
+        """
+        :param n: número máximo de amostras; None devolve todas as que estão no buffer
+        :return: array estruturado com as últimas amostras, da mais antiga para a mais recente
+        """
+        end = self.count
+        start = max(end - self.capacity, 0 if n is None else end - n, 0)
+        data = self.rows[np.arange(start, end) % self.capacity]
+        # linhas sobrescritas (ou em escrita) pelo writer durante a cópia são descartadas
+        overwritten = self.count + 1 - self.capacity - start
+        if overwritten > 0:
+            data = data[overwritten:]
+        return np.rec.fromarrays(data.T, names=FIELDS)
+
+    def read_new(self):
+        """
+        :return: amostras escritas desde a última chamada de read_new (as perdidas por sobrescrita são ignoradas)
+        """
+        count = self.count
+        data = self.read(count - self.seen)
+        self.seen = count
+        return data
+
+    def close(self):
+        del self.header, self.rows
+        self.shm.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Acompanha as métricas de uma simulação em andamento')
+    parser.add_argument('name', help='nome do bloco de memória compartilhada (parâmetro live_metrics)')
+    parser.add_argument('--interval', type=float, default=1., help='segundos entre leituras')
+    args = parser.parse_args(argv)
+    reader = LiveMetricsReader(args.name)
+    try:
+        while True:
+            new = reader.read_new()
+            if len(new):
+                last = new[-1]
+                print("step {:.0f}: price {:.4f}, dividend {:.4f}, {:.1%} racionados, accuracy {:.4f}, "
+                      "{:.1f} passos/s".format(*last))
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,25 @@
-import datetime
-import random
 import csv
 from decimal import Decimal
-from statistics import mean
+from fractions import Fraction
 
 import numpy as np
-import pandas as pd
+
+
+def pack_bits(bits):
+    """
+    Empacota uma sequência de até 64 valores booleanos em um inteiro: o elemento n vira o bit n
+
+    :param bits: iterável de BOOL (ou 0/1)
+    :return: int
+    """
+    word = 0
+    for n, bit in enumerate(bits):
+        if bit:
+            word |= 1 << n
+    return word
+
+
+NUMERIC_TYPES = {'decimal': Decimal, 'float': float}
 
 
 def ratio_greater_than(k):
@@ -22,22 +36,210 @@ def xyz_ratio_greater_than(k):
     return f
 
 
+class RingBuffer:
+    """
+    Histórico de tamanho fixo em um array pré-alocado. Cada valor é escrito em duas posições (i e i + capacidade), de
+    forma que o histórico retido e qualquer janela final são sempre fatias contíguas do array (sem cópia).
+    Suporta len(), índices negativos e positivos como uma lista.
+    """
+
+    def __init__(self, capacity, dtype=float):
+        """
+        :param capacity: número máximo de elementos retidos; ao encher, o mais antigo é descartado
+        :param dtype: float para float64 ou object para guardar Decimal sem perda
+        """
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+        self._end = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError('RingBuffer index out of range')
+        return self._data[(self._end - self._len + index) % self.capacity]
+
+    def __iter__(self):
+        return iter(self.values())
+
+    def append(self, value):
+        position = self._end % self.capacity
+        self._data[position] = value
+        self._data[position + self.capacity] = value
+        self._end += 1
+        self._len = min(self._len + 1, self.capacity)
+
+    def popleft(self):
+        value = self[0]
+        self._len -= 1
+        return value
+
+    def last(self, k):
+        """
+        :return: view dos últimos k elementos (ou de todos, se houver menos de k)
+        """
+        k = min(k, self._len)
+        stop = (self._end - 1) % self.capacity + 1 + self.capacity
+        return self._data[stop - k:stop]
+
+    def values(self):
+        """
+        :return: view do histórico retido, do mais antigo para o mais recente
+        """
+        return self.last(self._len)
+
+    def tolist(self):
+        return self.values().tolist()
+
+
+class StateCalculator:
+    """
+    Calcula os 64 bits de estado do mercado de forma incremental. Mantém somas acumuladas exatas (Fraction) das
+    janelas de 5, 10, 20, 100 e 500 passos e do histórico inteiro, atualizadas em O(1) a cada novo preço e dividendo,
+    e compara todas as condições de uma só vez. As médias são convertidas para o tipo numérico da simulação do mesmo
+    jeito que statistics.mean, então os bits são idênticos aos calculados diretamente sobre o histórico.
+    """
+    windows = (5, 10, 20, 100, 500)
+    dividend_ratio_rule = (0.6, 0.8, 0.9, 1.1, 1.12, 1.4)
+    price_ratio_rule = (0.25, 0.5, 0.75, .875, 1, 1.125, 1.25)
+    price_interest_ratio_rule = (0.25, 0.5, 0.75, .875, .95, 1, 1.125)
+
+    def __init__(self, price_history, dividend_history, risk_free, numeric=Decimal):
+        """
+        :param price_history: histórico de preços do MarketInfo (o mesmo objeto, não uma cópia)
+        :param dividend_history: histórico de dividendos do MarketInfo
+        :param risk_free: taxa de juros livre de risco
+        :param numeric: tipo numérico do histórico (Decimal ou float)
+        """
+        self.price_history = price_history
+        self.dividend_history = dividend_history
+        self.risk_free = risk_free
+        self.num = numeric
+        self.dtype = float if numeric is float else object
+        self.price_sums = dict.fromkeys(self.windows + ('all',), Fraction(0))
+        self.dividend_sums = dict.fromkeys(self.windows + ('all',), Fraction(0))
+        self.price_leaving = dict.fromkeys(self.windows, Fraction(0))
+        self.dividend_leaving = dict.fromkeys(self.windows, Fraction(0))
+
+    @classmethod
+    def _push_series(cls, history, sums, leaving):
+        n = len(history)
+        new = Fraction(history[-1])
+        for k in cls.windows:
+            sums[k] += new
+            # elemento que sai da janela, também usado na janela do passo anterior
+            leaving[k] = Fraction(history[-k - 1]) if n > k else Fraction(0)
+            sums[k] -= leaving[k]
+        sums['all'] += new
+
+    def push(self):
+        """
+        Deve ser chamado depois de acrescentar um preço e um dividendo ao histórico
+        """
+        self._push_series(self.price_history, self.price_sums, self.price_leaving)
+        self._push_series(self.dividend_history, self.dividend_sums, self.dividend_leaving)
+
+    @classmethod
+    def _drop_series(cls, history, sums):
+        oldest = Fraction(history[0])
+        sums['all'] -= oldest
+        # com o histórico menor que a janela, o elemento descartado ainda faz parte dela
+        for k in cls.windows:
+            if k >= len(history):
+                sums[k] -= oldest
+
+    def drop_oldest(self):
+        """
+        Deve ser chamado antes de remover o elemento mais antigo do histórico
+        """
+        self._drop_series(self.price_history, self.price_sums)
+        self._drop_series(self.dividend_history, self.dividend_sums)
+
+    def _convert(self, value):
+        # mesma conversão de statistics.mean
+        try:
+            return self.num(value)
+        except TypeError:
+            return self.num(value.numerator) / self.num(value.denominator)
+
+    def _means(self, history, sums, leaving):
+        """
+        :return: média do histórico inteiro, médias das janelas x[-k:] e das janelas do passo anterior x[-k-1:-1]
+        """
+        n = len(history)
+        last = Fraction(history[-1])
+        full = self._convert(sums['all'] / n)
+        current = {k: self._convert(sums[k] / min(k, n)) for k in self.windows}
+        previous = {k: self._convert((sums[k] - last + leaving[k]) / min(k, n - 1)) for k in self.windows}
+        return full, current, previous
+
+    def compute(self, step, previous_state):
+        """
+        :param step: passo atual
+        :param previous_state: bits anteriores, de onde vêm os bits 20 a 29 até o passo 10
+        :return: array BOOL de 64 posições
+        """
+        num = self.num
+        p, d = self.price_history, self.dividend_history
+        p_mean, p_cur, p_prev = self._means(p, self.price_sums, self.price_leaving)
+        d_mean, d_cur, d_prev = self._means(d, self.dividend_sums, self.dividend_leaving)
+        dividend_ratio = num(d[-1]) / d_mean
+        price_ratio = num(p[-1]) / p_mean
+        price_interest_ratio = num(p[-1]) * self.risk_free / d_mean
+        if step > 10:
+            trend = [p[-j] - p[-j - 1] for j in range(1, 7)] + [d[-j] - d[-j - 1] for j in range(1, 5)]
+        else:
+            trend = [0] * 10
+        left = ([dividend_ratio] * 6 + [price_ratio] * 7 + [price_interest_ratio] * 7 + trend +
+                [p_cur[k] for k in (5, 10, 20, 100, 500)] + [d_cur[k] for k in (5, 10, 100, 500)] +
+                [p[-1]] * 5 + [d[-1]] * 4 +
+                [d_cur[5]] * 3 + [d_cur[10]] * 2 + [d_cur[100]] +
+                [p_cur[5]] * 4 + [p_cur[10]] * 3 + [p_cur[20]] * 2 + [p_cur[100]])
+        right = (list(self.dividend_ratio_rule) + list(self.price_ratio_rule) + list(self.price_interest_ratio_rule) +
+                 [0] * 10 +
+                 [p_prev[k] for k in (5, 10, 20, 100, 500)] + [d_prev[k] for k in (5, 10, 100, 500)] +
+                 [p_cur[k] for k in (5, 10, 20, 100, 500)] + [d_cur[k] for k in (5, 10, 100, 500)] +
+                 [d_cur[10], d_cur[100], d_cur[500], d_cur[100], d_cur[500], d_cur[500]] +
+                 [p_cur[10], p_cur[20], p_cur[100], p_cur[500], p_cur[20], p_cur[100], p_cur[500], p_cur[100],
+                  p_cur[500], p_cur[500]])
+        state = np.array(left, dtype=self.dtype) > np.array(right, dtype=self.dtype)
+        state = state.astype(bool)
+        if step <= 10:
+            state[20:30] = np.array(previous_state[20:30], dtype=bool)
+        return state
+
+
 class MarketInfo:
     """
     Classe que implementa as informações de mercado em geral, incluindo as séries de preço.
     Seguindo nossa referência, teremos 64 elementos de informação de mercado.
     """
 
-    def __init__(self, dividend_mean, filepath="price.csv", initial_price=80):
+    def __init__(self, dividend_mean, filepath="price.csv", initial_price=80, numeric=Decimal, history_capacity=505):
+        """
+        :param numeric: tipo numérico usado nas contas (Decimal ou float)
+        :param history_capacity: tamanho dos buffers de histórico de preços e dividendos; pelo menos 8, para os bits
+        de sentido dos preços (7 preços). Abaixo de 500 as médias das janelas maiores usam todo o histórico retido
+        """
+        if history_capacity < 8:
+            raise ValueError('history_capacity deve ser pelo menos 8, recebido {}'.format(history_capacity))
+        self.num = numeric
         self.dividend_mean = dividend_mean
         self.revision_speed = 0.95
         self.dividend_error_var = 0.1
-        self.risk_free = Decimal(0.05)
+        self.risk_free = numeric(0.05)
         self.rule_set = []
         self.current_state = [0 for i in range(0, 64)]
+        self.state_word = 0
         self.price_history_path = filepath
-        self.price_history = []
-        self.dividend_history = []
+        history_dtype = float if numeric is float else object
+        self.price_history = RingBuffer(history_capacity, history_dtype)
+        self.dividend_history = RingBuffer(history_capacity, history_dtype)
+        self.state_calculator = StateCalculator(self.price_history, self.dividend_history, self.risk_free, numeric)
         dividend_ratio_rule = [0.6, 0.8, 0.9, 1, 1.1, 1.12, 1.4]
         price_ratio_rule = [0.25, 0.5, 0.75, .875, 1, 1.125, 1.25]
         price_interest_ratio_rule = [0.25, 0.5, 0.75, .875, .95, 1, 1.125]
@@ -75,126 +277,19 @@ class MarketInfo:
         # preco"""
 
     def update_info_state(self, step):
-        """for n, f in enumerate(self.rule_set):
-            if n <= 5:
-                pass
-                # self.current_state[n] = f(self.price_history.dividend.tail(1).mean(), self.price_history.dividend.mean())
-            elif n <= 14:
-                pass
-                # self.current_state[n] = f(self.price_history.price.tail(1).mean(), self.price_history.preco.mean())
-            elif n <= 20:
-                pass
-                # self.current_state[n] = f(
-                #    self.price_history.price.tail(1), self.risk_free, self.price_history.dividend.tail(1))
-            elif n <= 25:
-                pass
-                # self.current_state[n] = f(
-                #    self.price_history.price.iloc[-n + 20] - self.price_history.price.iloc[-n + 21])
-            elif n <= 29:
-                pass
-                # self.current_state[n] = f(
-                #    self.price_history.dividend.iloc[-n + 25] - self.price_history.dividend.iloc[-n + 26])
-            elif n <= 34:
-                pass
-            elif n <= 38:
-                pass
-            elif n <= 43:
-                pass
-            elif n <= 47:
-                pass
-            elif n <= 53:
-                pass
-            else:
-                pass  # [0.25, 0.5, 0.75, .875, .95, 1, 1.125]"""
-        self.current_state[0] = bool(Decimal(self.dividend_history[-1]) / Decimal(mean(self.dividend_history)) > 0.6)
-        self.current_state[1] = bool(
-            Decimal(self.dividend_history[-1]) / Decimal(mean(self.dividend_history)) > 0.8)
-        self.current_state[2] = bool(
-            Decimal(self.dividend_history[-1]) / Decimal(mean(self.dividend_history)) > 0.9)
-        self.current_state[3] = bool(
-            Decimal(self.dividend_history[-1]) / Decimal(mean(self.dividend_history)) > 1.1)
-        self.current_state[4] = bool(
-            Decimal(self.dividend_history[-1]) / Decimal(mean(self.dividend_history)) > 1.12)
-        self.current_state[5] = bool(
-            Decimal(self.dividend_history[-1]) / Decimal(mean(self.dividend_history)) > 1.4)
-        self.current_state[6] = bool(
-            Decimal(self.price_history[-1]) / Decimal(mean(self.price_history)) > 0.25)
-        self.current_state[7] = bool(
-            Decimal(self.price_history[-1]) / Decimal(mean(self.price_history)) > 0.5)
-        self.current_state[8] = bool(
-            Decimal(self.price_history[-1]) / Decimal(mean(self.price_history)) > 0.75)
-        self.current_state[9] = bool(
-            Decimal(self.price_history[-1]) / Decimal(mean(self.price_history)) > 0.875)
-        self.current_state[10] = bool(
-            Decimal(self.price_history[-1]) / Decimal(mean(self.price_history)) > 1)
-        self.current_state[11] = bool(
-            Decimal(self.price_history[-1]) / Decimal(mean(self.price_history)) > 1.125)
-        self.current_state[12] = bool(
-            Decimal(self.price_history[-1]) / Decimal(mean(self.price_history)) > 1.25)
-        self.current_state[13] = bool(
-            Decimal(self.price_history[-1]) * self.risk_free / Decimal(mean(self.dividend_history)) > 0.25)
-        self.current_state[14] = bool(
-            Decimal(self.price_history[-1]) * self.risk_free / Decimal(mean(self.dividend_history)) > 0.5)
-        self.current_state[15] = bool(
-            Decimal(self.price_history[-1]) * self.risk_free / Decimal(mean(self.dividend_history)) > 0.75)
-        self.current_state[16] = bool(
-            Decimal(self.price_history[-1]) * self.risk_free / Decimal(mean(self.dividend_history)) > 0.875)
-        self.current_state[17] = bool(
-            Decimal(self.price_history[-1]) * self.risk_free / Decimal(mean(self.dividend_history)) > 0.95)
-        self.current_state[18] = bool(
-            Decimal(self.price_history[-1]) * self.risk_free / Decimal(mean(self.dividend_history)) > 1)
-        self.current_state[19] = bool(
-            Decimal(self.price_history[-1]) * self.risk_free / Decimal(mean(self.dividend_history)) > 1.125)
-        if step > 10:
-            self.current_state[20] = bool(self.price_history[-1] - self.price_history[-2] > 0)
-            self.current_state[21] = bool(self.price_history[-2] - self.price_history[-3] > 0)
-            self.current_state[22] = bool(self.price_history[-3] - self.price_history[-4] > 0)
-            self.current_state[23] = bool(self.price_history[-4] - self.price_history[-5] > 0)
-            self.current_state[24] = bool(self.price_history[-5] - self.price_history[-6] > 0)
-            self.current_state[25] = bool(self.price_history[-6] - self.price_history[-7] > 0)
-            self.current_state[26] = bool(self.dividend_history[-1] - self.dividend_history[-2] > 0)
-            self.current_state[27] = bool(self.dividend_history[-2] - self.dividend_history[-3] > 0)
-            self.current_state[28] = bool(self.dividend_history[-3] - self.dividend_history[-4] > 0)
-            self.current_state[29] = bool(self.dividend_history[-4] - self.dividend_history[-5] > 0)
-        self.current_state[30] = bool(mean(self.price_history[-5:]) > mean(self.price_history[-6:-1]))
-        self.current_state[31] = bool(mean(self.price_history[-10:]) > mean(self.price_history[-11:-1]))
-        self.current_state[32] = bool(mean(self.price_history[-20:]) > mean(self.price_history[-21:-1]))
-        self.current_state[33] = bool(mean(self.price_history[-100:]) > mean(self.price_history[-101:-1]))
-        self.current_state[34] = bool(mean(self.price_history[-500:]) > mean(self.price_history[-501:-1]))
-        self.current_state[35] = bool(mean(self.dividend_history[-5:]) > mean(self.dividend_history[-6:-1]))
-        self.current_state[36] = bool(mean(self.dividend_history[-10:]) > mean(self.dividend_history[-11:-1]))
-        self.current_state[37] = bool(mean(self.dividend_history[-100:]) > mean(self.dividend_history[-101:-1]))
-        self.current_state[38] = bool(mean(self.dividend_history[-500:]) > mean(self.dividend_history[-501:-1]))
-        self.current_state[39] = bool(self.price_history[-1] > mean(self.price_history[-5:]))
-        self.current_state[40] = bool(self.price_history[-1] > mean(self.price_history[-10:]))
-        self.current_state[41] = bool(self.price_history[-1] > mean(self.price_history[-20:]))
-        self.current_state[42] = bool(self.price_history[-1] > mean(self.price_history[-100:]))
-        self.current_state[43] = bool(self.price_history[-1] > mean(self.price_history[-500:]))
-        self.current_state[44] = bool(self.dividend_history[-1] > mean(self.dividend_history[-5:]))
-        self.current_state[45] = bool(self.dividend_history[-1] > mean(self.dividend_history[-10:]))
-        self.current_state[46] = bool(self.dividend_history[-1] > mean(self.dividend_history[-100:]))
-        self.current_state[47] = bool(self.dividend_history[-1] > mean(self.dividend_history[-500:]))
-        self.current_state[48] = bool(mean(self.dividend_history[-5:]) > mean(self.dividend_history[-10:]))
-        self.current_state[49] = bool(mean(self.dividend_history[-5:]) > mean(self.dividend_history[-100:]))
-        self.current_state[50] = bool(mean(self.dividend_history[-5:]) > mean(self.dividend_history[-500:]))
-        self.current_state[51] = bool(mean(self.dividend_history[-10:]) > mean(self.dividend_history[-100:]))
-        self.current_state[52] = bool(mean(self.dividend_history[-10:]) > mean(self.dividend_history[-500:]))
-        self.current_state[53] = bool(mean(self.dividend_history[-100:]) > mean(self.dividend_history[-500:]))
-        self.current_state[54] = bool(mean(self.price_history[-5:]) > mean(self.price_history[-10:]))
-        self.current_state[55] = bool(mean(self.price_history[-5:]) > mean(self.price_history[-20:]))
-        self.current_state[56] = bool(mean(self.price_history[-5:]) > mean(self.price_history[-100:]))
-        self.current_state[57] = bool(mean(self.price_history[-5:]) > mean(self.price_history[-500:]))
-        self.current_state[58] = bool(mean(self.price_history[-10:]) > mean(self.price_history[-20:]))
-        self.current_state[59] = bool(mean(self.price_history[-10:]) > mean(self.price_history[-100:]))
-        self.current_state[60] = bool(mean(self.price_history[-10:]) > mean(self.price_history[-500:]))
-        self.current_state[61] = bool(mean(self.price_history[-20:]) > mean(self.price_history[-100:]))
-        self.current_state[62] = bool(mean(self.price_history[-20:]) > mean(self.price_history[-500:]))
-        self.current_state[63] = bool(mean(self.price_history[-100:]) > mean(self.price_history[-500:]))
+        """
+        Atualiza os 64 bits de informação do mercado a partir do histórico de preços e dividendos
+
+        :param step: passo atual; os bits 20 a 29 (sentido dos preços e dividendos) só são atualizados após o passo 10
+        """
+        state = self.state_calculator.compute(step, self.current_state)
+        self.current_state = state.tolist()
+        self.state_word = int(np.packbits(state, bitorder='little').view('<u8')[0])
 
     @staticmethod
     def write_step(step, price, dividend, variation, volume, is_rationed, pct_bit, excess_demand, file_obj,
                    header=False):
-        df = dict(step=step, price=Decimal(price), dividend=Decimal(dividend), variation=variation, volume=volume,
+        df = dict(step=step, price=price, dividend=dividend, variation=variation, volume=volume,
                   is_rationed=is_rationed, pct_zero_bit=pct_bit, excess_demand=excess_demand)
         writer = csv.writer(file_obj,delimiter=';')
         if header:
@@ -203,32 +298,201 @@ class MarketInfo:
         writer.writerow(list(df.values()))
 
     def update_history(self, price, dividend):
+        if len(self.price_history) == self.price_history.capacity:
+            # o buffer descarta o elemento mais antigo ao receber um novo
+            self.state_calculator.drop_oldest()
         self.price_history.append(price)
         self.dividend_history.append(dividend)
+        self.state_calculator.push()
+
+    def restore_history(self, prices, dividends, current_state):
+        """
+        Substitui o histórico e o estado do mercado (usado ao retomar um checkpoint) e recalcula as somas do
+        StateCalculator
+
+        :param prices: preços, do mais antigo ao mais recente
+        :param dividends: dividendos, do mais antigo ao mais recente
+        :param current_state: lista com os 64 bits de estado
+        """
+        history_dtype = self.price_history.values().dtype
+        self.price_history = RingBuffer(self.price_history.capacity, history_dtype)
+        self.dividend_history = RingBuffer(self.dividend_history.capacity, history_dtype)
+        self.state_calculator = StateCalculator(self.price_history, self.dividend_history, self.risk_free, self.num)
+        for price, dividend in zip(prices, dividends):
+            self.update_history(price, dividend)
+        self.current_state = list(current_state)
+        self.state_word = pack_bits(self.current_state)
 
     def unburden_history(self):
-        if len(self.price_history) >= 505:
-            del self.price_history[0]
-            del self.dividend_history[0]
+        """
+        Descarta o elemento mais antigo quando o histórico enche, deixando espaço para o próximo passo
+        """
+        if len(self.price_history) >= self.price_history.capacity:
+            self.state_calculator.drop_oldest()
+            self.price_history.popleft()
+            self.dividend_history.popleft()
+
+
+def ar1_path(x0, revision_speed, noise):
+    """
+    Recursão AR(1) x_t = revision_speed * x_{t-1} + noise_t calculada sem laço: em cada bloco
+    x_t = r^t * (x_0 + soma_k<=t noise_k / r^k). O tamanho do bloco é limitado para que r^-t não estoure o float.
+
+    :param x0: valor anterior ao primeiro passo
+    :param noise: array com o ruído de cada passo
+    :return: array com x_1 ... x_n
+    """
+    r = float(revision_speed)
+    if r == 0:
+        return np.array(noise, dtype=float)
+    block = len(noise) if abs(r) >= 1 else max(int(300 / -np.log10(abs(r))), 1)
+    path = np.empty(len(noise))
+    for start in range(0, len(noise), block):
+        powers = r ** np.arange(1, min(block, len(noise) - start) + 1)
+        path[start:start + len(powers)] = powers * (x0 + np.cumsum(noise[start:start + len(powers)] / powers))
+        x0 = path[start + len(powers) - 1]
+    return path
+
+
+class DividendPath:
+    """
+    Dividendos AR(1) de Stock gerados em blocos de chunk_size passos (ruído sorteado de uma vez e ar1_path) e
+    servidos um por passo. Os valores são float e não são iguais, bit a bit, aos da recursão passo a passo de
+    Stock.update_dividend.
+
+    Com values o caminho é fixo (ex. um arquivo gravado por save e aberto por load em cada simulação de um ensemble,
+    para que todas usem os mesmos números aleatórios) e nada é sorteado.
+    """
+
+    def __init__(self, dividend_mean, revision_speed, dividend_error_var, initial_dividend, rng=None, chunk_size=4096,
+                 values=None):
+        """
+        :param rng: numpy.random.Generator do ruído; None usa entropia do sistema
+        :param values: caminho fixo de dividendos, um por passo
+        """
+        self.dividend_mean = float(dividend_mean)
+        self.revision_speed = float(revision_speed)
+        self.dividend_error_var = float(dividend_error_var)
+        self.initial_dividend = float(initial_dividend)
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.chunk_size = chunk_size
+        self.values = values
+        self._rng_state = self.rng.bit_generator.state
+        self.seek(0)
+
+    def seek(self, position):
+        """
+        Posiciona o caminho para que next devolva o dividendo do passo position. Sem values o caminho é refeito desde
+        o início a partir do estado inicial do gerador, então o resultado é o mesmo de uma execução sem interrupção.
+        """
+        self.position = position
+        if self.values is not None:
+            return
+        self.rng.bit_generator.state = self._rng_state
+        self._last = self.initial_dividend
+        self._buffer = np.empty(0)
+        self._start = 0
+        while self._start + len(self._buffer) <= position:
+            self._generate()
+
+    def _generate(self):
+        self._start += len(self._buffer)
+        noise = self.rng.normal(0, self.dividend_error_var, self.chunk_size)
+        self._buffer = ar1_path(self._last - self.dividend_mean, self.revision_speed, noise) + self.dividend_mean
+        self._last = self._buffer[-1]
+
+    def next(self):
+        """
+        :return: dividendo do passo atual (float), avançando um passo
+        """
+        position = self.position
+        self.position += 1
+        if self.values is not None:
+            if position >= len(self.values):
+                raise IndexError('Caminho de dividendos com {} passos'.format(len(self.values)))
+            return float(self.values[position])
+        if position - self._start >= len(self._buffer):
+            self._generate()
+        return float(self._buffer[position - self._start])
+
+    def take(self, n_steps):
+        """
+        :return: array com os próximos n_steps dividendos, avançando n_steps passos
+        """
+        if self.values is not None:
+            if self.position + n_steps > len(self.values):
+                raise IndexError('Caminho de dividendos com {} passos'.format(len(self.values)))
+            part = np.array(self.values[self.position:self.position + n_steps], dtype=float)
+            self.position += n_steps
+            return part
+        parts = []
+        while n_steps > 0:
+            offset = self.position - self._start
+            if offset >= len(self._buffer):
+                self._generate()
+                continue
+            part = self._buffer[offset:offset + n_steps]
+            parts.append(part)
+            self.position += len(part)
+            n_steps -= len(part)
+        return np.concatenate(parts) if parts else np.empty(0)
+
+    def save(self, filepath, n_steps):
+        """
+        Grava os próximos n_steps dividendos em um .npy, a ser aberto por load
+
+        :return: filepath
+        """
+        np.save(filepath, self.take(n_steps))
+        return filepath
+
+    @classmethod
+    def load(cls, filepath):
+        """
+        :return: DividendPath fixo com os valores do arquivo, mapeado em memória (sem cópia por processo)
+        """
+        values = np.load(filepath, mmap_mode='r')
+        return cls(0, 0, 0, values[0] if len(values) else 0, values=values)
 
 
 class Stock:
 
     def __init__(self, initial_price, initial_dividend, dividend_mean, revision_speed, dividend_error_var=0.075,
-                 reproduce=False):
-        self.dividend_mean = Decimal(dividend_mean)
-        self.current_price = Decimal(initial_price)
-        self.current_dividend = Decimal(initial_dividend)
-        self.revision_speed = Decimal(revision_speed)
+                 reproduce=False, numeric=Decimal, rng=None):
+        """
+        :param reproduce: sem rng, usa um gerador com semente 0 para repetir a mesma sequência de dividendos
+        :param rng: numpy.random.Generator do ruído dos dividendos
+        """
+        self.num = numeric
+        self.dividend_mean = numeric(dividend_mean)
+        self.current_price = numeric(initial_price)
+        self.current_dividend = numeric(initial_dividend)
+        self.revision_speed = numeric(revision_speed)
         self.dividend_error_var = float(dividend_error_var)
         self.reproduce = bool(reproduce)
+        if rng is None:
+            rng = np.random.default_rng(0 if self.reproduce else None)
+        self.rng = rng
+        self.dividend_path = None
+
+    def bulk_dividends(self, values=None, chunk_size=4096):
+        """
+        Passa a servir os dividendos de um DividendPath gerado em blocos com os parâmetros e o gerador deste Stock,
+        ou com o caminho fixo values
+
+        :return: o DividendPath
+        """
+        self.dividend_path = DividendPath(self.dividend_mean, self.revision_speed, self.dividend_error_var,
+                                          self.current_dividend, self.rng, chunk_size, values)
+        return self.dividend_path
 
     def update_dividend(self):
-        if self.reproduce:
-            random.seed(0)
-        error = Decimal(random.gauss(0, self.dividend_error_var))
+        if self.dividend_path is not None:
+            self.current_dividend = self.num(self.dividend_path.next())
+            return
+        error = self.num(self.rng.normal(0, self.dividend_error_var))
         new_dividend = self.dividend_mean + self.revision_speed * (self.current_dividend - self.dividend_mean) + error
-        self.current_dividend = Decimal(new_dividend)
+        self.current_dividend = new_dividend
 
     def update_price(self, price):
         self.current_price = price
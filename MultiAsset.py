@@ -0,0 +1,144 @@
+from collections import namedtuple
+
+import numpy as np
+
+from Market import MarketInfo
+from Population import PopulationEngine
+from Simulation import RNG_STREAMS
+
+MultiStepRecord = namedtuple('MultiStepRecord', ['step', 'prices', 'dividends', 'is_rationed', 'excess_demand'])
+
+
+class MultiAssetSimulation:
+    """
+    Mercado com vários ativos negociados pelos mesmos agentes. Cada ativo tem o seu processo de dividendos (AR(1),
+    como Stock) e o seu estado de mercado (um MarketInfo por ativo), e cada agente tem um conjunto de regras para cada
+    ativo.
+
+    Todas as regras ficam em um único PopulationEngine com uma linha por par (ativo, agente), na ordem
+    ativo * n_agents + agente, então escolha da regra, demandas, atualização da accuracy e algoritmo genético de todos
+    os ativos são feitos em uma chamada. O preço de todos os ativos é calculado de uma vez pela fórmula de equilíbrio
+    de Specialist.find_price ('clearing'), com o racionamento de Specialist.normalize_demands.
+
+    O caixa é único por agente; para a restrição de caixa de cada ativo o caixa é dividido igualmente entre os
+    ativos. Usa sempre float. Oferta de ações, limites de preço e primeiro passo seguem Simulation, então com um único
+    ativo e a mesma semente o caminho de preços é o de Simulation com price_setting 'clearing' no modo vetorizado.
+    """
+
+    def __init__(self, n_agents, n_assets, n_steps, n_rules=100, seed=None, initial_price=80, initial_dividend=10,
+                 dividend_mean=10, revision_speed=0.95, dividend_error_var=0.075, ga_frquency=10, genetic_param=0.9,
+                 risk_free=0.05, risk_aversion=0.5, cash=20000, min_price=0.01, max_price=200):
+        """
+        :param initial_price, initial_dividend, dividend_mean: número ou um valor por ativo
+        :param seed: semente dos geradores aleatórios (ver Simulation)
+        """
+        self.n_agents = n_agents
+        self.n_assets = n_assets
+        self.n_steps = n_steps
+        self.ga_frquency = ga_frquency
+        self.genetic_param = genetic_param
+        self.min_price = min_price
+        self.max_price = max_price
+        self.rngs = dict(zip(RNG_STREAMS, map(np.random.default_rng, np.random.SeedSequence(seed).spawn(
+            len(RNG_STREAMS)))))
+        self.engine = PopulationEngine.random(n_assets * n_agents, n_rules, self.rngs['agents'],
+                                              risk_free=risk_free, risk_aversion=risk_aversion)
+        self.cash = np.full(n_agents, float(cash))
+        self.stock_qty = np.ones((n_assets, n_agents))
+        # oferta de ações de cada ativo usada na fórmula do preço, como em Simulation.initialiaze_agents
+        self.num_shares = np.full(n_assets, n_agents + 1.)
+        self.dividend_mean = np.broadcast_to(np.asarray(dividend_mean, dtype=float), n_assets).copy()
+        self.revision_speed = revision_speed
+        self.dividend_error_var = dividend_error_var
+        self.dividends = np.broadcast_to(np.asarray(initial_dividend, dtype=float), n_assets).copy()
+        self.prices = np.broadcast_to(np.asarray(initial_price, dtype=float), n_assets).copy()
+        self.markets = [MarketInfo(dividend_mean=self.dividend_mean[k], numeric=float) for k in range(n_assets)]
+        for k, market in enumerate(self.markets):
+            market.update_history(self.prices[k], self.dividends[k])
+
+    def _rows(self, values):
+        """
+        :return: valores por ativo repetidos para cada agente, um por linha do engine
+        """
+        return np.repeat(values, self.n_agents)
+
+    def update_dividends(self):
+        noise = self.rngs['dividends'].normal(0, self.dividend_error_var, self.n_assets)
+        self.dividends = self.dividend_mean + self.revision_speed * (self.dividends - self.dividend_mean) + noise
+
+    def clear(self, dividends, selection):
+        """
+        Preço de equilíbrio de todos os ativos de uma vez (mesma fórmula de Specialist.find_price) e demandas dos
+        agentes, racionadas nos ativos em que o preço foi limitado a [min_price, max_price]
+
+        :return: (preços, demandas (ativos x agentes), BOOL de racionamento por ativo)
+        """
+        engine = self.engine
+        _, _, a, b, sigma = selection
+        shape = (self.n_assets, self.n_agents)
+        num = ((b + a * self._rows(dividends)) / sigma).reshape(shape)
+        den = ((a - 1 - engine.risk_free) / sigma).reshape(shape)
+        risk_aversion = engine.risk_aversion.reshape(shape)[:, 0]
+        prices = (risk_aversion * self.num_shares - num.sum(axis=1)) / den.sum(axis=1)
+        is_rationed = (prices <= self.min_price) | (prices >= self.max_price)
+        # como em Specialist.find_price, as demandas são as do preço antes do limite
+        demands = engine.demands(self._rows(prices), self._rows(dividends), selection).reshape(shape)
+        prices = np.clip(prices, self.min_price, self.max_price)
+        # racionamento: as compras são reduzidas proporcionalmente às ofertas
+        offers = -np.where(demands < 0, demands, 0).sum(axis=1, keepdims=True)
+        bids = np.where(demands > 0, demands, 0)
+        sum_bids = bids.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rationed = np.where(sum_bids > 0, bids / sum_bids, 0) * offers
+        demands = np.where(is_rationed[:, None] & (demands > 0), rationed, demands)
+        return prices, demands, is_rationed
+
+    def run_step(self, step):
+        """
+        :return: MultiStepRecord
+        """
+        engine = self.engine
+        states = self._rows(np.array([market.state_word for market in self.markets], dtype=np.uint64))
+        last_prices = self.prices
+        last_dividends = np.array([market.dividend_history[-1] for market in self.markets])
+        self.update_dividends()
+        # como em Simulation.run_step, o primeiro passo usa o dividendo inicial e o processo AR(1) segue do sorteado
+        dividends = self.dividends if step != 0 else last_dividends
+        engine.cash[:] = np.tile(self.cash / self.n_assets, self.n_assets)
+        engine.stock_qty[:] = self.stock_qty.ravel()
+        selection = engine.select(states)
+        prices, demands, is_rationed = self.clear(dividends, selection)
+        self.stock_qty += demands
+        self.cash -= (demands * prices[:, None]).sum(axis=0)
+        if step != 0:
+            engine.update_accuracy(states, self._rows(prices), self._rows(last_prices), self._rows(dividends),
+                                   self._rows(last_dividends), 75)
+        if step % self.ga_frquency == 0 and step != 0:
+            rows = np.arange(engine.n_agents)
+            engine.genetic_algo(rows, self.genetic_param, engine.median_accuracy(), rng=self.rngs['mutation'],
+                                crossover_rng=self.rngs['crossover'])
+        self.prices = prices
+        for k, market in enumerate(self.markets):
+            market.update_history(prices[k], dividends[k])
+            market.update_info_state(step)
+            market.unburden_history()
+        return MultiStepRecord(step, prices, dividends.copy(), is_rationed, demands.sum(axis=1))
+
+    def iter_steps(self):
+        """
+        :return: gerador de MultiStepRecord, um por passo
+        """
+        for step in range(self.n_steps):
+            yield self.run_step(step)
+
+    def run(self):
+        """
+        :return: dict com arrays (passos x ativos) de preços, dividendos e racionamento
+        """
+        prices = np.zeros((self.n_steps, self.n_assets))
+        dividends = np.zeros((self.n_steps, self.n_assets))
+        rationed = np.zeros((self.n_steps, self.n_assets), dtype=bool)
+        for record in self.iter_steps():
+            prices[record.step], dividends[record.step], rationed[record.step] = (record.prices, record.dividends,
+                                                                                  record.is_rationed)
+        return dict(prices=prices, dividends=dividends, is_rationed=rationed)
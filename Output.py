@@ -0,0 +1,150 @@
+import csv
+import datetime
+import os
+import zipfile
+
+import numpy as np
+
+COLUMNS = ('step', 'price', 'dividend', 'variation', 'volume', 'is_rationed', 'pct_bit', 'excess_demand')
+STEP_DTYPE = np.dtype([('step', '<i8'), ('price', '<f8'), ('dividend', '<f8'), ('variation', '<f8'),
+                       ('volume', '<f8'), ('is_rationed', '<i1'), ('pct_bit', '<f8'), ('excess_demand', '<f8')])
+
+
+def default_filepath(output_format='csv', directory='output'):
+    """
+    :return: caminho exclusivo para a saída de uma simulação, ex. output/price_20240131-154501-123456.csv
+    """
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    return os.path.join(directory, 'price_{}.{}'.format(stamp, output_format))
+
+
+def make_parent_dir(filepath):
+    """
+    Cria o diretório de filepath, se houver e ainda não existir (ex. output/ num checkout novo)
+    """
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+class OutputSink:
+    """
+    Destino dos registros de cada passo da simulação. Os registros ficam em memória e são gravados a cada
+    flush_every passos, e o arquivo é aberto em modo de escrita: cada simulação tem o seu arquivo e um único
+    cabeçalho.
+    """
+
+    def __init__(self, filepath, flush_every=1000):
+        self.filepath = filepath
+        self.flush_every = flush_every
+        self.rows = []
+
+    def write(self, step, price, dividend, variation, volume, is_rationed, pct_bit, excess_demand):
+        self.rows.append((step, price, dividend, variation, volume, int(is_rationed), pct_bit, excess_demand))
+        if len(self.rows) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self._write_rows(self.rows)
+            self.rows = []
+
+    def _write_rows(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVSink(OutputSink):
+    """
+    CSV separado por ';' com o mesmo layout de MarketInfo.write_step. Os valores são gravados como recebidos, então
+    no modo decimal a precisão dos Decimal é mantida.
+    """
+
+    def __init__(self, filepath, flush_every=1000):
+        super().__init__(filepath, flush_every)
+        make_parent_dir(filepath)
+        self.file_obj = open(filepath, mode='w', newline='')
+        self.writer = csv.writer(self.file_obj, delimiter=';')
+        self.writer.writerow(COLUMNS)
+
+    def _write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        super().close()
+        self.file_obj.close()
+
+
+class NpzSink(OutputSink):
+    """
+    Arquivo .npz em que cada flush grava um bloco 'chunk_<n>.npy' com um array estruturado (STEP_DTYPE). Os valores
+    são convertidos para float64, e o arquivo é lido de volta com read_output.
+    """
+
+    def __init__(self, filepath, flush_every=10000):
+        super().__init__(filepath, flush_every)
+        make_parent_dir(filepath)
+        self.archive = zipfile.ZipFile(filepath, mode='w')
+        self.n_chunks = 0
+
+    def _write_rows(self, rows):
+        chunk = np.array([tuple(map(float, row)) for row in rows], dtype=STEP_DTYPE)
+        with self.archive.open('chunk_{:06d}.npy'.format(self.n_chunks), mode='w', force_zip64=True) as f:
+            np.lib.format.write_array(f, chunk)
+        self.n_chunks += 1
+
+    def close(self):
+        super().close()
+        self.archive.close()
+
+
+class NullSink(OutputSink):
+    """
+    Descarta os registros, para simulações consumidas só por Simulation.iter_steps
+    """
+
+    def __init__(self):
+        super().__init__(None)
+
+    def write(self, *record):
+        pass
+
+
+SINKS = {'csv': CSVSink, 'npz': NpzSink}
+
+
+def open_sink(filepath, output_format='csv', flush_every=None):
+    """
+    :param output_format: 'csv' ou 'npz'
+    :param flush_every: passos entre gravações, por padrão o do formato
+    :return: OutputSink
+    """
+    sink = SINKS[output_format]
+    if flush_every is None:
+        return sink(filepath)
+    return sink(filepath, flush_every)
+
+
+def read_output(filepath):
+    """
+    Lê a saída de uma simulação
+
+    :param filepath: arquivo .csv ou .npz gravado por um OutputSink
+    :return: dicionário coluna -> numpy array
+    """
+    if filepath.endswith('.npz'):
+        with np.load(filepath) as data:
+            chunks = [data[name] for name in sorted(data.files)]
+        table = np.concatenate(chunks) if chunks else np.empty(0, dtype=STEP_DTYPE)
+    else:
+        table = np.genfromtxt(filepath, delimiter=';', names=True, dtype=STEP_DTYPE)
+        table = np.atleast_1d(table)
+    return {column: table[column] for column in COLUMNS}
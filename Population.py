@@ -0,0 +1,639 @@
+import os
+
+import numpy as np
+
+from Agents import Rule, Investor
+
+RULE_ARRAYS = ('care', 'value', 'alpha', 'beta', 'accuracy', 'specificity')
+AGENT_ARRAYS = ('cash', 'stock_qty', 'risk_free', 'risk_aversion')
+
+
+def pack_rows(bits):
+    """
+    Empacota um array BOOL (..., 64) em inteiros de 64 bits: a coluna n vira o bit n
+    """
+    packed = np.packbits(bits, axis=-1, bitorder='little')
+    return packed.view('<u8')[..., 0].astype(np.uint64)
+
+
+def popcount(masks):
+    """
+    Número de bits ligados em cada elemento de um array uint64
+    """
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks)
+    bytes_ = np.ascontiguousarray(masks, dtype='<u8')[..., None].view(np.uint8)
+    return np.unpackbits(bytes_, axis=-1).sum(axis=-1)
+
+
+def per_agent(values):
+    """
+    :return: float, ou array coluna (agentes x 1) se values tiver um valor por agente
+    """
+    values = np.asarray(values, dtype=float)
+    return values[:, None] if values.ndim else float(values)
+
+
+class PopulationEngine:
+    """
+    Representação vetorizada da população de investidores: guarda alpha, beta, accuracy e as máscaras das condições
+    de todas as regras de todos os agentes em arrays (agentes x regras), permitindo escolher a regra, a previsão, a
+    demanda e a derivada da demanda de todos os agentes em uma única chamada.
+
+    Também serve de armazenamento compacto para populações grandes: cada regra ocupa bytes_per_rule() bytes, 41 com
+    float64 (duas máscaras uint64, alpha, beta e accuracy, e a especificidade em uint8) e 29 com float32, enquanto um
+    objeto 'Rule' com a watch_list ocupa por volta de 1.1 kB (float) a 1.5 kB (Decimal). Constantes como bit_cost
+    são da população, não de cada regra. Com filepath os arrays ficam em arquivos .npy mapeados em memória
+    (np.memmap), para populações maiores que a RAM; agent e rule devolvem visões (InvestorView, RuleView) sobre os
+    arrays. No modo vetorizado a Simulation roda só sobre o engine e cria os objetos com to_investors quando pedidos.
+
+    As contas de cada passo sobre todas as regras (regras ativas, escolha da regra, accuracy, mediana, ordenação por
+    fitness) são feitas em blocos de agentes com cerca de chunk_rules regras, e os temporários ficam no dtype dos
+    arrays: a memória extra de um passo é limitada pelo bloco, não pelo tamanho da população.
+    """
+    chunk_rules = 1 << 16
+
+    def __init__(self, n_agents, n_rules=100, dtype=np.float64, filepath=None):
+        """
+        :param n_agents: número de investidores
+        :param n_rules: número de regras de cada investidor
+        :param dtype: np.float64 ou np.float32, tipo de alpha, beta e accuracy
+        :param filepath: diretório dos arquivos mapeados em memória; None mantém os arrays na RAM
+        """
+        self.n_agents = n_agents
+        self.n_rules = n_rules
+        self.dtype = np.dtype(dtype)
+        self.filepath = filepath
+        if filepath is not None:
+            os.makedirs(filepath, exist_ok=True)
+        shape = (n_agents, n_rules)
+        self.care = self._allocate('care', shape, np.uint64, 0)
+        self.value = self._allocate('value', shape, np.uint64, 0)
+        self.alpha = self._allocate('alpha', shape, dtype, 0)
+        self.beta = self._allocate('beta', shape, dtype, 0)
+        self.accuracy = self._allocate('accuracy', shape, dtype, 4)
+        self.specificity = self._allocate('specificity', shape, np.uint8, 0)
+        self.bit_cost = 0.005
+        self.cash = self._allocate('cash', (n_agents,), np.float64, 0)
+        self.stock_qty = self._allocate('stock_qty', (n_agents,), np.float64, 0)
+        self.risk_free = self._allocate('risk_free', (n_agents,), np.float64, 0)
+        self.risk_aversion = self._allocate('risk_aversion', (n_agents,), np.float64, 0)
+        # regras trocadas e regras com accuracy alterada desde a última cópia para os objetos (ver store_rules e
+        # store_accuracy)
+        self.rules_changed = np.zeros(shape, dtype=bool)
+        self.accuracy_changed = np.zeros(shape, dtype=bool)
+        self.invalidate_conditions()
+
+    def _allocate(self, name, shape, dtype, fill):
+        if self.filepath is None:
+            return np.full(shape, fill, dtype=dtype)
+        array = np.lib.format.open_memmap(os.path.join(self.filepath, name + '.npy'), mode='w+', dtype=dtype,
+                                          shape=shape)
+        array[...] = fill
+        return array
+
+    @classmethod
+    def open(cls, filepath, mode='r+'):
+        """
+        Abre uma população gravada em filepath sem carregá-la na memória
+
+        :param mode: 'r+' (leitura e escrita), 'r' (só leitura) ou 'c' (cópia na escrita)
+        """
+        engine = cls.__new__(cls)
+        engine.filepath = filepath
+        for name in RULE_ARRAYS + AGENT_ARRAYS:
+            setattr(engine, name, np.load(os.path.join(filepath, name + '.npy'), mmap_mode=mode))
+        engine.n_agents, engine.n_rules = engine.care.shape
+        engine.dtype = engine.alpha.dtype
+        engine.bit_cost = 0.005
+        engine.rules_changed = np.zeros(engine.care.shape, dtype=bool)
+        engine.accuracy_changed = np.zeros(engine.care.shape, dtype=bool)
+        engine.invalidate_conditions()
+        return engine
+
+    def flush(self):
+        """
+        Grava no disco as alterações dos arrays mapeados em memória
+        """
+        for name in RULE_ARRAYS + AGENT_ARRAYS:
+            array = getattr(self, name)
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def bytes_per_rule(self):
+        """
+        :return: bytes ocupados por regra nos arrays (agentes x regras)
+        """
+        return sum(getattr(self, name).itemsize for name in RULE_ARRAYS)
+
+    def nbytes(self):
+        """
+        :return: bytes ocupados por todos os arrays da população
+        """
+        return sum(getattr(self, name).nbytes for name in RULE_ARRAYS + AGENT_ARRAYS)
+
+    @classmethod
+    def from_investors(cls, investors, dtype=np.float64, filepath=None):
+        engine = cls(len(investors), max(len(inv.trading_rules) for inv in investors), dtype, filepath)
+        engine.load(investors)
+        return engine
+
+    @classmethod
+    def random(cls, n_agents, n_rules=100, rng=None, dtype=np.float64, filepath=None, chunk_size=1000,
+               stock_qty=1, cash=20000, risk_free=0.05, risk_aversion=0.5):
+        """
+        Cria uma população nova direto nos arrays, sem objetos 'Investor' e 'Rule', com as mesmas distribuições de
+        Simulation.initialiaze_agents. Os agentes são sorteados em blocos de chunk_size para limitar a memória
+        temporária.
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        engine = cls(n_agents, n_rules, dtype, filepath)
+        for start in range(0, n_agents, chunk_size):
+            stop = min(start + chunk_size, n_agents)
+            watch = rng.choice(3, size=(stop - start, n_rules, 64), p=[.05, .05, .9])
+            engine.care[start:stop] = pack_rows(watch != 2)
+            engine.value[start:stop] = pack_rows(watch == 1)
+            engine.specificity[start:stop] = (watch != 2).sum(axis=2)
+            engine.alpha[start:stop] = rng.uniform(0.7, 1.2, (stop - start, n_rules))
+            engine.beta[start:stop] = rng.uniform(-10, 19, (stop - start, n_rules))
+        engine.cash[:], engine.stock_qty[:] = cash, stock_qty
+        engine.risk_free[:], engine.risk_aversion[:] = risk_free, risk_aversion
+        engine.invalidate_conditions()
+        return engine
+
+    def to_investors(self, numeric=float):
+        """
+        :return: lista de objetos 'Investor' independentes, com objetos 'Rule', com os valores dos arrays
+        """
+        care, value = self.care.tolist(), self.value.tolist()
+        alpha, beta, accuracy = self.alpha.tolist(), self.beta.tolist(), self.accuracy.tolist()
+        investors = []
+        for n in range(self.n_agents):
+            rules = []
+            for j in range(self.n_rules):
+                rule = Rule.from_masks(care[n][j], value[n][j], alpha[n][j], beta[n][j], numeric)
+                rule.accuracy = numeric(accuracy[n][j])
+                rules.append(rule)
+            investor = Investor(rules, float(self.stock_qty[n]), float(self.cash[n]), float(self.risk_free[n]),
+                                numeric)
+            investor.risk_aversion_coef = numeric(float(self.risk_aversion[n]))
+            investors.append(investor)
+        return investors
+
+    def agent(self, n):
+        """
+        :return: InvestorView do agente n
+        """
+        return InvestorView(self, n)
+
+    def rule(self, n, j):
+        """
+        :return: RuleView da regra j do agente n
+        """
+        return RuleView(self, n, j)
+
+    def load(self, investors):
+        """
+        Copia as regras e as carteiras dos objetos 'Investor' para os arrays
+        """
+        self.load_rules(investors)
+        self.load_portfolios(investors)
+
+    def load_rules(self, investors, agents=None):
+        """
+        :param agents: índices dos agentes a copiar, todos se None
+        """
+        if agents is None:
+            agents = range(self.n_agents)
+        self.invalidate_conditions()
+        for n in agents:
+            for j, rule in enumerate(investors[n].trading_rules):
+                self.care[n, j] = rule.care_mask
+                self.value[n, j] = rule.value_mask
+                self.alpha[n, j] = rule._alpha
+                self.beta[n, j] = rule._beta
+                self.accuracy[n, j] = rule.accuracy
+                self.specificity[n, j] = rule.specificity
+
+    def load_portfolios(self, investors):
+        for n, inv in enumerate(investors):
+            self.cash[n] = inv.cash
+            self.stock_qty[n] = inv.stock_qty
+            self.risk_free[n] = inv.risk_free
+            self.risk_aversion[n] = inv.risk_aversion_coef
+
+    def invalidate_conditions(self):
+        """
+        Descarta as condições distintas e as regras ativas guardadas. Deve ser chamado sempre que care ou value mudarem
+        """
+        self._conditions = None
+        self._active_state = None
+        self._active = None
+
+    def conditions(self):
+        """
+        Condições distintas da população, como Agents.CONDITION_POOL faz para os objetos 'Rule'. Usado só nas
+        estatísticas: com poucas condições repetidas, comparar as distintas e espalhar o resultado custa mais do que
+        comparar todas as regras
+
+        :return: (care, value) das condições distintas e, para cada regra (agentes x regras), o índice da sua condição
+        """
+        if self._conditions is None:
+            pairs = np.stack([self.care.ravel(), self.value.ravel()], axis=1)
+            unique, inverse = np.unique(pairs, axis=0, return_inverse=True)
+            self._conditions = (unique[:, 0], unique[:, 1], inverse.reshape(self.care.shape))
+        return self._conditions
+
+    def condition_stats(self):
+        """
+        :return: dict com o total de regras, as condições distintas e a razão condições / regras
+        """
+        care, _, _ = self.conditions()
+        return dict(rules=self.care.size, unique_conditions=len(care), unique_ratio=len(care) / self.care.size)
+
+    def chunks(self):
+        """
+        :return: lista de fatias de agentes com cerca de chunk_rules regras cada
+        """
+        rows = max(1, self.chunk_rules // max(self.n_rules, 1))
+        return [slice(start, min(start + rows, self.n_agents)) for start in range(0, self.n_agents, rows)]
+
+    def active_rules(self, market_state):
+        """
+        O resultado é reaproveitado enquanto o estado for o mesmo (escolha da regra, derivadas, atualização da
+        accuracy e telemetria do mesmo passo)
+
+        :param market_state: inteiro de 64 bits com o estado do mercado, ou array com um estado por agente (usado por
+        MultiAsset, em que cada linha é um par agente e ativo)
+        :return: array BOOL (agentes x regras) das regras ativas, que não deve ser alterado
+        """
+        scalar = np.ndim(market_state) == 0
+        if scalar:
+            key, state = int(market_state), np.uint64(market_state)
+        else:
+            state = np.asarray(market_state, dtype=np.uint64)[:, None]
+            key = state.tobytes()
+        if key != self._active_state:
+            if self._active is None:
+                self._active = np.empty(self.care.shape, dtype=bool)
+            for rows in self.chunks():
+                np.equal((self.value[rows] ^ (state if scalar else state[rows])) & self.care[rows], 0,
+                         out=self._active[rows])
+            self._active_state = key
+        return self._active
+
+    def select(self, market_state):
+        """
+        Equivalente vetorizado de Investor.select_rule: regra ativa de maior accuracy (empate fica com a primeira) ou,
+        se nenhuma estiver ativa, a média dos coeficientes de todas as regras ponderada por 1/accuracy.
+
+        :return: (índice da regra escolhida, BOOL se há regra ativa, alpha, beta, accuracy), arrays por agente
+        """
+        active = self.active_rules(market_state)
+        index = np.empty(self.n_agents, dtype=np.intp)
+        has_active = np.empty(self.n_agents, dtype=bool)
+        a, b, sigma = (np.empty(self.n_agents, dtype=self.dtype) for _ in range(3))
+        for rows in self.chunks():
+            chunk_active, accuracy = active[rows], self.accuracy[rows]
+            alpha, beta = self.alpha[rows], self.beta[rows]
+            index[rows] = np.where(chunk_active, accuracy, -np.inf).argmax(axis=1)
+            has_active[rows] = chunk_active.any(axis=1)
+            chosen = np.arange(len(accuracy)), index[rows]
+            weights = 1 / accuracy
+            a[rows] = np.where(has_active[rows], alpha[chosen], (weights * alpha).sum(axis=1) / weights.sum(axis=1))
+            b[rows] = np.where(has_active[rows], beta[chosen], (weights * beta).sum(axis=1) / weights.sum(axis=1))
+            sigma[rows] = np.where(has_active[rows], accuracy[chosen], 4.)
+        return index, has_active, a, b, sigma
+
+    def forecast(self, price, dividend, selection):
+        _, _, a, b, _ = selection
+        return a * (price + dividend) + b
+
+    def demands(self, price, dividend, selection):
+        """
+        Equivalente vetorizado de Investor.stock_demand para todos os agentes
+
+        :param selection: resultado de select
+        :return: array de demandas
+        """
+        sigma = selection[4]
+        denominator = self.risk_aversion * sigma
+        with np.errstate(divide='ignore', invalid='ignore'):
+            opt_qty = np.where(denominator != 0,
+                               (self.forecast(price, dividend, selection) - price * (1 + self.risk_free)) / denominator,
+                               1.)
+        opt_qty = np.where(opt_qty * price > self.cash, self.cash / price + self.stock_qty, opt_qty)
+        opt_qty = np.where(opt_qty <= -self.stock_qty, 0., opt_qty)
+        return opt_qty - self.stock_qty
+
+    def demand_derivatives(self, selection):
+        """
+        Equivalente vetorizado de Investor.demand_derivative
+        """
+        _, _, a, _, sigma = selection
+        return (a - 1 - self.risk_free) / (self.risk_aversion * sigma)
+
+    def evaluate(self, market_state, price, dividend):
+        """
+        Escolhe a regra, calcula previsão, demanda e derivada da demanda de todos os agentes
+
+        :return: (selection, forecast, demandas, derivadas)
+        """
+        selection = self.select(market_state)
+        return (selection, self.forecast(price, dividend, selection), self.demands(price, dividend, selection),
+                self.demand_derivatives(selection))
+
+    def update_accuracy(self, market_state, pt, pt_1, dt, dt_1, teta):
+        """
+        Equivalente vetorizado de Rule.update_fitness_accuracy aplicado a todas as regras ativas de todos os agentes
+
+        :param pt, pt_1, dt, dt_1: números ou arrays com um valor por agente
+        :return: array BOOL (agentes x regras) das regras atualizadas
+        """
+        active = self.active_rules(market_state)
+        pt, pt_1, dt, dt_1 = (per_agent(x) for x in (pt, pt_1, dt, dt_1))
+        realized, last = pt + dt, pt_1 + dt_1
+        if np.ndim(last):
+            realized, last = realized.astype(self.dtype), last.astype(self.dtype)
+        for rows in self.chunks():
+            chunk_realized = realized[rows] if np.ndim(realized) else realized
+            chunk_last = last[rows] if np.ndim(last) else last
+            forecast = self.alpha[rows] * chunk_last + self.beta[rows]
+            error = np.minimum((chunk_realized - forecast) ** 2, 100.)
+            updated = (1 - teta ** -1) * self.accuracy[rows] + teta ** -1 * error
+            np.copyto(self.accuracy[rows], updated, where=active[rows])
+            self.accuracy_changed[rows] |= active[rows]
+        return active
+
+    def store_accuracy(self, investors):
+        """
+        Copia para os objetos 'Rule' a accuracy das regras alteradas desde a última cópia. Durante a simulação a
+        accuracy só é mantida nos arrays; a cópia é feita quando os objetos são usados (checkpoint, fim da simulação)
+        """
+        for n, j in zip(*np.nonzero(self.accuracy_changed)):
+            investors[n].set_rule_accuracy(j, float(self.accuracy[n, j]))
+        self.accuracy_changed[...] = False
+
+    def median_accuracy(self):
+        """
+        Mediana da accuracy das regras de cada agente, por partição em vez de ordenação completa
+
+        :return: array por agente
+        """
+        k = self.n_rules // 2
+        median = np.empty(self.n_agents, dtype=self.dtype)
+        for rows in self.chunks():
+            if self.n_rules % 2:
+                median[rows] = np.partition(self.accuracy[rows], k, axis=1)[:, k]
+            else:
+                part = np.partition(self.accuracy[rows], [k - 1, k], axis=1)
+                median[rows] = (part[:, k - 1] + part[:, k]) / 2
+        return median
+
+    def fitness(self, agents=None):
+        """
+        Fitness (Rule.fitness) das regras dos agentes informados, todos se None
+        """
+        if agents is None:
+            agents = slice(None)
+        return 100 - (self.accuracy[agents] + self.bit_cost * self.specificity[agents])
+
+    def rank_rules(self, agents, start=44, stop=64):
+        """
+        Equivalente vetorizado de Investor.rank_rules
+
+        :return: array (agentes x (stop - start)) com as regras entre as posições start e stop da ordenação por fitness
+        """
+        agents = np.asarray(agents)
+        slots = np.empty((len(agents), stop - start), dtype=np.intp)
+        rows = max(1, self.chunk_rules // max(self.n_rules, 1))
+        for first in range(0, len(agents), rows):
+            chunk = slice(first, first + rows)
+            slots[chunk] = np.argpartition(self.fitness(agents[chunk]), [start, stop - 1], axis=1)[:, start:stop]
+        return slots
+
+    def genetic_algo(self, agents, genetic_param, median_accuracy, rng=None, start=44, stop=64, crossover_rng=None,
+                     slots=None):
+        """
+        Equivalente vetorizado de Investor.genetic_algo para todos os agentes informados de uma vez. As regras nas
+        posições start a stop da ordenação por fitness são mutadas (probabilidade genetic_param) ou trocadas pelo
+        cruzamento de duas regras do próprio agente, com as mesmas probabilidades de Rule.mutate_rule e
+        Investor.crossover; mutação e cruzamento dos bits são operações de máscara. Os pais são sorteados entre as
+        regras do agente antes desta rodada.
+
+        :param agents: índices dos agentes que rodam o algoritmo
+        :param median_accuracy: mediana da accuracy de cada agente (array com todos os agentes)
+        :param rng: numpy.random.Generator da escolha entre mutação e cruzamento e da mutação
+        :param crossover_rng: numpy.random.Generator do cruzamento, por padrão o próprio rng
+        :param slots: resultado de rank_rules, se já calculado
+        :return: array (agentes x regras trocadas) com os índices das regras alteradas
+        """
+        rng = np.random.default_rng() if rng is None else rng
+        crossover_rng = rng if crossover_rng is None else crossover_rng
+        agents = np.asarray(agents)
+        if slots is None:
+            slots = self.rank_rules(agents, start, stop)
+        rows = np.repeat(agents, stop - start)
+        cols = slots.ravel()
+        mutate = rng.random(len(rows)) < genetic_param
+        mutated = self._mutate(rows[mutate], cols[mutate], np.asarray(median_accuracy)[rows[mutate]], rng)
+        crossed = self._crossover(rows[~mutate], crossover_rng)
+        for (m_rows, m_cols), (care, value, alpha, beta, accuracy) in (((rows[mutate], cols[mutate]), mutated),
+                                                                       ((rows[~mutate], cols[~mutate]), crossed)):
+            self.care[m_rows, m_cols], self.value[m_rows, m_cols] = care, value
+            self.invalidate_conditions()
+            self.alpha[m_rows, m_cols], self.beta[m_rows, m_cols] = alpha, beta
+            self.accuracy[m_rows, m_cols] = accuracy
+            self.specificity[m_rows, m_cols] = popcount(care)
+        self.rules_changed[rows, cols] = True
+        return slots
+
+    def _mutate(self, rows, cols, accuracy, rng):
+        """
+        Rule.mutate_rule em lote
+
+        :return: care, value, alpha, beta e accuracy das regras mutadas
+        """
+        k = len(rows)
+        alpha, beta = self.alpha[rows, cols], self.beta[rows, cols]
+        rand = rng.random(k)
+        new_coefs = rand <= 0.2
+        scale_coefs = (rand > 0.2) & (rand <= 0.4)
+        alpha = np.where(new_coefs, rng.uniform(0.7, 1.2, k),
+                         np.where(scale_coefs, alpha * rng.uniform(0.95, 1.05, k), alpha))
+        beta = np.where(new_coefs, rng.uniform(-10, 19, k),
+                        np.where(scale_coefs, beta * rng.uniform(0.95, 1.05, k), beta))
+        care, value = self.care[rows, cols], self.value[rows, cols]
+        flip = pack_rows(rng.random((k, 64)) < 0.03)
+        choice = rng.integers(0, 3, (k, 64))
+        choice_0, choice_1 = pack_rows(choice == 0), pack_rows(choice == 1)
+        # 0 vira 1 e 1 vira 0 com probabilidade 1/3, senão viram 2; 2 vira 0, 1 ou 2 com a mesma probabilidade
+        flip_care = flip & care
+        flip_free = flip & ~care
+        swap = flip_care & choice_0
+        clear = flip_care & ~choice_0
+        care_out = (care & ~clear) | (flip_free & (choice_0 | choice_1))
+        value_out = ((value ^ swap) & ~clear) | (flip_free & choice_1)
+        return care_out, value_out, alpha, beta, accuracy
+
+    def _crossover(self, rows, rng):
+        """
+        Investor.crossover em lote: cada bit vem de um dos pais sorteado ao acaso e os coeficientes seguem um dos três
+        modos (coeficientes de um dos pais, cada coeficiente de um pai, média ponderada por 1/accuracy)
+
+        :return: care, value, alpha, beta e accuracy das novas regras
+        """
+        k = len(rows)
+        first, second = rng.integers(0, self.n_rules, (2, k))
+        care_1, care_2 = self.care[rows, first], self.care[rows, second]
+        value_1, value_2 = self.value[rows, first], self.value[rows, second]
+        alpha_1, alpha_2 = self.alpha[rows, first], self.alpha[rows, second]
+        beta_1, beta_2 = self.beta[rows, first], self.beta[rows, second]
+        acc_1, acc_2 = self.accuracy[rows, first], self.accuracy[rows, second]
+        take_first = pack_rows(rng.random((k, 64)) < 0.5)
+        care = (care_1 & take_first) | (care_2 & ~take_first)
+        value = (value_1 & take_first) | (value_2 & ~take_first)
+        mode = rng.integers(0, 3, k)
+        same_parent = rng.random(k) < 0.5
+        alpha_first = np.where(mode == 1, same_parent, rng.random(k) < 0.5)
+        beta_first = np.where(mode == 1, same_parent, rng.random(k) < 0.5)
+        weight_1, weight_2 = 1 / acc_1, 1 / acc_2
+        alpha = np.where(mode == 0, (alpha_1 * weight_1 + alpha_2 * weight_2) / (weight_1 + weight_2),
+                         np.where(alpha_first, alpha_1, alpha_2))
+        beta = np.where(mode == 0, (beta_1 * weight_1 + beta_2 * weight_2) / (weight_1 + weight_2),
+                        np.where(beta_first, beta_1, beta_2))
+        return care, value, alpha, beta, (acc_1 + acc_2) / 2
+
+    def store_rules(self, investors, numeric):
+        """
+        Copia para os objetos 'Investor' as regras trocadas por genetic_algo desde a última cópia. Como a accuracy, as
+        regras novas só existem nos arrays durante a simulação e viram objetos 'Rule' quando os objetos são usados
+
+        :param numeric: tipo numérico das novas regras (Decimal ou float)
+        """
+        for n in np.flatnonzero(self.rules_changed.any(axis=1)).tolist():
+            indices = np.flatnonzero(self.rules_changed[n]).tolist()
+            rules = []
+            for j in indices:
+                rule = Rule.from_masks(self.care[n, j], self.value[n, j], float(self.alpha[n, j]),
+                                       float(self.beta[n, j]), numeric)
+                rule.accuracy = numeric(float(self.accuracy[n, j]))
+                rules.append(rule)
+            investors[n].replace_rules(indices, rules)
+        # as regras novas já têm a accuracy atual
+        self.accuracy_changed &= ~self.rules_changed
+        self.rules_changed[...] = False
+
+
+class RuleView:
+    """
+    Visão de uma regra guardada em um PopulationEngine, com a mesma interface de leitura de 'Rule'. Os valores são
+    lidos e escritos direto nos arrays.
+    """
+    __slots__ = ('engine', 'agent', 'index')
+
+    def __init__(self, engine, agent, index):
+        self.engine = engine
+        self.agent = agent
+        self.index = index
+
+    def _get(self, name):
+        return getattr(self.engine, name)[self.agent, self.index]
+
+    def _set(self, name, value):
+        getattr(self.engine, name)[self.agent, self.index] = value
+
+    care_mask = property(lambda self: int(self._get('care')))
+    value_mask = property(lambda self: int(self._get('value')))
+    specificity = property(lambda self: int(self._get('specificity')))
+    _alpha = property(lambda self: float(self._get('alpha')), lambda self, v: self._set('alpha', v))
+    _beta = property(lambda self: float(self._get('beta')), lambda self, v: self._set('beta', v))
+    accuracy = property(lambda self: float(self._get('accuracy')), lambda self, v: self._set('accuracy', v))
+
+    @property
+    def bit_cost(self):
+        return self.engine.bit_cost
+
+    @property
+    def watch_list(self):
+        care, value = self.care_mask, self.value_mask
+        return tuple((value >> n) & 1 if (care >> n) & 1 else 2 for n in range(64))
+
+    @property
+    def fitness(self):
+        return 100 - (self.accuracy + self.bit_cost * self.specificity)
+
+    def get_coefs(self):
+        return self._alpha, self._beta
+
+    def forecast(self, p_d):
+        return self._alpha * p_d + self._beta
+
+    def is_active(self, market_state):
+        return (market_state ^ self.value_mask) & self.care_mask == 0
+
+    def to_rule(self, numeric=float):
+        """
+        :return: objeto 'Rule' independente com os mesmos valores
+        """
+        rule = Rule.from_masks(self.care_mask, self.value_mask, self._alpha, self._beta, numeric)
+        rule.accuracy = numeric(self.accuracy)
+        return rule
+
+
+class InvestorView:
+    """
+    Visão de um agente guardado em um PopulationEngine: carteira e regras lidas direto dos arrays
+    """
+    __slots__ = ('engine', 'agent')
+
+    def __init__(self, engine, agent):
+        self.engine = engine
+        self.agent = agent
+
+    cash = property(lambda self: float(self.engine.cash[self.agent]),
+                    lambda self, v: self.engine.cash.__setitem__(self.agent, v))
+    stock_qty = property(lambda self: float(self.engine.stock_qty[self.agent]),
+                         lambda self, v: self.engine.stock_qty.__setitem__(self.agent, v))
+    risk_free = property(lambda self: float(self.engine.risk_free[self.agent]))
+    risk_aversion_coef = property(lambda self: float(self.engine.risk_aversion[self.agent]))
+
+    @property
+    def trading_rules(self):
+        return [RuleView(self.engine, self.agent, j) for j in range(self.engine.n_rules)]
+
+    def rule_fitness(self):
+        return self.engine.fitness(self.agent)
+
+    def active_rules(self, market_state):
+        """
+        :return: índices das regras ativas
+        """
+        engine, n = self.engine, self.agent
+        return np.flatnonzero(((engine.value[n] ^ np.uint64(market_state)) & engine.care[n]) == 0).tolist()
+
+    def select_rule(self, market_state):
+        """
+        Mesma escolha de Investor.select_rule
+
+        :return: RuleView da regra ativa de maior accuracy ou, sem regra ativa, 'Rule' com a média ponderada por
+        1/accuracy dos coeficientes
+        """
+        active = self.active_rules(market_state)
+        engine, n = self.engine, self.agent
+        if active:
+            return RuleView(engine, n, active[int(np.argmax(engine.accuracy[n, active]))])
+        weights = 1 / engine.accuracy[n].astype(np.float64)
+        rule = Rule([2] * 64, numeric=float)
+        rule.set_coefs(float((weights * engine.alpha[n]).sum() / weights.sum()),
+                       float((weights * engine.beta[n]).sum() / weights.sum()))
+        return rule
+
+    def to_investor(self, numeric=float):
+        """
+        :return: objeto 'Investor' independente com os mesmos valores
+        """
+        investor = Investor([rule.to_rule(numeric) for rule in self.trading_rules], self.stock_qty, self.cash,
+                            self.risk_free, numeric)
+        investor.risk_aversion_coef = numeric(self.risk_aversion_coef)
+        return investor
@@ -1,15 +1,28 @@
-import random
+import os
+import json
 import time
 import logging
-from decimal import Decimal
 import pickle
 import csv
+from collections import namedtuple
 
-import progressbar
 import numpy as np
 
-from Agents import Investor, Specialist, Rule
-from Market import MarketInfo, Stock
+from Agents import Specialist
+from Market import MarketInfo, Stock, DividendPath, NUMERIC_TYPES
+from Population import PopulationEngine
+from Output import open_sink, default_filepath, NullSink
+from Telemetry import TelemetryRecorder
+from Instrumentation import Instrumentation, NullInstrumentation
+from LiveMetrics import LiveMetricsWriter
+from Checkpoint import save_checkpoint, load_checkpoint, investors_from_checkpoint, engine_from_checkpoint, \
+    decode_values
+from AgentCache import AgentCache
+
+RNG_STREAMS = ('agents', 'dividends', 'mutation', 'crossover', 'rationing')
+
+StepRecord = namedtuple('StepRecord', ['step', 'price', 'dividend', 'is_rationed', 'unrestricted_price',
+                                       'excess_demand', 'demands'])
 
 """
 num_shares = 100
@@ -42,11 +55,38 @@ class Simulation:
 
     """
 
-    def __init__(self, n_agents, n_steps, csv_filepath='output/price.csv', initial_price=80, initial_dividend=10,
-                 ga_frquency=10, genetic_param=0.9):
+    def __init__(self, n_agents, n_steps, csv_filepath=None, initial_price=80, initial_dividend=10,
+                 ga_frquency=10, genetic_param=0.9, numeric='decimal',
+                 agents_filepath='StoredAgents/Investors.pickle', seed=None, output_format='csv', flush_every=None,
+                 telemetry_interval=None, telemetry_dir=None, telemetry_chunk=10000, instrument=False,
+                 report_every=None, live_metrics=None, dividend_source='step', engine_dtype='float64', engine_dir=None):
         """
 
 
+        :param csv_filepath: arquivo de saída da simulação, sobrescrito a cada execução. None gera um arquivo novo em
+        output/ para cada simulação
+        :param output_format: 'csv' (texto separado por ';') ou 'npz' (blocos binários, ver Output.read_output)
+        :param flush_every: passos acumulados em memória entre gravações no arquivo de saída
+        :param telemetry_interval: passos entre registros da telemetria dos agentes (ver Telemetry); None (padrão)
+        desliga
+        :param telemetry_dir: diretório onde a telemetria é gravada em blocos de telemetry_chunk amostras, com só um
+        bloco em memória; None mantém toda a telemetria em memória (amostras x agentes x 7 float64)
+        :param instrument: se True mede o tempo de cada fase do passo e conta eventos (ver Instrumentation); o
+        resultado fica em self.instrumentation.report()
+        :param report_every: com instrument, envia o tempo por fase ao log (logging) a cada report_every passos
+        :param live_metrics: nome do bloco de memória compartilhada onde passo, preço, dividendo, taxa de
+        racionamento, accuracy média e passos por segundo são publicados a cada passo (ver LiveMetrics); None desliga
+        :param dividend_source: 'step' sorteia o dividendo a cada passo; 'bulk' gera os dividendos em blocos com a
+        recursão AR(1) vetorizada (ver Market.DividendPath); outro valor é o caminho de um .npy gravado por
+        DividendPath.save, usado por todas as simulações de um ensemble com os mesmos números aleatórios
+        :param engine_dtype: 'float64' ou 'float32', tipo de alpha, beta e accuracy no PopulationEngine do modo
+        vetorizado (ver Population.PopulationEngine)
+        :param engine_dir: diretório onde os arrays do PopulationEngine do modo vetorizado ficam mapeados em memória
+        (np.memmap), para populações maiores que a RAM; None mantém os arrays na RAM
+        :param agents_filepath: arquivo de onde os agentes são carregados e onde são salvos ao fim da simulação
+        :param seed: semente da simulação; cada componente (agentes, dividendos, mutação, cruzamento e racionamento)
+        recebe um gerador independente derivado dela. None usa entropia do sistema
+        :param numeric: 'decimal' para usar Decimal em todas as contas ou 'float' para usar float (mais rápido)
         :param genetic_param:
         :param n_agents:
         :param n_steps:
@@ -59,120 +99,436 @@ class Simulation:
         self.ga_frquency = ga_frquency
         self.genetic_param = genetic_param
         self.investors = None
+        # no modo vetorizado as carteiras ficam nestes arrays, no tipo numérico da simulação (ver use_engine)
+        self.cash = None
+        self.stock_qty = None
         self.specialist = None
         self.market = None
         self.initial_price = initial_price
         self.initial_dividend = initial_dividend
+        self.num = NUMERIC_TYPES[numeric]
+        self.seed = seed
+        self.rngs = dict(zip(RNG_STREAMS, map(np.random.default_rng, np.random.SeedSequence(seed).spawn(
+            len(RNG_STREAMS)))))
         self.stock = Stock(initial_price=initial_price,
                            initial_dividend=initial_dividend,
                            dividend_mean=10,
                            revision_speed=0.95,
-                           dividend_error_var=0.075)
-        self.csv_filepath = csv_filepath
+                           dividend_error_var=0.075,
+                           numeric=self.num,
+                           rng=self.rngs['dividends'])
+        if dividend_source == 'bulk':
+            self.stock.bulk_dividends()
+        elif dividend_source != 'step':
+            self.stock.dividend_path = DividendPath.load(dividend_source)
+        self.output_format = output_format
+        self.flush_every = flush_every
+        self.telemetry_interval = telemetry_interval
+        self.telemetry_dir = telemetry_dir
+        self.telemetry_chunk = telemetry_chunk
+        self.telemetry = None
+        self.instrumentation = Instrumentation(report_every) if instrument else NullInstrumentation()
+        self.live_metrics = live_metrics
+        self.median_accuracy = None
+        self.engine_dtype = np.dtype(engine_dtype)
+        self.engine_dir = engine_dir
+        self.csv_filepath = csv_filepath if csv_filepath is not None else default_filepath(output_format)
+        self.agents_filepath = agents_filepath
 
-    def MainSimulation(self, progress=False, price_setting="clearing", new_agents=False):
+    def MainSimulation(self, progress=False, price_setting="clearing", new_agents=False, vectorized=False,
+                       checkpoint_every=None, checkpoint_dir='output/checkpoints', resume_from=None, burn_in_steps=0,
+                       agent_cache=None):
         """
-        Executa a simulação com base nos parâmetros
+        Executa a simulação com base nos parâmetros (ver iter_steps)
+
+        :param price_setting: 'auction' (tentativas do especialista), 'clearing' (preço de equilíbrio sem as
+        restrições de caixa e de venda) ou 'exact' (preço de equilíbrio exato com as restrições)
+        :param vectorized: se True os agentes ficam no PopulationEngine, que calcula demandas, accuracy e algoritmo
+        genético; os objetos 'Investor' só são criados se self.investors for lido (ex. por save_agents)
+        :param checkpoint_every: grava um checkpoint (ver Checkpoint) a cada checkpoint_every passos
+        :param checkpoint_dir: diretório dos checkpoints, um arquivo step_<passo>.npz por checkpoint
+        :param resume_from: arquivo de checkpoint de onde a simulação continua; os agentes não são carregados
+        :param burn_in_steps: se maior que 0, os agentes são novos e aquecidos por burn_in_steps passos antes da
+        simulação (ver warm_agents)
+        :param agent_cache: AgentCache, ou diretório de um, com as populações aquecidas
         :return:
         """
-        if new_agents:
-            self.initialiaze_agents()
+        for _ in self.iter_steps(progress, price_setting, new_agents, vectorized, checkpoint_every, checkpoint_dir,
+                                 resume_from, burn_in_steps=burn_in_steps, agent_cache=agent_cache):
+            pass
+        self.save_agents()
+        for method, report in self.specialist.report().items():
+            print("{}: {:.1%} dos passos com racionamento, {:.2f} ms por passo".format(
+                method, report['rationed_rate'], report['ms_per_step']))
+        if self.instrumentation.enabled:
+            for phase, report in self.instrumentation.report()['phases'].items():
+                print("{}: {:.3f} ms por passo ({:.1%})".format(phase, report['ms_per_step'], report['share']))
+        print("Processo concluído")
+        return self.market.price_history.tolist()
+
+    def iter_steps(self, progress=False, price_setting="clearing", new_agents=False, vectorized=False,
+                   checkpoint_every=None, checkpoint_dir='output/checkpoints', resume_from=None, include_demands=False,
+                   write_output=True, burn_in_steps=0, agent_cache=None):
+        """
+        Gerador que executa a simulação um passo por vez e devolve um StepRecord ao fim de cada passo, para consumir
+        a série sem guardá-la inteira nem relê-la do disco. Interromper o laço (break) encerra a simulação: saída e
+        telemetria são fechadas normalmente, mas os agentes não são salvos (ver MainSimulation e save_agents).
+
+        Parâmetros iguais aos de MainSimulation e mais:
+        :param include_demands: se True o StepRecord traz a demanda de cada agente
+        :param write_output: se False nada é gravado no arquivo de saída
+        :return: gerador de StepRecord
+        """
+        first_step = 0
+        if resume_from is not None:
+            first_step = self.restore_checkpoint(resume_from, vectorized) + 1
+            print("Resuming from step {}".format(first_step))
+        elif burn_in_steps:
+            self.warm_agents(burn_in_steps, price_setting, vectorized, cache=agent_cache)
+        elif new_agents:
+            self.initialiaze_agents(vectorized=vectorized)
         else:
             self.load_agents()
             print("Agents loaded sucessfully!")
+        if vectorized and self.engine is None:
+            self.use_engine(PopulationEngine.from_investors(self.investors, self.engine_dtype, self.engine_dir),
+                            [inv.cash for inv in self.investors], [inv.stock_qty for inv in self.investors])
+        engine = self.engine
+        if self.telemetry_interval is not None:
+            n_agents = engine.n_agents if engine is not None else len(self.investors)
+            self.telemetry = TelemetryRecorder(n_agents, self.n_steps, self.telemetry_interval,
+                                               self.telemetry_chunk, self.telemetry_dir)
         if progress:
-            step_list = progressbar.progressbar(range(self.n_steps))
+            import progressbar
+            step_list = progressbar.progressbar(range(first_step, self.n_steps))
         else:
-            step_list = range(self.n_steps)
-        with open(self.csv_filepath, mode='a', newline='') as data_file:
+            step_list = range(first_step, self.n_steps)
+        sink = open_sink(self.csv_filepath, self.output_format, self.flush_every) if write_output else NullSink()
+        live = LiveMetricsWriter(self.live_metrics) if self.live_metrics is not None else None
+        try:
             for step in step_list:
-                self.stock.update_dividend()
-                dividend = self.stock.current_dividend
+                record = self.run_step(step, sink, price_setting, include_demands)
+                if live is not None:
+                    live.publish(step, record.price, record.dividend, record.is_rationed, self.mean_accuracy())
+                if checkpoint_every and (step + 1) % checkpoint_every == 0:
+                    save_checkpoint(os.path.join(checkpoint_dir, 'step_{:08d}.npz'.format(step)), self, step)
+                yield record
+        finally:
+            sink.close()
+            if live is not None:
+                live.close()
+            if self.telemetry is not None:
+                self.telemetry.close()
+
+    def run_step(self, step, sink, price_setting="clearing", include_demands=False):
+        """
+        Executa um passo: novo dividendo, formação do preço, atualização das carteiras e das regras, algoritmo
+        genético e atualização do mercado
+
+        :param sink: OutputSink que recebe o registro do passo
+        :param include_demands: se True o StepRecord traz a demanda de cada agente
+        :return: StepRecord
+        """
+        timer = self.instrumentation
+        timer.start()
+        engine = self.engine
+        # no modo vetorizado os objetos 'Investor' não são usados no passo
+        investors = self.investors if engine is None else None
+        market_state = self.market.state_word
+        self.stock.update_dividend()
+        dividend = self.stock.current_dividend
+        if step != 0:
+            last_price = self.num(self.market.price_history[-1])
+        else:
+            last_price = self.num(80)
+            dividend = self.num(10)
+            sink.write(step, last_price, dividend, 0, 0, 0, 0, 0)
+            self.market.update_history(last_price, dividend)
+        timer.lap('dividend')
+        if price_setting == "auction":
+            price, demands, is_rationed, unrestricted_price = self.specialist.calculate_demands(
+                last_price=last_price,
+                last_dividend=dividend,
+                investors=investors,
+                market_state=market_state,
+                zero_excess=False,
+                engine=engine)
+        elif price_setting == 'clearing':
+            price, demands, is_rationed, unrestricted_price = self.specialist.find_price(dividend,
+                                                                                         investors,
+                                                                                         market_state,
+                                                                                         False,
+                                                                                         engine=engine)
+        elif price_setting == 'exact':
+            price, demands, is_rationed, unrestricted_price = self.specialist.exact_price(
+                last_price=last_price,
+                dividend=dividend,
+                investors=investors,
+                market_state=market_state,
+                zero_excess=False,
+                engine=engine)
+        else:
+            raise Exception('Undefined price setting method')
+        if timer.enabled:
+            # regras usadas na formação do preço, antes que o algoritmo genético troque regras
+            if engine is not None:
+                active = engine.active_rules(market_state).sum(axis=1)
+            else:
+                active = np.array([len(agent.active_rules(market_state)) for agent in investors])
+            timer.count('active_rules', int(active.sum()))
+            timer.count('fallback_rules', int((active == 0).sum()))
+        timer.lap('price')
+
+        if engine is None:
+            for ind, agent in enumerate(investors):
+                agent.update_portifolio(demands[ind], price, dividend=0)
+        else:
+            self.update_portfolios(demands, price)
+        timer.lap('portfolio')
+        if engine is not None:
+            if step != 0:
+                engine.update_accuracy(market_state, price, last_price, dividend, self.market.dividend_history[-1], 75)
+            median_accuracy = self.median_accuracy = engine.median_accuracy()
+        else:
+            for agent in investors:
                 if step != 0:
-                    last_price = Decimal(self.market.price_history[-1])
-                else:
-                    last_price = Decimal(80)
-                    dividend = Decimal(10)
-                    self.market.write_step(step, last_price, dividend, 0, 0, 0, 0, 0, file_obj=data_file, header=True)
-                    self.market.update_history(last_price, dividend)
-                if price_setting == "auction":
-                    price, demands, is_rationed, unrestricted_price = self.specialist.calculate_demands(
-                        last_price=last_price,
-                        last_dividend=dividend,
-                        investors=self.investors,
-                        market_state=self.market.current_state,
-                        zero_excess=False)
-                elif price_setting == 'clearing':
-                    price, demands, is_rationed, unrestricted_price = self.specialist.find_price(dividend,
-                                                                                                 self.investors,
-                                                                                                 self.market.current_state,
-                                                                                                 False)
-                else:
-                    Exception('Undefined price setting method')
-
-                # print(demands)
-                for ind, agent in enumerate(self.investors):
-                    agent.update_portifolio(demands[ind], price, dividend=0)
-                    for rule in agent.trading_rules:
-                        if rule.is_active(self.market.current_state) and step != 0:
-                            rule.update_fitness_accuracy(price, last_price,
-                                                         dividend,
-                                                         self.market.dividend_history[-1], 75)
-                    agent.sort_rules_by_fitness()
-                    agent.update_median_accuracy()
-                    # best_rule = agent.select_rule(market_state=self.market.current_state)
-                    # agent.write_to_df(step, agent.cash, agent.stock_qty, 0, best_rule.specificity, best_rule._alpha,
-                    #                  best_rule._beta, best_rule.accuracy[-1])
-                    if (step % self.ga_frquency) == 0 and step != 0:
-                        agent.genetic_algo(self.genetic_param)
-
-                self.market.write_step(step, price, dividend, 0, 0, is_rationed, unrestricted_price, sum(demands),
-                                       file_obj=data_file)
-
-                self.market.update_history(price, dividend)
-                self.market.update_info_state(step)
-                self.market.unburden_history()
-        self.save_agents()
-        print("Processo concluído")
-        return self.market.price_history
-
-    def initialiaze_agents(self):
-        agents = []
-        for _ in range(self.n_agents):
-            rules = []
-            for i in range(100):
-                watch = random.choices([0, 1, 2], [1, 1, 18], k=64)
-                rules.append(Rule(watch_list=watch, alpha=random.uniform(0.7, 1.2), beta=random.uniform(-10, 19)))
-            agents.append(Investor(rules))
-        self.investors = agents
-        self.specialist = Specialist(max_trials=6,
-                                     max_price=200,
-                                     min_price=.01,
-                                     num_shares=len(agents) + 1,  # num_shares=sum([ag.stock_qty for ag in agents]),
-                                     min_excess=10 ** -3,
-                                     eta=0.005)
-        self.market = MarketInfo(dividend_mean=10)
+                    agent.update_rules_accuracy(market_state, price, last_price, dividend,
+                                                self.market.dividend_history[-1], 75)
+                agent.update_median_accuracy()
+        timer.lap('fitness')
+        if self.telemetry is not None:
+            # antes do algoritmo genético, para registrar as regras que formaram o preço deste passo
+            self.telemetry.record(step, investors, price, market_state, engine)
+            timer.lap('output')
+        if (step % self.ga_frquency) == 0 and step != 0:
+            if engine is None:
+                slots = [agent.rank_rules(44, 64) for agent in investors]
+                timer.lap('sorting')
+                for agent, index_list in zip(investors, slots):
+                    agent.genetic_algo(self.genetic_param, self.rngs['mutation'], self.rngs['crossover'], index_list)
+            else:
+                agents = np.arange(engine.n_agents)
+                slots = engine.rank_rules(agents)
+                timer.lap('sorting')
+                engine.genetic_algo(agents, self.genetic_param, median_accuracy, rng=self.rngs['mutation'],
+                                    crossover_rng=self.rngs['crossover'], slots=slots)
+            timer.lap('ga')
+            timer.count('ga_invocations', len(demands))
+
+        excess_demand = sum(demands)
+        sink.write(step, price, dividend, 0, 0, is_rationed, unrestricted_price, excess_demand)
+        timer.lap('output')
+
+        self.market.update_history(price, dividend)
+        self.market.update_info_state(step)
+        self.market.unburden_history()
+        self.stock.update_price(price)
+        timer.lap('state')
+        if timer.enabled:
+            timer.count('specialist_trials', self.specialist.last_trials)
+            timer.count('rationed', int(bool(is_rationed)))
+            timer.count('agent_steps', len(demands))
+            timer.end_step(step)
+        return StepRecord(step, price, dividend, is_rationed, unrestricted_price, excess_demand,
+                          demands if include_demands else None)
+
+    @property
+    def investors(self):
+        """
+        Objetos 'Investor' da simulação. No modo vetorizado o estado dos agentes fica no PopulationEngine e nos arrays
+        de carteira; os objetos só são criados, ou atualizados se já existirem, quando esta propriedade é lida
+        """
+        if self.engine is not None:
+            self.store_engine()
+        return self._investors
+
+    @investors.setter
+    def investors(self, investors):
+        self._investors = investors
+        self.engine = None
+
+    @property
+    def engine_only(self):
+        """
+        True se os agentes só existem no PopulationEngine, sem objetos 'Investor' criados (agentes novos ou retomados
+        de um checkpoint no modo vetorizado)
+        """
+        return self.engine is not None and self._investors is None
+
+    def use_engine(self, engine, cash, stock_qty):
+        """
+        Passa os agentes para o modo vetorizado: regras e accuracy ficam nos arrays do engine e as carteiras em arrays
+        no tipo numérico da simulação. Objetos 'Investor' já existentes são mantidos e atualizados quando
+        self.investors é lido; sem eles, os objetos só são criados nesse momento.
+
+        :param engine: PopulationEngine com os agentes
+        :param cash: caixa de cada agente, no tipo numérico da simulação
+        :param stock_qty: ações de cada agente, no tipo numérico da simulação
+        """
+        dtype = float if self.num is float else object
+        self.cash = np.array(cash, dtype=dtype)
+        self.stock_qty = np.array(stock_qty, dtype=dtype)
+        engine.cash[:], engine.stock_qty[:] = self.cash, self.stock_qty
+        self.engine = engine
+
+    def update_portfolios(self, demands, price):
+        """
+        Investor.update_portifolio de todos os agentes do modo vetorizado, com as mesmas contas no tipo numérico da
+        simulação, seguida da cópia das carteiras para o engine
+        """
+        demands = np.array(demands, dtype=self.cash.dtype)
+        self.stock_qty += demands
+        self.cash -= demands * self.num(price)
+        self.engine.cash[:], self.engine.stock_qty[:] = self.cash, self.stock_qty
+
+    def store_engine(self):
+        """
+        Copia para os objetos 'Investor', criando-os se preciso, o estado que no modo vetorizado só é atualizado no
+        PopulationEngine e nos arrays de carteira: regras trocadas pelo algoritmo genético, accuracy das regras,
+        carteiras e mediana da accuracy de cada agente
+        """
+        engine = self.engine
+        if self._investors is None:
+            self._investors = engine.to_investors(self.num)
+            engine.rules_changed[...] = False
+            engine.accuracy_changed[...] = False
+        else:
+            engine.store_rules(self._investors, self.num)
+            engine.store_accuracy(self._investors)
+        for agent, cash, stock_qty in zip(self._investors, self.cash.tolist(), self.stock_qty.tolist()):
+            agent.cash, agent.stock_qty = cash, stock_qty
+        if self.median_accuracy is not None:
+            for agent, median in zip(self._investors, self.median_accuracy.tolist()):
+                agent.median_accuracy = agent.num(median)
+
+    def mean_accuracy(self):
+        """
+        :return: média da accuracy mediana dos agentes no último passo; no modo vetorizado usa o array do engine
+        """
+        if self.median_accuracy is not None:
+            return float(self.median_accuracy.mean())
+        return sum(float(agent.median_accuracy) for agent in self.investors) / len(self.investors)
+
+    def restore_checkpoint(self, filepath, vectorized=False):
+        """
+        Restaura agentes, especialista, mercado, dividendo e geradores aleatórios de um checkpoint gravado por
+        Checkpoint.save_checkpoint. O tipo numérico da simulação deve ser o mesmo do checkpoint.
+
+        :param vectorized: se True os agentes são carregados só no PopulationEngine (ver use_engine)
+        :return: último passo executado antes do checkpoint
+        """
+        checkpoint = load_checkpoint(filepath)
+        if NUMERIC_TYPES[str(checkpoint['numeric'])] is not self.num:
+            raise ValueError('Checkpoint gravado no modo {}'.format(checkpoint['numeric']))
+        if vectorized:
+            self.investors = None
+            engine = engine_from_checkpoint(checkpoint, self.engine_dtype, self.engine_dir)
+            self.use_engine(engine, decode_values(checkpoint['cash'], self.num),
+                            decode_values(checkpoint['stock_qty'], self.num))
+        else:
+            self.investors = investors_from_checkpoint(checkpoint, self.num)
+        max_price, num_shares = decode_values(checkpoint['specialist'], self.num)
+        self.specialist = self.make_specialist(max_price, num_shares)
+        self.market = MarketInfo(dividend_mean=10, numeric=self.num)
+        self.market.restore_history(decode_values(checkpoint['price_history'], self.num),
+                                    decode_values(checkpoint['dividend_history'], self.num),
+                                    checkpoint['current_state'].tolist())
+        self.stock.current_price, self.stock.current_dividend = decode_values(checkpoint['stock'], self.num)
+        for key, state in json.loads(str(checkpoint['rngs'])).items():
+            self.rngs[key].bit_generator.state = state
+        if self.stock.dividend_path is not None:
+            self.stock.dividend_path.seek(int(checkpoint['step']) + 1)
+        return int(checkpoint['step'])
+
+    def make_specialist(self, max_price, num_shares):
+        return Specialist(max_trials=6,
+                          max_price=max_price,
+                          min_price=.01,
+                          num_shares=num_shares,
+                          min_excess=10 ** -3,
+                          eta=0.005,
+                          numeric=self.num,
+                          rng=self.rngs['rationing'])
+
+    def initialiaze_agents(self, n_rules=100, vectorized=False):
+        """
+        Cria agentes novos com regras aleatórias, sorteadas por PopulationEngine.random nos dois modos para que a
+        mesma semente gere a mesma população (com engine_dtype float32 os coeficientes do modo vetorizado são os
+        mesmos arredondados para float32)
+
+        :param n_rules: regras por agente (o algoritmo genético troca as posições 44 a 63, então pelo menos 64)
+        :param vectorized: se True os agentes ficam só no PopulationEngine (ver use_engine)
+        """
+        if vectorized:
+            engine = PopulationEngine.random(self.n_agents, n_rules, self.rngs['agents'], self.engine_dtype,
+                                             self.engine_dir)
+            self.investors = None
+            self.use_engine(engine, [self.num(x) for x in engine.cash.tolist()],
+                            [self.num(x) for x in engine.stock_qty.tolist()])
+        else:
+            self.investors = PopulationEngine.random(self.n_agents, n_rules, self.rngs['agents']).to_investors(self.num)
+        self.specialist = self.make_specialist(max_price=200, num_shares=self.n_agents + 1)
+        self.market = MarketInfo(dividend_mean=10, numeric=self.num)
+
+    def warm_agents(self, burn_in_steps, price_setting='clearing', vectorized=False, n_rules=100, cache=None):
+        """
+        Cria agentes novos e os deixa aprender por burn_in_steps passos em uma simulação separada, sem saída, com
+        os mesmos parâmetros desta e semente derivada de self.seed. Depois os agentes são usados como os de
+        load_agents: caixa e ações voltam aos valores iniciais e o mercado começa do zero. Os geradores aleatórios
+        desta simulação não são usados no aquecimento.
+
+        :param cache: AgentCache, ou diretório de um, consultado antes de aquecer e atualizado depois; sem semente
+        (seed None) o aquecimento não é reproduzível e o cache não é usado
+        """
+        if isinstance(cache, str):
+            cache = AgentCache(cache)
+        if self.seed is None:
+            cache = None
+        params = dict(n_agents=self.n_agents, n_rules=n_rules, burn_in_steps=burn_in_steps,
+                      ga_frquency=self.ga_frquency, genetic_param=self.genetic_param,
+                      numeric=next(k for k, v in NUMERIC_TYPES.items() if v is self.num), price_setting=price_setting,
+                      vectorized=bool(vectorized), initial_price=self.initial_price,
+                      initial_dividend=self.initial_dividend, dividend_mean=str(self.stock.dividend_mean),
+                      revision_speed=str(self.stock.revision_speed),
+                      dividend_error_var=self.stock.dividend_error_var, seed=self.seed,
+                      engine_dtype=str(self.engine_dtype) if vectorized else None)
+        checkpoint = cache.get(params) if cache is not None else None
+        if checkpoint is None:
+            seed = None if self.seed is None else [self.seed, burn_in_steps]
+            warm = Simulation(self.n_agents, burn_in_steps, initial_price=self.initial_price,
+                              initial_dividend=self.initial_dividend, ga_frquency=self.ga_frquency,
+                              genetic_param=self.genetic_param, numeric=params['numeric'], seed=seed,
+                              engine_dtype=self.engine_dtype,
+                              engine_dir=None if self.engine_dir is None else os.path.join(self.engine_dir, 'burn_in'))
+            warm.initialiaze_agents(n_rules, vectorized)
+            sink = NullSink()
+            for step in range(burn_in_steps):
+                warm.run_step(step, sink, price_setting)
+            if cache is None:
+                self.use_agents(warm.investors)
+                return
+            # a população é sempre lida da entrada gravada, para que acerto e falta no cache deem o mesmo resultado
+            checkpoint = load_checkpoint(cache.put(params, warm, burn_in_steps - 1))
+        self.use_agents(investors_from_checkpoint(checkpoint, self.num))
 
     def save_agents(self):
         agents = self.investors
-        with open('StoredAgents/Investors.pickle', mode='wb') as ag:
+        with open(self.agents_filepath, mode='wb') as ag:
             pickle.dump(agents, ag)
 
     def load_agents(self):
-        with open('StoredAgents/Investors.pickle', mode='rb') as ag:
-            self.investors = pickle.load(ag)
+        with open(self.agents_filepath, mode='rb') as ag:
+            self.use_agents(pickle.load(ag))
+
+    def use_agents(self, investors):
+        """
+        Usa investors como agentes da simulação com caixa e ações iniciais, especialista e mercado novos
+        """
+        self.investors = investors
         for inv in self.investors:
             inv.stock_qty = 1
             inv.cash = 20000
-            for j in range(len(inv.trading_rules)):
-                if type(inv.trading_rules[j].accuracy) is list:
-                    if inv.trading_rules[j].accuracy[-1] is not None:
-                        inv.trading_rules[j].accuracy = inv.trading_rules[j].accuracy[-1]
-        self.specialist = Specialist(max_trials=6,
-                                     max_price=500,
-                                     min_price=.01,
-                                     num_shares=sum([inv.stock_qty for inv in self.investors]),
-                                     # num_shares=sum([ag.stock_qty for ag in agents]),
-                                     min_excess=10 ** -3,
-                                     eta=0.005)
-        self.market = MarketInfo(dividend_mean=10)
+            inv.set_numeric(self.num)
+        self.specialist = self.make_specialist(max_price=500,
+                                               num_shares=sum([inv.stock_qty for inv in self.investors]))
+        self.market = MarketInfo(dividend_mean=10, numeric=self.num)
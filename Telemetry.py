@@ -0,0 +1,124 @@
+import glob
+import os
+
+import numpy as np
+
+FIELDS = ('cash', 'stocks', 'wealth', 'bits_used', 'alpha', 'beta', 'accuracy')
+
+
+class TelemetryRecorder:
+    """
+    Registro por agente compartilhado por toda a população: para cada passo amostrado guarda caixa, ações, riqueza,
+    bits usados, alpha, beta e accuracy da regra escolhida de todos os agentes em arrays (amostras x agentes)
+    alocados uma única vez.
+
+    Sem spill_dir os arrays comportam todas as amostras da simulação (n_agents * 8 bytes por campo e amostra). Com
+    spill_dir os arrays comportam chunk_size amostras e cada bloco cheio é gravado em spill_dir/telemetry_<n>.npz.
+    """
+
+    def __init__(self, n_agents, n_steps, interval=1, chunk_size=10000, spill_dir=None):
+        """
+        :param interval: registra os passos múltiplos de interval
+        :param chunk_size: amostras por bloco gravado em disco (só com spill_dir)
+        :param spill_dir: diretório dos blocos; None mantém tudo em memória
+        """
+        self.n_agents = n_agents
+        self.interval = interval
+        self.spill_dir = spill_dir
+        n_samples = (n_steps + interval - 1) // interval
+        self.capacity = min(chunk_size, n_samples) if spill_dir is not None else n_samples
+        self.steps = np.zeros(self.capacity, dtype=np.int64)
+        self.data = {field: np.zeros((self.capacity, n_agents)) for field in FIELDS}
+        self.size = 0
+        self.n_chunks = 0
+        if spill_dir is not None:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def due(self, step):
+        return step % self.interval == 0
+
+    def record(self, step, investors, price, market_state, engine=None):
+        """
+        Registra o passo, se for um passo amostrado. A regra de cada agente é a escolhida no estado de mercado
+        informado; com o PopulationEngine a escolha é feita para todos os agentes de uma vez.
+
+        :param investors: lista de objetos 'Investor', com a carteira já atualizada (não usada com engine)
+        :param engine: PopulationEngine opcional, com as regras e as carteiras já atualizadas
+        """
+        if not self.due(step):
+            return
+        if self.size == self.capacity:
+            self.spill()
+        row = self.size
+        self.steps[row] = step
+        cash = self.data['cash'][row]
+        stocks = self.data['stocks'][row]
+        if engine is not None:
+            cash[:], stocks[:] = engine.cash, engine.stock_qty
+        else:
+            cash[:] = [float(agent.cash) for agent in investors]
+            stocks[:] = [float(agent.stock_qty) for agent in investors]
+        np.add(cash, stocks * float(price), out=self.data['wealth'][row])
+        if engine is not None:
+            index, has_active, a, b, sigma = engine.select(market_state)
+            bits = engine.specificity[np.arange(engine.n_agents), index]
+            self.data['bits_used'][row] = np.where(has_active, bits, 0)
+            self.data['alpha'][row], self.data['beta'][row], self.data['accuracy'][row] = a, b, sigma
+        else:
+            rules = [agent.select_rule(market_state) for agent in investors]
+            self.data['bits_used'][row] = [rule.specificity for rule in rules]
+            self.data['alpha'][row] = [float(rule._alpha) for rule in rules]
+            self.data['beta'][row] = [float(rule._beta) for rule in rules]
+            self.data['accuracy'][row] = [float(rule.accuracy) for rule in rules]
+        self.size += 1
+
+    def spill(self):
+        """
+        Grava as amostras em memória em um novo bloco de spill_dir e esvazia os arrays
+        """
+        if self.spill_dir is None:
+            raise MemoryError('Telemetria sem spill_dir está cheia')
+        if self.size == 0:
+            return
+        filepath = os.path.join(self.spill_dir, 'telemetry_{:05d}.npz'.format(self.n_chunks))
+        np.savez(filepath, step=self.steps[:self.size], **{k: v[:self.size] for k, v in self.data.items()})
+        self.n_chunks += 1
+        self.size = 0
+
+    def close(self):
+        if self.spill_dir is not None:
+            self.spill()
+
+    def arrays(self):
+        """
+        :return: dicionário com 'step' e cada campo, (amostras x agentes), incluindo os blocos já gravados
+        """
+        arrays = {'step': self.steps[:self.size]}
+        arrays.update({k: v[:self.size] for k, v in self.data.items()})
+        if self.spill_dir is None or self.n_chunks == 0:
+            return arrays
+        stored = load_telemetry(self.spill_dir)
+        return {k: np.concatenate([stored[k], arrays[k]]) for k in arrays}
+
+    def agent_history(self, agent):
+        """
+        :param agent: índice do agente
+        :return: pandas.DataFrame com uma linha por passo amostrado
+        """
+        import pandas as pd
+        arrays = self.arrays()
+        return pd.DataFrame({k: v if k == 'step' else v[:, agent] for k, v in arrays.items()})
+
+
+def load_telemetry(spill_dir):
+    """
+    Junta os blocos gravados por TelemetryRecorder
+
+    :return: dicionário com 'step' e cada campo, (amostras x agentes)
+    """
+    arrays = {k: [] for k in ('step',) + FIELDS}
+    for filepath in sorted(glob.glob(os.path.join(spill_dir, 'telemetry_*.npz'))):
+        with np.load(filepath) as chunk:
+            for k in arrays:
+                arrays[k].append(chunk[k])
+    return {k: np.concatenate(v) if v else np.empty(0) for k, v in arrays.items()}
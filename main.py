@@ -1,24 +1,95 @@
-import random
-from decimal import Decimal
-import datetime
+"""
+Executa uma simulação sem interface, a partir de um arquivo de configuração JSON e/ou de argumentos.
 
-import pywhatkit as pwkt
+Exemplos:
+    python main.py --n-agents 20 --n-steps 500 --price-setting auction
+    python main.py --config config.json --seed 3
+
+O arquivo de configuração tem as mesmas chaves dos argumentos (com '_' no lugar de '-'), ex.
+{"n_agents": 20, "n_steps": 500, "numeric": "float", "vectorized": true}. Argumentos informados na linha de comando
+têm prioridade sobre o arquivo.
+"""
+import argparse
+import json
+import logging
+import time
 
-from Agents import Investor, Specialist, Rule
-from Market import MarketInfo
 from Simulation import Simulation
 
-param = {"genetic_param": 0.9,
-         "param": "valor_do_param"}
+SIMULATION_PARAMS = ('n_agents', 'n_steps', 'csv_filepath', 'initial_price', 'initial_dividend', 'ga_frquency',
+                     'genetic_param', 'numeric', 'agents_filepath', 'seed', 'output_format', 'flush_every',
+                     'telemetry_interval', 'telemetry_dir', 'telemetry_chunk', 'instrument', 'report_every',
+                     'live_metrics', 'dividend_source', 'engine_dtype', 'engine_dir')
+RUN_PARAMS = ('progress', 'price_setting', 'new_agents', 'vectorized', 'checkpoint_every', 'checkpoint_dir',
+              'resume_from', 'burn_in_steps', 'agent_cache')
+DEFAULTS = dict(n_agents=20, n_steps=500, price_setting='auction')
 
-# number_agents = 100
-# a = Simulation(25, 20)
-# a.initialiaze_agents()
-# pri = a.MainSimulation(progress=True, price_setting='clearing')
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Santa Fe Institute Artificial Stock Market')
+    parser.add_argument('--config', help='arquivo JSON com os parâmetros')
+    parser.add_argument('--n-agents', type=int)
+    parser.add_argument('--n-steps', type=int)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--numeric', choices=['decimal', 'float'])
+    parser.add_argument('--price-setting', choices=['auction', 'clearing', 'exact'])
+    parser.add_argument('--vectorized', action='store_true', default=None)
+    parser.add_argument('--new-agents', action='store_true', default=None)
+    parser.add_argument('--progress', action='store_true', default=None)
+    parser.add_argument('--ga-frquency', type=int)
+    parser.add_argument('--genetic-param', type=float)
+    parser.add_argument('--agents-filepath')
+    parser.add_argument('--csv-filepath', help='arquivo de saída; por padrão um arquivo novo em output/')
+    parser.add_argument('--output-format', choices=['csv', 'npz'])
+    parser.add_argument('--flush-every', type=int)
+    parser.add_argument('--telemetry-interval', type=int, help='liga a telemetria dos agentes, um registro a cada N '
+                        'passos')
+    parser.add_argument('--telemetry-dir', help='grava a telemetria em blocos nesse diretório em vez de mantê-la em '
+                        'memória')
+    parser.add_argument('--instrument', action='store_true', default=None,
+                        help='mede o tempo de cada fase do passo e conta eventos')
+    parser.add_argument('--report-every', type=int, help='passos entre os envios da instrumentação ao log')
+    parser.add_argument('--live-metrics', help='publica as métricas de cada passo em memória compartilhada com esse '
+                        'nome (ver LiveMetrics.py)')
+    parser.add_argument('--dividend-source', help="'step', 'bulk' ou um .npy com o caminho de dividendos")
+    parser.add_argument('--engine-dtype', choices=['float64', 'float32'],
+                        help='tipo de alpha, beta e accuracy dos agentes no modo vetorizado')
+    parser.add_argument('--engine-dir', help='no modo vetorizado, mantém os agentes em arquivos mapeados em memória '
+                        'nesse diretório')
+    parser.add_argument('--burn-in-steps', type=int, help='passos de aprendizado de agentes novos antes da simulação')
+    parser.add_argument('--agent-cache', help='diretório do cache de populações aquecidas (ver AgentCache.py)')
+    parser.add_argument('--checkpoint-every', type=int)
+    parser.add_argument('--checkpoint-dir')
+    parser.add_argument('--resume-from')
+    return parser.parse_args(argv)
+
+
+def build_config(args):
+    """
+    :return: parâmetros padrão, atualizados pelo arquivo de configuração e pelos argumentos informados
+    """
+    config = dict(DEFAULTS)
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    config.update({k: v for k, v in vars(args).items() if v is not None and k != 'config'})
+    unknown = set(config) - set(SIMULATION_PARAMS) - set(RUN_PARAMS)
+    if unknown:
+        raise ValueError('Parâmetros desconhecidos: {}'.format(', '.join(sorted(unknown))))
+    return config
 
-if __name__ == '__main__':
-    for i in [k for k in range(1)]:
-        a = Simulation(20, 500)
-        pri = a.MainSimulation(progress=1, price_setting='auction', new_agents=False)
 
+def main(argv=None):
+    config = build_config(parse_args(argv))
+    if config.get('report_every'):
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    simulation = Simulation(**{k: v for k, v in config.items() if k in SIMULATION_PARAMS})
+    start = time.perf_counter()
+    prices = simulation.MainSimulation(**{k: v for k, v in config.items() if k in RUN_PARAMS})
+    print("{} passos em {:.2f} s, último preço {:.4f}, saída em {}".format(
+        config['n_steps'], time.perf_counter() - start, float(prices[-1]), simulation.csv_filepath))
+    return prices
+
+
+if __name__ == '__main__':
+    main()
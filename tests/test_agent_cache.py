@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pytest
+
+from AgentCache import AgentCache, KEY_PARAMS
+from Population import PopulationEngine
+from Simulation import Simulation
+
+
+def warm_run(tmp_path, numeric, vectorized, agent_cache):
+    simulation = Simulation(8, 30, numeric=numeric, seed=7, agents_filepath=str(tmp_path / 'Investors.pickle'))
+    records = list(simulation.iter_steps(vectorized=vectorized, write_output=False, burn_in_steps=15,
+                                         agent_cache=agent_cache))
+    return records, simulation
+
+
+def warm_agents(tmp_path, numeric, vectorized, agent_cache):
+    # população logo depois do aquecimento, antes de qualquer passo da simulação
+    simulation = Simulation(8, 30, numeric=numeric, seed=7, agents_filepath=str(tmp_path / 'Investors.pickle'))
+    simulation.warm_agents(15, 'clearing', vectorized, cache=agent_cache)
+    return PopulationEngine.from_investors(simulation.investors)
+
+
+@pytest.mark.parametrize('numeric', ['decimal', 'float'])
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_cache_hit_matches_an_uncached_run(tmp_path, numeric, vectorized):
+    cache_dir = str(tmp_path / 'cache')
+    uncached, _ = warm_run(tmp_path, numeric, vectorized, None)
+    missed, _ = warm_run(tmp_path, numeric, vectorized, cache_dir)
+    assert len(AgentCache(cache_dir).entries()) == 1
+    hit, _ = warm_run(tmp_path, numeric, vectorized, cache_dir)
+    assert len(AgentCache(cache_dir).entries()) == 1
+    assert uncached == missed == hit
+    expected = warm_agents(tmp_path, numeric, vectorized, None)
+    cached = warm_agents(tmp_path, numeric, vectorized, cache_dir)
+    assert len(AgentCache(cache_dir).entries()) == 1
+    for name in ('care', 'value', 'alpha', 'beta', 'accuracy', 'specificity', 'cash', 'stock_qty'):
+        np.testing.assert_array_equal(getattr(cached, name), getattr(expected, name), err_msg=name)
+
+
+def test_cache_hit_skips_the_burn_in(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    warm_run(tmp_path, 'float', True, cache_dir)
+    monkeypatch.setattr(Simulation, 'run_step', None)
+    monkeypatch.setattr(AgentCache, 'put', None)
+    # sem run_step a simulação não roda, mas o aquecimento em si vem inteiro do cache
+    simulation = Simulation(8, 30, numeric='float', seed=7, agents_filepath=str(tmp_path / 'Investors.pickle'))
+    simulation.warm_agents(15, 'clearing', True, cache=cache_dir)
+    assert len(simulation.investors) == 8
+
+
+def base_params():
+    params = {k: 1 for k in KEY_PARAMS}
+    params.update(numeric='float', vectorized=False, seed=3, engine_dtype=None)
+    return params
+
+
+@pytest.mark.parametrize('name, value', [('seed', 4), ('seed', None), ('seed', [3, 15]), ('numeric', 'decimal'),
+                                         ('vectorized', True), ('engine_dtype', 'float32'), ('burn_in_steps', 2)])
+def test_key_changes_with_the_warm_up_parameters(name, value):
+    params = base_params()
+    changed = dict(params, **{name: value})
+    assert AgentCache.key(changed) != AgentCache.key(params)
+    # chaves fora de KEY_PARAMS não mudam a entrada
+    assert AgentCache.key(dict(params, n_steps=10)) == AgentCache.key(params)
+
+
+def test_key_requires_every_warm_up_parameter():
+    params = base_params()
+    del params['seed']
+    with pytest.raises(ValueError):
+        AgentCache.key(params)
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = AgentCache(str(tmp_path / 'cache'), max_entries=2)
+    simulation = Simulation(4, 10, numeric='float', seed=1)
+    simulation.initialiaze_agents(10, vectorized=True)
+    params = [dict(base_params(), seed=seed) for seed in range(3)]
+    first, second = cache.put(params[0], simulation, 0), cache.put(params[1], simulation, 0)
+    os.utime(first, (1000, 1000))
+    os.utime(second, (2000, 2000))
+    assert [entry[0] for entry in cache.entries()] == [first, second]
+    # ler a primeira entrada a torna a mais recente, então a segunda sai quando a terceira passa do limite
+    assert cache.get(params[0]) is not None
+    third = cache.put(params[2], simulation, 0)
+    assert sorted(entry[0] for entry in cache.entries()) == sorted([first, third])
+    assert cache.get(params[1]) is None
+    os.utime(first, (1000, 1000))
+    cache.max_entries = 1
+    assert cache.evict(keep=first) == [third]
+    assert [entry[0] for entry in cache.entries()] == [first]
@@ -0,0 +1,11 @@
+import tempfile
+
+from Benchmark import run_case
+
+
+def test_run_case_reports_step_statistics_and_removes_its_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    results = run_case(5, 64, repeat=2, benchmarks=('find_price', 'step'))
+    assert set(results) == {'find_price', 'step', 'step_mean', 'step_median'}
+    assert 0 < results['step'] <= results['step_median'] and results['step'] <= results['step_mean']
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,22 @@
+import pytest
+
+from Simulation import Simulation
+
+
+def run(tmp_path, seed, **kwargs):
+    simulation = Simulation(10, 60, numeric=kwargs.pop('numeric'), seed=seed,
+                            agents_filepath=str(tmp_path / 'Investors.pickle'))
+    return list(simulation.iter_steps(write_output=False, **kwargs))
+
+
+@pytest.mark.parametrize('numeric', ['decimal', 'float'])
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_resume_reproduces_uninterrupted_run(tmp_path, numeric, vectorized):
+    checkpoint_dir = tmp_path / 'checkpoints'
+    full = run(tmp_path, 5, numeric=numeric, new_agents=True, vectorized=vectorized, checkpoint_every=25,
+               checkpoint_dir=str(checkpoint_dir))
+    # o checkpoint do passo 24 é seguido por três algoritmos genéticos; a semente diferente mostra que todo o estado
+    # aleatório vem do checkpoint
+    resumed = run(tmp_path, 6, numeric=numeric, vectorized=vectorized,
+                  resume_from=str(checkpoint_dir / 'step_00000024.npz'))
+    assert resumed == full[25:]
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from Market import DividendPath, ar1_path
+
+
+def recursion(x0, revision_speed, noise):
+    path, x = [], x0
+    for e in noise:
+        x = revision_speed * x + e
+        path.append(x)
+    return np.array(path)
+
+
+@pytest.mark.parametrize('revision_speed', [0.95, 0.5, 0.01, 0., -0.8, 1.])
+def test_ar1_path_matches_the_step_by_step_recursion(revision_speed):
+    # 3000 passos cobrem vários blocos quando revision_speed é pequeno
+    noise = np.random.default_rng(1).normal(0, 0.1, 3000)
+    np.testing.assert_allclose(ar1_path(0.7, revision_speed, noise), recursion(0.7, revision_speed, noise),
+                               rtol=1e-9, atol=1e-12)
+
+
+def dividend_path(seed=2, chunk_size=64):
+    return DividendPath(10, 0.95, 0.1, 10.3, rng=np.random.default_rng(seed), chunk_size=chunk_size)
+
+
+def test_path_is_the_recursion_over_the_drawn_noise():
+    noise = np.random.default_rng(2).normal(0, 0.1, 64 * 5)
+    expected = recursion(10.3 - 10, 0.95, noise) + 10
+    np.testing.assert_allclose(dividend_path().take(len(noise)), expected, rtol=1e-12)
+
+
+def test_take_next_and_seek_give_the_same_path():
+    full = dividend_path().take(1000)
+    path = dividend_path()
+    rng = np.random.default_rng(3)
+    position, pieces = 0, []
+    while position < len(full):
+        # trechos que começam e terminam em qualquer ponto dos blocos de 64 passos
+        if rng.random() < 0.5:
+            pieces.append([path.next()])
+            position += 1
+        else:
+            n = int(min(rng.integers(0, 150), len(full) - position))
+            pieces.append(path.take(n))
+            position += n
+        assert path.position == position
+    np.testing.assert_array_equal(np.concatenate(pieces), full)
+    for position in (700, 0, 64, 63, 999, 130):
+        path.seek(position)
+        assert path.next() == full[position]
+        np.testing.assert_array_equal(path.take(len(full) - position - 1), full[position + 1:])
+
+
+def test_saved_path_reloads_identically(tmp_path):
+    path = dividend_path()
+    path.seek(37)
+    filepath = path.save(str(tmp_path / 'dividends.npy'), 500)
+    expected = dividend_path().take(537)[37:]
+    loaded = DividendPath.load(filepath)
+    np.testing.assert_array_equal(loaded.take(500), expected)
+    loaded.seek(123)
+    assert loaded.next() == expected[123]
+    np.testing.assert_array_equal(loaded.take(10), expected[124:134])
+    loaded.seek(499)
+    assert loaded.next() == expected[499]
+    with pytest.raises(IndexError):
+        loaded.next()
+    loaded.seek(450)
+    with pytest.raises(IndexError):
+        loaded.take(51)
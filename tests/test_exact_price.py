@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from Agents import Rule, Investor, Specialist
+from Population import PopulationEngine
+
+MIN_PRICE, MAX_PRICE = 0.01, 200.
+
+
+def random_market(rng, n_agents):
+    """
+    Agentes com uma regra sempre ativa e carteiras variadas, parte com pouco caixa para que as restrições de caixa
+    e de venda a descoberto mudem de trecho dentro de [MIN_PRICE, MAX_PRICE]
+    """
+    investors = []
+    for _ in range(n_agents):
+        rule = Rule([2] * 64, alpha=rng.uniform(0.7, 1.2), beta=rng.uniform(-10, 19), numeric=float)
+        rule.accuracy = rng.uniform(0.5, 8)
+        cash = rng.uniform(0, 50) if rng.random() < 0.5 else rng.uniform(100, 20000)
+        investors.append(Investor([rule], stock_qty=rng.uniform(0.1, 3), cash=cash, numeric=float))
+    return investors
+
+
+def brute_force(engine, dividend, n_points=4001):
+    """
+    Excesso de demanda em uma grade de preços; cada troca de sinal é refinada por bisseção e classificada como raiz
+    contínua (excesso zero) ou salto (o excesso troca de sinal sem passar por zero)
+
+    :return: (raízes contínuas, saltos, função do excesso)
+    """
+    selection = engine.select(0)
+
+    def excess(price):
+        return engine.demands(price, dividend, selection).sum(axis=-1)
+
+    grid = np.linspace(MIN_PRICE, MAX_PRICE, n_points)
+    values = excess(grid[:, None])
+    roots, jumps = [], []
+    for i in np.flatnonzero(np.sign(values[:-1]) != np.sign(values[1:])):
+        lo, hi = grid[i], grid[i + 1]
+        for _ in range(80):
+            middle = (lo + hi) / 2
+            if np.sign(excess(middle)) == np.sign(excess(lo)):
+                lo = middle
+            else:
+                hi = middle
+        crossing = (lo + hi) / 2
+        (roots if abs(excess(crossing)) < 1e-6 else jumps).append(crossing)
+    return roots, jumps, grid, excess
+
+
+@pytest.mark.filterwarnings('error::RuntimeWarning')
+def test_exact_price_matches_brute_force():
+    rng = np.random.default_rng(0)
+    kinds = set()
+    for _ in range(300):
+        investors = random_market(rng, int(rng.integers(2, 30)))
+        dividend, last_price = rng.uniform(5, 15), rng.uniform(1, 199)
+        specialist = Specialist(10, MAX_PRICE, MIN_PRICE, sum(inv.stock_qty for inv in investors), 0.005, 0.005,
+                                numeric=float)
+        engine = PopulationEngine.from_investors(investors)
+        roots, jumps, grid, excess = brute_force(engine, dividend)
+        price, _, is_rationed, unrestricted_price = specialist.exact_price(last_price, dividend, investors, 0,
+                                                                           engine=engine)
+        scalar_price, _, scalar_rationed, _ = specialist.exact_price(last_price, dividend, investors, 0)
+        assert scalar_price == pytest.approx(price, abs=1e-9)
+        assert scalar_rationed == is_rationed
+        if roots:
+            kinds.add('root')
+            # com raiz contínua o mercado se ajusta, na raiz mais próxima do último preço
+            assert not is_rationed
+            assert price == pytest.approx(min(roots, key=lambda p: abs(p - last_price)), abs=1e-6)
+        elif jumps:
+            kinds.add('jump')
+            # o excesso troca de sinal só em saltos: fica o salto mais próximo do último preço, com racionamento
+            assert is_rationed
+            assert price == pytest.approx(min(jumps, key=lambda p: abs(p - last_price)), abs=1e-6)
+        else:
+            kinds.add('none')
+            # sem troca de sinal: nenhum preço da grade tem excesso menor em módulo
+            assert is_rationed
+            assert abs(excess(price)) <= np.abs(excess(grid[:, None])).min() + 1e-6
+        # preço sem restrições: soma das demandas ótimas sem caixa nem venda a descoberto igual a zero
+        selection = engine.select(0)
+        _, _, a, b, sigma = selection
+        optimal = (a * (unrestricted_price + dividend) + b - unrestricted_price * (1 + engine.risk_free)) / (
+            engine.risk_aversion * sigma)
+        assert (optimal - engine.stock_qty).sum() == pytest.approx(0, abs=1e-6)
+    assert kinds == {'root', 'jump', 'none'}
@@ -0,0 +1,99 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import numpy as np
+import pytest
+
+from LiveMetrics import LiveMetricsReader
+
+CAPACITY = 16
+
+# o writer roda em outro processo, como na simulação: o bloco pertence a ele, e o resource_tracker do processo de
+# teste não o remove quando o leitor fecha
+WRITER = """
+import sys
+from LiveMetrics import LiveMetricsWriter
+writer = LiveMetricsWriter(sys.argv[1], capacity=int(sys.argv[2]))
+step = 0
+print('ready', flush=True)
+for line in sys.stdin:
+    command, n = line.split()
+    if command == 'close':
+        break
+    for _ in range(int(n)):
+        writer.publish(step, step + 0.5, 2. * step, False, 1.)
+        step += 1
+    print(step, flush=True)
+writer.close()
+"""
+
+
+@pytest.fixture
+def writer():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    name = 'sfi_test_{}'.format(uuid.uuid4().hex[:12])
+    process = subprocess.Popen([sys.executable, '-c', WRITER, name, str(CAPACITY)], cwd=root, text=True,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    assert process.stdout.readline().strip() == 'ready'
+
+    def publish(n, wait=True):
+        process.stdin.write('publish {}\n'.format(n))
+        process.stdin.flush()
+        if wait:
+            return int(process.stdout.readline())
+
+    publish.name = name
+    publish.wait = lambda: int(process.stdout.readline())
+    yield publish
+    process.stdin.write('close 0\n')
+    process.stdin.flush()
+    assert process.wait(timeout=10) == 0
+
+
+def assert_consistent(data):
+    # linhas inteiras (preço e dividendo do mesmo passo) e passos consecutivos
+    np.testing.assert_array_equal(data.price, data.step + 0.5)
+    np.testing.assert_array_equal(data.dividend, 2 * data.step)
+    np.testing.assert_array_equal(np.diff(data.step), 1)
+
+
+def test_reader_discards_rows_overwritten_between_reads(writer):
+    reader = LiveMetricsReader(writer.name)
+    try:
+        assert reader.capacity == CAPACITY
+        writer(10)
+        first = reader.read_new()
+        assert first.step.tolist() == list(range(10))
+        # 40 passos entre as leituras dão a volta no buffer mais de uma vez; a linha mais antiga pode estar sendo
+        # reescrita e é descartada
+        assert writer(40) == 50
+        second = reader.read_new()
+        assert second.step.tolist() == list(range(50 - CAPACITY + 1, 50))
+        assert_consistent(second)
+        assert reader.read_new().step.tolist() == []
+        writer(3)
+        assert reader.read_new().step.tolist() == [50, 51, 52]
+        assert reader.read(5).step.tolist() == list(range(48, 53))
+        assert reader.read().step.tolist() == list(range(53 - CAPACITY + 1, 53))
+    finally:
+        reader.close()
+
+
+def test_reads_during_writes_return_whole_consecutive_rows(writer):
+    reader = LiveMetricsReader(writer.name)
+    total = 200000
+    try:
+        writer(total, wait=False)
+        reads = 0
+        while reader.count < total:
+            data = reader.read()
+            assert len(data) <= CAPACITY - 1
+            assert_consistent(data)
+            reads += 1
+        assert writer.wait() == total
+        assert reads > 10
+        assert reader.read().step[-1] == total - 1
+    finally:
+        reader.close()
@@ -0,0 +1,112 @@
+from decimal import Decimal
+from fractions import Fraction
+from statistics import mean
+
+import numpy as np
+import pytest
+
+from Market import MarketInfo
+
+
+def reference_state(price_history, dividend_history, risk_free, num, step, previous_state):
+    """
+    Os 64 bits calculados diretamente sobre o histórico com statistics.mean, como o MarketInfo fazia antes do
+    StateCalculator
+    """
+    p, d = price_history, dividend_history
+    state = list(previous_state)
+    dividend_ratio = num(d[-1]) / num(mean(d))
+    price_ratio = num(p[-1]) / num(mean(p))
+    price_interest_ratio = num(p[-1]) * risk_free / num(mean(d))
+    for n, limit in enumerate((0.6, 0.8, 0.9, 1.1, 1.12, 1.4)):
+        state[n] = bool(dividend_ratio > limit)
+    for n, limit in enumerate((0.25, 0.5, 0.75, .875, 1, 1.125, 1.25)):
+        state[6 + n] = bool(price_ratio > limit)
+    for n, limit in enumerate((0.25, 0.5, 0.75, .875, .95, 1, 1.125)):
+        state[13 + n] = bool(price_interest_ratio > limit)
+    if step > 10:
+        for j in range(1, 7):
+            state[19 + j] = bool(p[-j] - p[-j - 1] > 0)
+        for j in range(1, 5):
+            state[25 + j] = bool(d[-j] - d[-j - 1] > 0)
+    for n, k in enumerate((5, 10, 20, 100, 500)):
+        state[30 + n] = bool(mean(p[-k:]) > mean(p[-k - 1:-1]))
+        state[39 + n] = bool(p[-1] > mean(p[-k:]))
+    for n, k in enumerate((5, 10, 100, 500)):
+        state[35 + n] = bool(mean(d[-k:]) > mean(d[-k - 1:-1]))
+        state[44 + n] = bool(d[-1] > mean(d[-k:]))
+    pairs = [(5, 10), (5, 100), (5, 500), (10, 100), (10, 500), (100, 500)]
+    for n, (short, long) in enumerate(pairs):
+        state[48 + n] = bool(mean(d[-short:]) > mean(d[-long:]))
+    pairs = [(5, 10), (5, 20), (5, 100), (5, 500), (10, 20), (10, 100), (10, 500), (20, 100), (20, 500), (100, 500)]
+    for n, (short, long) in enumerate(pairs):
+        state[54 + n] = bool(mean(p[-short:]) > mean(p[-long:]))
+    return state
+
+
+def market_path(rng, n_steps):
+    """
+    Preços e dividendos com trechos repetidos e preços presos nos limites da simulação, onde as médias empatam
+    """
+    prices = np.clip(80 + np.cumsum(rng.normal(0, 8, n_steps)), 0.01, 200)
+    dividends = 10 + np.cumsum(rng.normal(0, 0.3, n_steps))
+    repeated = rng.random(n_steps) < 0.2
+    for t in np.flatnonzero(repeated[1:]) + 1:
+        prices[t] = prices[t - 1]
+        dividends[t] = dividends[t - 1]
+    return prices, dividends
+
+
+@pytest.mark.parametrize('num', [Decimal, float])
+def test_incremental_state_matches_direct_means(num):
+    rng = np.random.default_rng(4)
+    market = MarketInfo(10, numeric=num)
+    prices, dividends = market_path(rng, 650)
+    price_history, dividend_history = [], []
+    state = [0 for i in range(0, 64)]
+    for step, (price, dividend) in enumerate(zip(prices, dividends)):
+        # mesma sequência de chamadas da simulação, com o histórico limitado a 505 elementos
+        price, dividend = num(float(price)), num(float(dividend))
+        market.update_history(price, dividend)
+        price_history.append(price)
+        dividend_history.append(dividend)
+        if step > 0:
+            market.update_info_state(step)
+            state = reference_state(price_history, dividend_history, market.risk_free, num, step, state)
+            assert market.current_state == state, 'passo {}'.format(step)
+        market.unburden_history()
+        if len(price_history) >= 505:
+            del price_history[0]
+            del dividend_history[0]
+
+
+@pytest.mark.parametrize('capacity', [8, 50, 120])
+def test_window_sums_follow_a_short_history(capacity):
+    # com histórico menor que as janelas de 100 e 500 passos, as médias são as do histórico retido
+    rng = np.random.default_rng(5)
+    market = MarketInfo(10, numeric=float, history_capacity=capacity)
+    prices, dividends = market_path(rng, 300)
+    price_history, dividend_history = [], []
+    state = [0 for i in range(0, 64)]
+    calculator = market.state_calculator
+    for step, (price, dividend) in enumerate(zip(prices.tolist(), dividends.tolist())):
+        market.update_history(price, dividend)
+        price_history.append(price)
+        dividend_history.append(dividend)
+        for history, sums in ((price_history, calculator.price_sums), (dividend_history, calculator.dividend_sums)):
+            assert sums['all'] == sum(map(Fraction, history))
+            for k in calculator.windows:
+                assert sums[k] == sum(map(Fraction, history[-k:])), 'passo {}, janela {}'.format(step, k)
+        if step > 0:
+            market.update_info_state(step)
+            state = reference_state(price_history, dividend_history, market.risk_free, float, step, state)
+            assert market.current_state == state, 'passo {}'.format(step)
+        market.unburden_history()
+        if len(price_history) >= capacity:
+            del price_history[0]
+            del dividend_history[0]
+
+
+def test_history_too_short_for_the_trend_bits_is_rejected():
+    with pytest.raises(ValueError):
+        MarketInfo(10, history_capacity=7)
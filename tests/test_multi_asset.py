@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from Agents import Specialist
+from MultiAsset import MultiAssetSimulation
+from Population import AGENT_ARRAYS, RULE_ARRAYS, PopulationEngine
+from Simulation import Simulation
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_single_asset_reproduces_the_clearing_price_path(seed):
+    simulation = Simulation(10, 60, numeric='float', seed=seed)
+    records = list(simulation.iter_steps(new_agents=True, vectorized=True, write_output=False,
+                                         price_setting='clearing'))
+    result = MultiAssetSimulation(10, 1, 60, seed=seed).run()
+    np.testing.assert_array_equal(result['prices'][:, 0], [record.price for record in records])
+    np.testing.assert_array_equal(result['dividends'][:, 0], [record.dividend for record in records])
+    np.testing.assert_array_equal(result['is_rationed'][:, 0], [record.is_rationed for record in records])
+    excess = [record.excess_demand for record in MultiAssetSimulation(10, 1, 60, seed=seed).iter_steps()]
+    np.testing.assert_allclose(np.ravel(excess), [record.excess_demand for record in records], atol=1e-9)
+
+
+def asset_engine(engine, asset, n_agents):
+    """
+    :return: PopulationEngine só com as linhas do ativo asset
+    """
+    rows = slice(asset * n_agents, (asset + 1) * n_agents)
+    single = PopulationEngine(n_agents, engine.n_rules)
+    for name in RULE_ARRAYS + AGENT_ARRAYS:
+        getattr(single, name)[...] = getattr(engine, name)[rows]
+    return single
+
+
+def test_each_asset_clears_like_a_single_asset_market():
+    n_agents, n_assets = 10, 3
+    simulation = MultiAssetSimulation(n_agents, n_assets, 80, seed=4)
+    clear = simulation.clear
+    checked = []
+
+    def checked_clear(dividends, selection):
+        prices, demands, is_rationed = clear(dividends, selection)
+        for k, market in enumerate(simulation.markets):
+            specialist = Specialist(6, simulation.max_price, simulation.min_price, simulation.num_shares[k], 1e-3,
+                                    0.005, numeric=float)
+            price, single_demands, rationed, _ = specialist.find_price(
+                dividends[k], None, market.state_word, engine=asset_engine(simulation.engine, k, n_agents))
+            assert rationed == is_rationed[k]
+            np.testing.assert_allclose(prices[k], price, rtol=1e-12)
+            np.testing.assert_allclose(demands[k], single_demands, rtol=1e-9, atol=1e-12)
+            if rationed:
+                # as compras racionadas somam exatamente as ofertas
+                assert abs(demands[k].sum()) < 1e-9
+        checked.append(is_rationed)
+        return prices, demands, is_rationed
+
+    simulation.clear = checked_clear
+    excess = np.array([record.excess_demand for record in simulation.iter_steps()])
+    assert len(checked) == 80
+    assert np.any(checked) and not np.all(checked)
+    # as ações de cada ativo mudam exatamente pela soma das demandas negociadas
+    np.testing.assert_allclose(simulation.stock_qty.sum(axis=1), n_agents + excess.sum(axis=0), rtol=1e-9)
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from Simulation import Simulation
+
+# com esta semente nenhum estado do mercado cai exatamente em um limite de condição. Em um empate (ex. preço 200 e
+# dividendo 10 no bit 18, preço * juros / dividendo > 1) Decimal(0.05) é um pouco maior que o float 0.05 e os dois
+# modos seguem caminhos diferentes, o que é esperado
+SEED = 3
+
+
+def price_path(numeric, price_setting, vectorized, n_steps=150):
+    simulation = Simulation(10, n_steps, numeric=numeric, seed=SEED)
+    return np.array([float(record.price) for record in simulation.iter_steps(
+        price_setting=price_setting, new_agents=True, vectorized=vectorized, write_output=False)])
+
+
+@pytest.mark.parametrize('price_setting, vectorized', [
+    ('auction', False), ('clearing', False), ('exact', False), ('clearing', True), ('exact', True)])
+def test_decimal_and_float_price_paths_agree(price_setting, vectorized):
+    decimal_path = price_path('decimal', price_setting, vectorized)
+    float_path = price_path('float', price_setting, vectorized)
+    # o caminho passa por vários algoritmos genéticos e não fica parado nos limites de preço
+    assert len(np.unique(float_path.round(2))) > 30
+    np.testing.assert_allclose(decimal_path, float_path, rtol=1e-9)
@@ -0,0 +1,50 @@
+import os
+from decimal import Decimal
+
+import numpy as np
+import pytest
+
+from Output import COLUMNS, STEP_DTYPE, open_sink, read_output
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'npz'])
+def test_sink_creates_the_output_directory(tmp_path, output_format):
+    filepath = str(tmp_path / 'output' / 'run' / 'price.{}'.format(output_format))
+    with open_sink(filepath, output_format) as sink:
+        sink.write(0, 100., 10., 0., 1., False, 0.1, 0.)
+    assert os.path.exists(filepath)
+    assert list(read_output(filepath)['price']) == [100.]
+
+
+def sample_rows(n):
+    rng = np.random.default_rng(8)
+    return [(step, float(rng.uniform(0.01, 200)), float(rng.normal(10, 0.3)), 0., float(rng.uniform(0, 5)),
+             bool(rng.random() < 0.3), float(rng.random()), float(rng.normal())) for step in range(n)]
+
+
+@pytest.mark.parametrize('output_format', ['csv', 'npz'])
+@pytest.mark.parametrize('n_rows', [0, 1, 7, 25])
+def test_read_output_round_trip(tmp_path, output_format, n_rows):
+    filepath = str(tmp_path / 'price.{}'.format(output_format))
+    rows = sample_rows(n_rows)
+    # blocos de 7 linhas: várias gravações e uma última parcial
+    with open_sink(filepath, output_format, flush_every=7) as sink:
+        for row in rows:
+            sink.write(*row)
+    table = read_output(filepath)
+    assert list(table) == list(COLUMNS)
+    for n, column in enumerate(COLUMNS):
+        assert table[column].dtype == STEP_DTYPE[column]
+        np.testing.assert_array_equal(table[column], [row[n] for row in rows], err_msg=column)
+
+
+def test_csv_keeps_decimal_values(tmp_path):
+    filepath = str(tmp_path / 'price.csv')
+    price = Decimal('80.123456789012345678901234567')
+    with open_sink(filepath, 'csv') as sink:
+        sink.write(3, price, Decimal(10), 0, 0, True, 0.5, Decimal('-0.25'))
+    with open(filepath) as f:
+        assert str(price) in f.read()
+    table = read_output(filepath)
+    assert table['price'][0] == float(price)
+    assert table['is_rationed'][0] == 1
@@ -0,0 +1,227 @@
+import numpy as np
+import pytest
+
+from Population import PopulationEngine, pack_rows, popcount
+from Simulation import Simulation
+
+
+def assert_objects_match_engine(simulation):
+    engine = simulation.engine
+    stored = PopulationEngine.from_investors(simulation.investors)
+    for name in ('care', 'value', 'alpha', 'beta', 'accuracy', 'specificity', 'cash', 'stock_qty'):
+        np.testing.assert_array_equal(getattr(stored, name), getattr(engine, name), err_msg=name)
+    medians = [float(agent.median_accuracy) for agent in simulation.investors]
+    np.testing.assert_array_equal(medians, simulation.median_accuracy)
+
+
+@pytest.mark.parametrize('numeric', ['decimal', 'float'])
+def test_vectorized_run_creates_objects_on_demand(tmp_path, numeric):
+    simulation = Simulation(10, 35, numeric=numeric, seed=1, agents_filepath=str(tmp_path / 'Investors.pickle'))
+    for _ in simulation.iter_steps(new_agents=True, vectorized=True, write_output=False):
+        pass
+    assert simulation.engine_only
+    assert_objects_match_engine(simulation)
+    assert not simulation.engine_only
+
+
+@pytest.mark.parametrize('numeric', ['decimal', 'float'])
+def test_existing_objects_follow_the_engine(tmp_path, numeric):
+    # os agentes aquecidos chegam como objetos, que são mantidos e atualizados só quando lidos
+    simulation = Simulation(10, 35, numeric=numeric, seed=1, agents_filepath=str(tmp_path / 'Investors.pickle'))
+    steps = simulation.iter_steps(vectorized=True, write_output=False, burn_in_steps=12)
+    for record in steps:
+        if record.step == 15:
+            assert_objects_match_engine(simulation)
+    assert not simulation.engine_only
+    assert_objects_match_engine(simulation)
+
+
+def test_vectorized_run_with_float32_memmap_storage(tmp_path):
+    simulation = Simulation(10, 25, numeric='float', seed=1, engine_dtype='float32',
+                            engine_dir=str(tmp_path / 'population'))
+    prices = [record.price for record in simulation.iter_steps(new_agents=True, vectorized=True, write_output=False)]
+    engine = simulation.engine
+    assert engine.alpha.dtype == engine.accuracy.dtype == np.float32
+    assert isinstance(engine.accuracy, np.memmap)
+    engine.flush()
+    np.testing.assert_array_equal(np.load(str(tmp_path / 'population' / 'accuracy.npy')), engine.accuracy)
+    assert len(set(prices)) > 5
+
+
+def random_engine(dtype=np.float64, filepath=None, n_agents=30):
+    engine = PopulationEngine.random(n_agents, rng=np.random.default_rng(3), dtype=dtype, filepath=filepath)
+    # accuracies diferentes entre as regras, como depois de alguns passos
+    engine.accuracy[...] = np.random.default_rng(4).uniform(0.5, 8, engine.accuracy.shape)
+    return engine
+
+
+def run_kernels(engine, states, genetic=True):
+    prices = np.linspace(80, 95, len(states))
+    for t, state in enumerate(states[1:], 1):
+        engine.select(state)
+        engine.update_accuracy(state, prices[t], prices[t - 1], 10., 10.2, 75)
+    if genetic:
+        engine.genetic_algo(np.arange(0, engine.n_agents, 3), 0.3, engine.median_accuracy(),
+                            rng=np.random.default_rng(5))
+
+
+def market_states(n):
+    # metade dos bits ligados, para que parte das regras de cada agente fique ativa
+    return [int(x) for x in np.random.default_rng(6).integers(0, 2 ** 63, n, dtype=np.uint64)]
+
+
+def test_chunked_kernels_match_a_single_chunk():
+    whole, chunked = random_engine(), random_engine()
+    whole.chunk_rules = whole.n_agents * whole.n_rules
+    chunked.chunk_rules = 7 * chunked.n_rules
+    assert len(chunked.chunks()) == 5
+    states = market_states(12)
+    for state in states + [np.array(states[:1] * chunked.n_agents, dtype=np.uint64)]:
+        for a, b in zip(whole.select(state), chunked.select(state)):
+            np.testing.assert_array_equal(a, b)
+    np.testing.assert_array_equal(whole.median_accuracy(), chunked.median_accuracy())
+    agents = np.arange(0, whole.n_agents, 2)
+    np.testing.assert_array_equal(np.sort(whole.rank_rules(agents), axis=1),
+                                  np.sort(chunked.rank_rules(agents), axis=1))
+    run_kernels(whole, states)
+    run_kernels(chunked, states)
+    for name in ('care', 'value', 'alpha', 'beta', 'accuracy', 'specificity'):
+        np.testing.assert_array_equal(getattr(whole, name), getattr(chunked, name), err_msg=name)
+
+
+@pytest.mark.parametrize('dtype', [np.float64, np.float32])
+def test_memmap_population_round_trips_through_open_and_flush(tmp_path, dtype):
+    filepath = str(tmp_path / 'population')
+    engine = random_engine(dtype, filepath)
+    run_kernels(engine, market_states(8))
+    engine.cash[:5] = 123.5
+    engine.flush()
+    reopened = PopulationEngine.open(filepath, mode='r')
+    assert (reopened.n_agents, reopened.n_rules) == engine.care.shape
+    assert reopened.dtype == dtype
+    for name in ('care', 'value', 'alpha', 'beta', 'accuracy', 'specificity', 'cash', 'stock_qty', 'risk_free',
+                 'risk_aversion'):
+        assert getattr(reopened, name).dtype == getattr(engine, name).dtype, name
+        np.testing.assert_array_equal(getattr(reopened, name), getattr(engine, name), err_msg=name)
+    states = market_states(3)
+    for a, b in zip(engine.select(states[-1]), reopened.select(states[-1])):
+        np.testing.assert_array_equal(a, b)
+    # alterações feitas numa população reaberta para escrita também chegam ao disco
+    writable = PopulationEngine.open(filepath)
+    run_kernels(writable, states, genetic=False)
+    writable.flush()
+    np.testing.assert_array_equal(PopulationEngine.open(filepath, mode='r').accuracy, writable.accuracy)
+
+
+def test_float32_accuracy_storage_follows_float64():
+    single, double = random_engine(np.float32), random_engine()
+    # mesmas regras nos dois, com os coeficientes já arredondados para float32
+    for name in ('alpha', 'beta', 'accuracy'):
+        getattr(double, name)[...] = getattr(single, name)
+    states = market_states(15)
+    run_kernels(single, states, genetic=False)
+    run_kernels(double, states, genetic=False)
+    for name in ('alpha', 'beta', 'accuracy'):
+        assert getattr(single, name).dtype == np.float32, name
+    assert single.median_accuracy().dtype == np.float32
+    assert all(x.dtype == np.float32 for x in single.select(states[-1])[2:])
+    assert single.accuracy_changed.any()
+    np.testing.assert_allclose(single.accuracy, double.accuracy, rtol=1e-5)
+    np.testing.assert_allclose(single.median_accuracy(), double.median_accuracy(), rtol=1e-5)
+
+
+def ga_population(seed, n_agents=20):
+    """
+    População com os três valores de bit em proporções iguais e accuracies distintas, para que as transições de bit
+    da mutação apareçam em número suficiente e a accuracy identifique a regra mutada (recebe a mediana)
+    """
+    rng = np.random.default_rng(seed)
+    engine = PopulationEngine.random(n_agents, rng=rng)
+    watch = rng.integers(0, 3, (n_agents, engine.n_rules, 64))
+    engine.care[...], engine.value[...] = pack_rows(watch != 2), pack_rows(watch == 1)
+    engine.specificity[...] = (watch != 2).sum(axis=2)
+    engine.accuracy[...] = rng.uniform(0.5, 8, engine.accuracy.shape)
+    return engine
+
+
+def watch_lists(care, value):
+    bits = np.arange(64, dtype=np.uint64)
+    care_bits, value_bits = (care[:, None] >> bits) & 1, (value[:, None] >> bits) & 1
+    return np.where(care_bits == 1, value_bits, 2)
+
+
+def ga_counts(before, after, slots, median):
+    """
+    Contagens das regras trocadas pelo algoritmo genético: mutadas, coeficientes mantidos e variados até 5% na
+    mutação, transições de bit da mutação, e no cruzamento coeficientes copiados de uma regra, alpha e beta copiados
+    da mesma regra, regras quase iguais à regra copiada e bits em uso
+    """
+    rows = np.repeat(np.arange(before.n_agents), slots.shape[1])
+    cols = slots.ravel()
+    mutated = after.accuracy[rows, cols] == median[rows]
+    counts = dict(replaced=len(rows), mutated=mutated.sum())
+    alpha_0, alpha_1 = before.alpha[rows, cols][mutated], after.alpha[rows, cols][mutated]
+    counts.update(kept=(alpha_0 == alpha_1).sum(), scaled=(np.abs(alpha_1 / alpha_0 - 1) <= 0.05).sum())
+    old = watch_lists(before.care[rows, cols][mutated], before.value[rows, cols][mutated])
+    new = watch_lists(after.care[rows, cols][mutated], after.value[rows, cols][mutated])
+    counts['transitions'] = np.array([[((old == i) & (new == j)).sum() for j in range(3)] for i in range(3)])
+    crossed_rows, crossed_cols = rows[~mutated], cols[~mutated]
+    alpha, beta = after.alpha[crossed_rows, crossed_cols], after.beta[crossed_rows, crossed_cols]
+    alpha_source = before.alpha[crossed_rows] == alpha[:, None]
+    beta_source = before.beta[crossed_rows] == beta[:, None]
+    copied = alpha_source.any(axis=1)
+    # bits iguais aos da regra de onde alpha foi copiado: com os pais sorteados bit a bit com a mesma chance, cerca
+    # de 2/3 dos bits, e raramente 3/4 ou mais
+    parent = alpha_source[copied].argmax(axis=1)
+    parent_watch = watch_lists(before.care[crossed_rows[copied], parent], before.value[crossed_rows[copied], parent])
+    child_watch = watch_lists(after.care[crossed_rows, crossed_cols][copied],
+                              after.value[crossed_rows, crossed_cols][copied])
+    counts.update(crossed=len(crossed_rows), copied=copied.sum(),
+                  same_parent=(alpha_source & beta_source).any(axis=1)[copied].sum(),
+                  close_to_parent=((parent_watch == child_watch).sum(axis=1) >= 48).sum(),
+                  care_bits=popcount(after.care[crossed_rows, crossed_cols]).sum())
+    return counts
+
+
+def assert_same_rate(k_1, n_1, k_2, n_2, label):
+    # diferença entre duas proporções binomiais, com folga de 4.5 desvios padrão
+    p = (k_1 + k_2) / (n_1 + n_2)
+    tolerance = 4.5 * np.sqrt(p * (1 - p) * (1 / n_1 + 1 / n_2)) + 1e-12
+    assert abs(k_1 / n_1 - k_2 / n_2) <= tolerance, '{}: {}/{} e {}/{}'.format(label, k_1, n_1, k_2, n_2)
+
+
+def test_batched_genetic_algo_matches_the_scalar_rates():
+    genetic_param, draws = 0.3, 40
+    totals = {'scalar': [], 'engine': []}
+    for draw in range(draws):
+        before = ga_population(draw)
+        median = before.median_accuracy()
+        slots = before.rank_rules(np.arange(before.n_agents))
+        investors = before.to_investors(float)
+        for investor, (mutation_seed, crossover_seed), index_list in zip(
+                investors, np.random.default_rng(100 + draw).integers(0, 2 ** 32, (len(investors), 2)), slots):
+            investor.update_median_accuracy()
+            investor.genetic_algo(genetic_param, np.random.default_rng(mutation_seed),
+                                  np.random.default_rng(crossover_seed), index_list=index_list)
+        totals['scalar'].append(ga_counts(before, PopulationEngine.from_investors(investors), slots, median))
+        after = ga_population(draw)
+        after.genetic_algo(np.arange(after.n_agents), genetic_param, median, rng=np.random.default_rng(200 + draw),
+                           slots=slots)
+        totals['engine'].append(ga_counts(before, after, slots, median))
+    scalar, engine = ({key: sum(c[key] for c in counts) for key in counts[0]} for counts in totals.values())
+    assert_same_rate(scalar['mutated'], scalar['replaced'], engine['mutated'], engine['replaced'], 'mutação')
+    assert abs(engine['mutated'] / engine['replaced'] - genetic_param) < 0.02
+    for key in ('kept', 'scaled'):
+        assert_same_rate(scalar[key], scalar['mutated'], engine[key], engine['mutated'], key)
+    for i in range(3):
+        for j in range(3):
+            assert_same_rate(scalar['transitions'][i, j], scalar['transitions'][i].sum(), engine['transitions'][i, j],
+                             engine['transitions'][i].sum(), 'bit {} -> {}'.format(i, j))
+    assert engine['transitions'][0, 1] > 100
+    assert_same_rate(scalar['copied'], scalar['crossed'], engine['copied'], engine['crossed'], 'coeficientes copiados')
+    assert_same_rate(scalar['same_parent'], scalar['copied'], engine['same_parent'], engine['copied'], 'mesmo pai')
+    assert_same_rate(scalar['close_to_parent'], scalar['copied'], engine['close_to_parent'], engine['copied'],
+                     'bits do pai')
+    assert_same_rate(scalar['care_bits'], 64 * scalar['crossed'], engine['care_bits'], 64 * engine['crossed'],
+                     'bits em uso')
+
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from Simulation import Simulation
+
+
+def run(tmp_path, seed, vectorized=False, numeric='float', price_setting='auction', **kwargs):
+    simulation = Simulation(10, 40, numeric=numeric, seed=seed, agents_filepath=str(tmp_path / 'Investors.pickle'),
+                            **kwargs)
+    records = list(simulation.iter_steps(new_agents=True, vectorized=vectorized, write_output=False,
+                                         price_setting=price_setting))
+    return records, simulation
+
+
+@pytest.mark.parametrize('numeric', ['decimal', 'float'])
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_same_seed_repeats_and_other_seeds_differ(tmp_path, numeric, vectorized):
+    first, _ = run(tmp_path, 11, vectorized, numeric)
+    second, _ = run(tmp_path, 11, vectorized, numeric)
+    other, _ = run(tmp_path, 12, vectorized, numeric)
+    assert first == second
+    assert [r.price for r in first] != [r.price for r in other]
+    assert [r.dividend for r in first] != [r.dividend for r in other]
+
+
+def test_simulations_without_seed_differ(tmp_path):
+    first, _ = run(tmp_path, None)
+    second, _ = run(tmp_path, None)
+    assert [r.dividend for r in first] != [r.dividend for r in second]
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_telemetry_does_not_change_the_price_path(tmp_path, vectorized):
+    plain, _ = run(tmp_path, 13, vectorized)
+    observed, simulation = run(tmp_path, 13, vectorized, telemetry_interval=3, instrument=True)
+    assert observed == plain
+    assert len(simulation.telemetry.arrays()['step']) > 10
+
+
+def test_streams_are_independent(tmp_path):
+    base, base_simulation = run(tmp_path, 14, price_setting='clearing')
+    # outro parâmetro do algoritmo genético muda preços e regras, mas não os dividendos nem a população inicial
+    changed, changed_simulation = run(tmp_path, 14, price_setting='clearing', genetic_param=0.2)
+    assert [r.price for r in base] != [r.price for r in changed]
+    assert [r.dividend for r in base] == [r.dividend for r in changed]
+    # o primeiro algoritmo genético roda no passo 10: até ali, mesma população e mesmos preços
+    assert [r.price for r in base[:10]] == [r.price for r in changed[:10]]
+    for name in ('dividends', 'agents'):
+        assert (base_simulation.rngs[name].bit_generator.state ==
+                changed_simulation.rngs[name].bit_generator.state), name
+    streams = [np.random.default_rng(seed).random(4).tolist() for seed in
+               np.random.SeedSequence(14).spawn(len(base_simulation.rngs))]
+    assert len({tuple(s) for s in streams}) == len(streams)
@@ -0,0 +1,76 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from Agents import Rule
+from Market import pack_bits
+from Output import NullSink
+from Simulation import Simulation
+
+
+def masks(watch_list):
+    return pack_bits(i != 2 for i in watch_list), pack_bits(i == 1 for i in watch_list)
+
+
+def test_watch_list_changes_only_through_assignment():
+    watch_list = [2] * 64
+    watch_list[:3] = [1, 0, 1]
+    rule = Rule(watch_list, numeric=float)
+    # a lista de quem criou a regra não é compartilhada com ela
+    watch_list[5] = 1
+    assert rule.watch_list[5] == 2
+    with pytest.raises(TypeError):
+        rule.watch_list[5] = 1
+    assert isinstance(rule.watch_list, tuple)
+    assert (rule.care_mask, rule.value_mask) == masks(rule.watch_list) == (0b111, 0b101)
+    rule.watch_list = watch_list
+    assert (rule.care_mask, rule.value_mask) == masks(watch_list)
+    assert rule.is_active(0b100101) and not rule.is_active(0b000101)
+
+
+def test_rule_from_masks_builds_a_matching_watch_list():
+    rule = Rule.from_masks(0b1101, 0b0100, numeric=float)
+    assert rule.watch_list[:4] == (0, 2, 1, 0)
+    assert masks(rule.watch_list) == (rule.care_mask, rule.value_mask)
+
+
+def test_mutation_keeps_watch_list_and_masks_in_sync():
+    rng = np.random.default_rng(1)
+    rule = Rule(list(rng.integers(0, 3, 64)), numeric=float)
+    for _ in range(200):
+        rule.mutate_rule(rng=rng)
+        assert isinstance(rule.watch_list, tuple)
+        assert masks(rule.watch_list) == (rule.care_mask, rule.value_mask)
+        assert rule.specificity == 64 - rule.watch_list.count(2)
+
+
+def test_rules_saved_with_a_watch_list_load_as_a_tuple():
+    rule = Rule([1, 0] + [2] * 62, numeric=float)
+    state = rule.__getstate__()
+    # formato antigo: só a watch_list, como lista
+    state.pop('care_mask'), state.pop('value_mask')
+    state['watch_list'] = list(state.pop('_watch_list'))
+    old = Rule.__new__(Rule)
+    old.__setstate__(state)
+    assert old.watch_list == rule.watch_list
+    assert (old.care_mask, old.value_mask) == (rule.care_mask, rule.value_mask)
+    assert pickle.loads(pickle.dumps(old)).watch_list == rule.watch_list
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_cached_rule_fitness_follows_the_rules(tmp_path, vectorized):
+    simulation = Simulation(8, 45, numeric='decimal', seed=2, agents_filepath=str(tmp_path / 'Investors.pickle'))
+    # objetos criados antes da simulação, que no modo vetorizado recebem as trocas do PopulationEngine
+    simulation.initialiaze_agents(vectorized=vectorized)
+    investors = simulation.investors
+    for agent in investors:
+        agent.rule_fitness()
+    sink = NullSink()
+    for step in range(simulation.n_steps):
+        simulation.run_step(step, sink)
+        if step % 7 == 0:
+            for agent in simulation.investors:
+                np.testing.assert_array_equal(agent.rule_fitness(),
+                                              [float(rule.fitness) for rule in agent.trading_rules])
+    assert simulation.investors[0] is investors[0]
@@ -0,0 +1,39 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+from Output import read_output
+
+# importar main leva cerca de 0.2 s (numpy incluso); pandas sozinho somaria uns 0.3 s
+IMPORT_BUDGET = 1.0
+HEAVY_MODULES = ('pandas', 'progressbar')
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import main
+print(json.dumps({'seconds': time.perf_counter() - start, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (HEAVY_MODULES,)
+
+
+def test_import_main_is_fast_and_skips_heavy_modules():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # processo novo para que nenhum módulo já importado pelos outros testes conte
+    output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=root, check=True, capture_output=True, text=True)
+    result = json.loads(output.stdout.splitlines()[-1])
+    assert result['loaded'] == []
+    assert result['seconds'] < IMPORT_BUDGET
+
+
+def test_main_runs_in_a_fresh_checkout(tmp_path):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # um checkout novo tem os agentes salvos, mas não o diretório output/
+    shutil.copytree(os.path.join(root, 'StoredAgents'), str(tmp_path / 'StoredAgents'))
+    subprocess.run([sys.executable, os.path.join(root, 'main.py'), '--n-steps', '15'], cwd=str(tmp_path), check=True,
+                   capture_output=True, text=True)
+    outputs = os.listdir(str(tmp_path / 'output'))
+    assert len(outputs) == 1 and outputs[0].endswith('.csv')
+    # a linha do estado inicial e uma por passo
+    assert len(read_output(str(tmp_path / 'output' / outputs[0]))['step']) == 16
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from Agents import Investor
+from Population import PopulationEngine
+from Simulation import Simulation
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_telemetry_is_recorded_before_the_genetic_algorithm(tmp_path, monkeypatch, vectorized):
+    simulation = Simulation(10, 25, numeric='float', seed=9, telemetry_interval=1,
+                            agents_filepath=str(tmp_path / 'Investors.pickle'))
+    recorded = []
+    owner = PopulationEngine if vectorized else Investor
+    genetic_algo = owner.genetic_algo
+
+    def spy(self, *args, **kwargs):
+        # amostras da telemetria já gravadas quando as regras são trocadas
+        recorded.append(simulation.telemetry.size)
+        return genetic_algo(self, *args, **kwargs)
+
+    monkeypatch.setattr(owner, 'genetic_algo', spy)
+    for _ in simulation.iter_steps(new_agents=True, vectorized=vectorized, write_output=False):
+        pass
+    # algoritmo genético nos passos 10 e 20 (uma chamada por agente no modo escalar); o registro do passo já existe
+    calls = 1 if vectorized else 10
+    assert recorded == [11] * calls + [21] * calls
+    steps = simulation.telemetry.arrays()['step']
+    np.testing.assert_array_equal(steps, np.arange(25))
+
+
+def counters(tmp_path, vectorized, ga_frquency):
+    simulation = Simulation(40, 11, numeric='float', seed=9, ga_frquency=ga_frquency, instrument=True,
+                            agents_filepath=str(tmp_path / 'Investors.pickle'))
+    for _ in simulation.iter_steps(new_agents=True, vectorized=vectorized, write_output=False):
+        pass
+    return simulation.instrumentation.report()['counters']
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_rule_counters_use_the_rules_that_formed_the_price(tmp_path, vectorized):
+    # o único algoritmo genético roda no último passo (10), depois da formação do preço
+    with_ga, without_ga = counters(tmp_path, vectorized, 10), counters(tmp_path, vectorized, 1000)
+    assert with_ga['ga_invocations'] == 40 and without_ga['ga_invocations'] == 0
+    for name in ('active_rules', 'fallback_rules', 'agent_steps'):
+        assert with_ga[name] == without_ga[name], name
+    assert with_ga['active_rules'] > 0